@@ -0,0 +1,97 @@
+"""
+Benchmark for cost_replay.replay_ledger.
+
+Builds a synthetic purchase/sales/adjustment ledger, checks the vectorized replay against a plain
+per-event loop (on a sample of products), then times the full replay.
+
+Run from backend/:
+    python -m benchmarks.bench_cost_replay [--products 10000] [--purchases 20] [--sales 200] [--adjustments 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cost_replay import ADJUSTMENT, PURCHASE, SALE, replay_ledger  # noqa: E402
+
+
+def make_ledger(n_products: int, purchases: int, sales: int, adjustments: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    n_purchase_events = n_products * purchases
+    n_sale_events = n_products * sales
+    n_adjustment_events = n_products * adjustments
+    n = n_purchase_events + n_sale_events + n_adjustment_events
+    product = np.r_[np.repeat(np.arange(n_products), purchases), np.repeat(np.arange(n_products), sales),
+                    np.repeat(np.arange(n_products), adjustments)]
+    # Few distinct days, so many events share one and their order comes from seq
+    day = rng.integers(738000, 738000 + 60, size=n)
+    kind = np.r_[np.full(n_purchase_events, PURCHASE), np.full(n_sale_events, SALE),
+                 np.full(n_adjustment_events, ADJUSTMENT)].astype(np.int8)
+    qty = np.r_[rng.integers(1, 50, size=n_purchase_events), rng.integers(1, 6, size=n_sale_events),
+                rng.integers(-20, 10, size=n_adjustment_events)].astype(np.float64)
+    unit_cost = np.r_[rng.uniform(20, 500, size=n_purchase_events), np.zeros(n_sale_events + n_adjustment_events)]
+    seq = rng.permutation(n)
+    return product, day, kind, qty, unit_cost, seq
+
+
+def replay_loop(product, day, kind, qty, unit_cost, seq, products):
+    # Reference: the weighted-average formula applied event by event
+    costs = {}
+    final = {}
+    by_product = np.argsort(product, kind="stable")
+    bounds = np.searchsorted(product[by_product], np.arange(product.max() + 2))
+    for p in products:
+        idx = by_product[bounds[p]:bounds[p + 1]]
+        idx = idx[np.lexsort((kind[idx] != PURCHASE, seq[idx], day[idx]))]
+        on_hand, avg = 0.0, 0.0
+        for i in idx:
+            if kind[i] == PURCHASE:
+                if on_hand + qty[i] > 0:
+                    avg = (on_hand * avg + qty[i] * unit_cost[i]) / (on_hand + qty[i])
+                on_hand += qty[i]
+            elif kind[i] == SALE:
+                on_hand -= qty[i]
+            else:
+                on_hand += qty[i]  # Signed adjustment
+            costs[i] = avg
+        final[p] = avg
+    return costs, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--purchases", type=int, default=20, help="purchase lines per product")
+    parser.add_argument("--sales", type=int, default=200, help="sales lines per product")
+    parser.add_argument("--adjustments", type=int, default=5, help="adjustments / stocktake corrections per product")
+    parser.add_argument("--check", type=int, default=200, help="products verified against the loop")
+    args = parser.parse_args()
+
+    ledger = make_ledger(args.products, args.purchases, args.sales, args.adjustments)
+    n_events = len(ledger[0])
+
+    start = time.perf_counter()
+    cost_at_event, final_avg = replay_ledger(*ledger, n_products=args.products)
+    vectorized = time.perf_counter() - start
+
+    sample = range(min(args.check, args.products))
+    start = time.perf_counter()
+    expected_costs, expected_final = replay_loop(*ledger, products=sample)
+    loop = time.perf_counter() - start
+
+    mismatches = sum(1 for i, cost in expected_costs.items() if abs(cost_at_event[i] - cost) > 1e-6)
+    mismatches += sum(1 for p, avg in expected_final.items() if abs(final_avg[p] - avg) > 1e-6)
+    print(f"ledger: {args.products:,} products, {n_events:,} events")
+    print(f"check: {len(sample)} products, {mismatches} mismatches")
+    print(f"vectorized replay: {vectorized:.2f}s ({n_events / vectorized:,.0f} events/sec)")
+    print(f"per-event loop:    {loop / len(expected_costs) * n_events:.1f}s estimated for the full ledger")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Benchmark for the key formats (models.DB_ID_FORMAT).
+
+Builds the same synthetic catalog and order history once per format and reports the database
+size, the bulk insert time, and the latency of order listing (keyset pages with items and
+products), the dashboard top-products join and order lookups by id. The "migrated" row builds
+with string keys and converts the file with migrate_ids.py, i.e. an existing database after
+the migration.
+
+The format is fixed when models is imported, so each step runs in a child process.
+Uses throwaway SQLite files. Run from backend/:
+    python -m benchmarks.bench_id_format [--products 5000] [--orders 50000] [--items 3]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+INSERT_CHUNK_SIZE = 5000
+
+
+async def build(n_products: int, n_orders: int, items_per_order: int) -> dict:
+    from sqlalchemy import insert
+
+    import database
+    import models
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    rng = random.Random(42)
+    start = time.perf_counter()
+    async with database.SessionLocal() as db:
+        product_ids = [models.generate_uuid() for _ in range(n_products)]
+        await db.execute(insert(models.Product), [
+            {"id": product_id, "sku": f"SKU{i:06d}", "name": f"product {i}", "current_qty": 100, "avg_cost_twd": rng.uniform(10, 500)}
+            for i, product_id in enumerate(product_ids)
+        ])
+        first_day = datetime.date(2025, 1, 1)
+        for chunk_start in range(0, n_orders, INSERT_CHUNK_SIZE):
+            orders, items = [], []
+            for i in range(chunk_start, min(chunk_start + INSERT_CHUNK_SIZE, n_orders)):
+                order_id = models.generate_uuid()
+                orders.append({"id": order_id, "order_no": f"ORD{i:08d}", "order_date": first_day + datetime.timedelta(days=i * 365 // n_orders)})
+                for _ in range(items_per_order):
+                    items.append({"id": models.generate_uuid(), "order_id": order_id, "product_id": rng.choice(product_ids),
+                                  "qty": rng.randint(1, 3), "unit_price_sold": rng.randint(100, 900), "historical_cost_basis": 50.0})
+            await db.execute(insert(models.SalesOrder), orders)
+            await db.execute(insert(models.SalesItem), items)
+        await db.commit()
+    seconds = time.perf_counter() - start
+    await database.engine.dispose()
+    return {"insert_s": seconds}
+
+
+async def measure() -> dict:
+    from sqlalchemy import select
+
+    import crud
+    import database
+    import models
+
+    async with database.engine.connect() as conn:
+        await conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = os.path.getsize(database.DATABASE_URL.split("///", 1)[1])
+
+    async def timed(job, repeat):
+        samples = []
+        for _ in range(repeat):
+            async with database.SessionLocal() as db:
+                start = time.perf_counter()
+                await job(db)
+                samples.append(time.perf_counter() - start)
+        return round(statistics.median(samples) * 1000, 2)
+
+    async def list_pages(db):
+        cursor = None
+        for _ in range(10):
+            _, cursor = await crud.get_sales_orders(db, limit=100, cursor=cursor)
+
+    async def top_products(db):
+        await crud.get_top_products(db, datetime.date(2025, 1, 1), datetime.date(2025, 12, 31), limit=10)
+
+    async with database.SessionLocal() as db:
+        order_ids = (await db.execute(select(models.SalesOrder.id))).scalars().all()
+    sample = random.Random(7).sample(order_ids, min(500, len(order_ids)))
+
+    async def lookups(db):
+        for order_id in sample:
+            await crud.get_sales_order(db, order_id)
+
+    result = {
+        "size_mb": round(size / 1024 / 1024, 1),
+        "list_10_pages_ms": await timed(list_pages, 5),
+        "top_products_ms": await timed(top_products, 5),
+        "lookup_500_ms": await timed(lookups, 3),
+    }
+    await database.engine.dispose()
+    return result
+
+
+def child(step: str, args) -> dict:
+    if step == "build":
+        return asyncio.run(build(args.products, args.orders, args.items))
+    return asyncio.run(measure())
+
+
+def run_step(step: str, id_format: str, url: str, args) -> dict:
+    env = {**os.environ, "DB_ID_FORMAT": id_format, "DATABASE_URL": url}
+    if step == "migrate":
+        subprocess.run([sys.executable, "migrate_ids.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+        return {}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_id_format", "--child", step,
+         "--products", str(args.products), "--orders", str(args.orders), "--items", str(args.items)],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=50_000)
+    parser.add_argument("--items", type=int, default=3)
+    parser.add_argument("--child", choices=["build", "measure"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child, args)))
+        return
+
+    print(f"{args.products:,} products, {args.orders:,} orders x {args.items} items")
+    runs = [("string", ["string"]), ("uuid7", ["uuid7"]), ("binary", ["binary"]), ("migrated", ["string", "binary"])]
+    for label, formats in runs:
+        url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "ids.db")
+        row = run_step("build", formats[0], url, args)
+        if len(formats) > 1:
+            run_step("migrate", formats[1], url, args)
+        row.update(run_step("measure", formats[-1], url, args))
+        print(f"{label:>9}: " + ", ".join(f"{key} {value}" for key, value in row.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark for product_name_parser.
+
+Checks every corpus entry against its expected output, then reports parser throughput
+(names/sec) for a cold cache (every name unique) and a warm cache (export-like repeats).
+
+Run from backend/:
+    python -m benchmarks.bench_product_name_parser [--names 200000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import product_name_parser
+from product_name_parser import parse_product_name
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "product_name_corpus.json")
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_corpus(corpus) -> int:
+    failures = 0
+    for entry in corpus:
+        got = [list(item) for item in parse_product_name(entry["raw"])]
+        if got != entry["expected"]:
+            failures += 1
+            print(f"MISMATCH {entry['raw']!r}: expected {entry['expected']}, got {got}")
+    return failures
+
+
+def run(names) -> float:
+    start = time.perf_counter()
+    for name in names:
+        parse_product_name(name)
+    return len(names) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=200_000, help="names parsed per measurement")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = check_corpus(corpus)
+    print(f"corpus: {len(corpus)} names, {failures} mismatches")
+    if failures:
+        sys.exit(1)
+
+    raws = [entry["raw"] for entry in corpus if entry["raw"]]
+
+    # Cold: a numeric prefix makes every name a cache miss
+    cold_names = [f"{i} {raws[i % len(raws)]}" for i in range(args.names)]
+    product_name_parser._parse_cached.cache_clear()
+    cold = run(cold_names)
+
+    # Warm: the same few bundle names repeated, as in a real monthly export
+    warm_names = [raws[i % len(raws)] for i in range(args.names)]
+    product_name_parser._parse_cached.cache_clear()
+    warm = run(warm_names)
+
+    print(f"cold cache: {cold:,.0f} names/sec")
+    print(f"warm cache: {warm:,.0f} names/sec")
+    print(f"cache: {product_name_parser._parse_cached.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
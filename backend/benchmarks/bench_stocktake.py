@@ -0,0 +1,83 @@
+"""
+Benchmark for stocktake.apply_stocktake.
+
+Creates a catalog of products with random stock, then reconciles a stocktake covering
+all of them (half counted by SKU, half by product id, most with a discrepancy) and checks
+that every product ends at its counted quantity.
+
+Runs against a throwaway SQLite file (or DATABASE_URL if set). Run from backend/:
+    python -m benchmarks.bench_stocktake [--products 10000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "stocktake.db")
+
+from sqlalchemy import insert, select  # noqa: E402
+
+import database  # noqa: E402
+import models  # noqa: E402
+import stocktake  # noqa: E402
+
+database.engine.echo = False
+
+
+async def run(n_products: int) -> bool:
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    rng = random.Random(42)
+    rows = [
+        {"id": models.generate_uuid(), "sku": f"SKU{i:06d}", "name": f"product {i}",
+         "current_qty": rng.randint(0, 200), "avg_cost_twd": rng.uniform(10, 500)}
+        for i in range(n_products)
+    ]
+    async with database.SessionLocal() as db:
+        await db.execute(insert(models.Product), rows)
+        await db.commit()
+
+    lines, expected = [], {}
+    for i, row in enumerate(rows):
+        counted = row["current_qty"] + rng.choice([-3, -1, 0, 1, 2])
+        counted = max(counted, 0)
+        expected[row["id"]] = counted
+        key = {"product_id": row["id"], "sku": None} if i % 2 else {"product_id": None, "sku": row["sku"]}
+        lines.append({**key, "counted_qty": counted})
+
+    async with database.SessionLocal() as db:
+        start = time.perf_counter()
+        report = await stocktake.apply_stocktake(db, lines, reason="benchmark")
+        await db.commit()
+        seconds = time.perf_counter() - start
+
+    async with database.SessionLocal() as db:
+        actual = dict((await db.execute(select(models.Product.id, models.Product.current_qty))).all())
+    mismatches = sum(1 for product_id, qty in expected.items() if actual[product_id] != qty)
+
+    print(f"{database.DATABASE_URL}")
+    print(f"stocktake: {report['counted_products']:,} products counted, {report['adjusted_products']:,} adjusted "
+          f"in {seconds:.3f}s (incl. commit)")
+    print(f"check: {mismatches} products not at their counted quantity")
+    await database.engine.dispose()
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=10_000)
+    args = parser.parse_args()
+
+    if not asyncio.run(run(args.products)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Stress test for concurrent stock writes.
+
+Fires concurrent inventory adjustments, purchase receipts and sales deductions at one
+product, each in its own session/transaction, then checks the final quantity and
+weighted average cost against the expected totals. With --naive the adjustments use
+the old read-modify-write instead, to show the lost updates this guards against.
+
+Runs against a throwaway SQLite file (or DATABASE_URL if set). Run from backend/:
+    python -m benchmarks.stress_stock_updates [--workers 50] [--rounds 20] [--naive]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "stress.db")
+
+from sqlalchemy import select  # noqa: E402
+
+import database  # noqa: E402
+import models  # noqa: E402
+import stock  # noqa: E402
+
+database.engine.echo = False
+
+INITIAL_QTY = 1000
+INITIAL_COST = 100.0
+
+
+async def naive_adjust(product_id: str, change_qty: int):
+    # The pre-stock.py pattern: read current_qty into Python, write the sum back
+    async with database.SessionLocal() as db:
+        product = (await db.execute(select(models.Product).filter(models.Product.id == product_id))).scalars().first()
+        await asyncio.sleep(0)  # Let other requests run between the read and the write, as real I/O would
+        product.current_qty += change_qty
+        await db.commit()
+
+
+async def adjust(product_id: str, change_qty: int):
+    async with database.SessionLocal() as db:
+        await stock.adjust_stock(db, product_id, change_qty)
+        await db.commit()
+
+
+async def receive(product_id: str, qty: int, unit_cost: float):
+    async with database.SessionLocal() as db:
+        await stock.receive_stock(db, [(product_id, qty, unit_cost, 0)])
+        await db.commit()
+
+
+async def sell(product_id: str, qty: int):
+    async with database.SessionLocal() as db:
+        await stock.add_stock(db, [stock.movement(product_id, -qty, "sale")])
+        await db.commit()
+
+
+async def run(workers: int, rounds: int, naive: bool):
+    async with database.engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+
+    async with database.SessionLocal() as db:
+        product_id = models.generate_uuid()
+        db.add(models.Product(id=product_id, name="stress-test", current_qty=INITIAL_QTY, avg_cost_twd=INITIAL_COST))
+        await db.commit()
+
+    rng = random.Random(42)
+    adjust_fn = naive_adjust if naive else adjust
+    expected_qty = INITIAL_QTY
+    tasks = []
+
+    # Phase 1: adjustments and sales only; the quantity is order-independent
+    for _ in range(workers * rounds):
+        change = rng.randint(-5, 5)
+        if rng.random() < 0.3:
+            tasks.append(sell(product_id, abs(change)))
+            expected_qty -= abs(change)
+        else:
+            tasks.append(adjust_fn(product_id, change))
+            expected_qty += change
+
+    start = time.perf_counter()
+    for i in range(0, len(tasks), workers):
+        await asyncio.gather(*tasks[i:i + workers])
+    adjust_seconds = time.perf_counter() - start
+
+    # Phase 2: receipts only; the final average is total value / total qty whatever the order
+    async with database.SessionLocal() as db:
+        product = (await db.execute(select(models.Product).filter(models.Product.id == product_id))).scalars().first()
+        qty_after_adjust, avg_after_adjust = product.current_qty, product.avg_cost_twd
+    expected_value = qty_after_adjust * avg_after_adjust
+    expected_receipt_qty = qty_after_adjust
+    receipts = []
+    for _ in range(workers):
+        qty, cost = rng.randint(1, 20), rng.uniform(50, 150)
+        receipts.append(receive(product_id, qty, cost))
+        expected_value += qty * cost
+        expected_receipt_qty += qty
+    start = time.perf_counter()
+    await asyncio.gather(*receipts)
+    receive_seconds = time.perf_counter() - start
+
+    async with database.SessionLocal() as db:
+        product = (await db.execute(select(models.Product).filter(models.Product.id == product_id))).scalars().first()
+        final_qty, final_avg = product.current_qty, product.avg_cost_twd
+
+    print(f"mode: {'naive read-modify-write' if naive else 'atomic (stock.py)'}, {database.DATABASE_URL}")
+    print(f"phase 1: {workers * rounds} adjustments/sales in {adjust_seconds:.2f}s, "
+          f"qty {qty_after_adjust} (expected {expected_qty})")
+    print(f"phase 2: {workers} receipts in {receive_seconds:.2f}s, "
+          f"qty {final_qty} (expected {expected_receipt_qty}), "
+          f"avg cost {final_avg:.4f} (expected {expected_value / expected_receipt_qty:.4f})")
+
+    ok = (
+        qty_after_adjust == expected_qty
+        and final_qty == expected_receipt_qty
+        and abs(final_avg - expected_value / expected_receipt_qty) < 1e-6
+    )
+    print("OK" if ok else "LOST UPDATES")
+    await database.engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=50, help="concurrent writers per wave")
+    parser.add_argument("--rounds", type=int, default=20, help="waves of adjustments")
+    parser.add_argument("--naive", action="store_true", help="use the old read-modify-write for adjustments")
+    args = parser.parse_args()
+
+    if not asyncio.run(run(args.workers, args.rounds, args.naive)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
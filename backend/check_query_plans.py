@@ -0,0 +1,162 @@
+"""
+Fails (exit 1) if a hot query plans a full table scan, e.g. after an index was dropped or a query
+changed shape so that it no longer matches one.
+
+Runs the crud functions behind the list, detail, dashboard, report and ledger endpoints against a small
+sample dataset, captures the SQL they send (including selectinload's follow-up queries) and EXPLAINs
+each statement:
+- SQLite: EXPLAIN QUERY PLAN; a "SCAN <table>" step without an index is a full scan
+- Postgres: EXPLAIN with enable_seqscan off, so a remaining Seq Scan means no index could serve it
+
+Uses a throwaway SQLite file migrated to the latest version (or DATABASE_URL if set; sample rows
+are written, so point it at a scratch database). Run from backend/:
+    python check_query_plans.py [-v]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import re
+import sys
+import tempfile
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "plans.db")
+
+from sqlalchemy import event  # noqa: E402
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import inventory_ledger  # noqa: E402
+import migrations  # noqa: E402
+import sales_rollup  # noqa: E402
+import schemas  # noqa: E402
+
+TODAY = datetime.date.today()
+MONTH_AGO = TODAY - datetime.timedelta(days=30)
+
+# (name, query, tables it may scan in full). Listing a whole table (products, purchase batches) scans
+# it by design; everything looked up by key, date or foreign key must use an index.
+SCENARIOS = [
+    ("products list", lambda db, ids: crud.get_products(db), {"products"}),
+    ("product detail", lambda db, ids: crud.get_product(db, ids["product"]), set()),
+    ("low stock", lambda db, ids: crud.get_low_stock_products(db), set()),
+    ("purchase batches", lambda db, ids: crud.get_purchase_batches(db), {"purchase_batches"}),
+    ("purchase batch", lambda db, ids: crud.get_purchase_batch(db, ids["batch"]), set()),
+    ("sales orders", lambda db, ids: crud.get_sales_orders(db, limit=20), set()),
+    ("sales orders, next page", lambda db, ids: crud.get_sales_orders(db, limit=20, cursor=ids["cursor"]), set()),
+    ("sales orders, date range", lambda db, ids: crud.get_sales_orders(
+        db, limit=20, filters=schemas.SalesOrderFilter(date_from=MONTH_AGO, date_to=TODAY)), set()),
+    ("sales orders, by product", lambda db, ids: crud.get_sales_orders(
+        db, limit=20, filters=schemas.SalesOrderFilter(product_id=ids["product"])), set()),
+    ("sales order count, date range", lambda db, ids: crud.count_sales_orders(
+        db, schemas.SalesOrderFilter(date_from=MONTH_AGO, date_to=TODAY)), set()),
+    ("sales order", lambda db, ids: crud.get_sales_order(db, ids["order"]), set()),
+    ("dashboard totals", lambda db, ids: crud.get_sales_totals(db, MONTH_AGO, TODAY), set()),
+    ("dashboard daily revenue", lambda db, ids: crud.get_daily_revenue(db, MONTH_AGO, TODAY), set()),
+    ("dashboard top products", lambda db, ids: crud.get_top_products(db, MONTH_AGO, TODAY), set()),
+    ("dashboard recent orders", lambda db, ids: crud.get_recent_orders(db), set()),
+    ("dashboard low stock count", lambda db, ids: crud.count_low_stock_products(db), set()),
+    ("profit report by month", lambda db, ids: sales_rollup.profit_report(db, MONTH_AGO, TODAY, "month"), set()),
+    ("profit report by product", lambda db, ids: sales_rollup.profit_report(db, MONTH_AGO, TODAY, "product"), set()),
+    ("stock as of", lambda db, ids: inventory_ledger.stock_as_of(db, MONTH_AGO, [ids["product"]]), set()),
+    ("stock as of, all products", lambda db, ids: inventory_ledger.stock_as_of(db, MONTH_AGO), set()),
+    ("movement history", lambda db, ids: inventory_ledger.movement_history(db, ids["product"]), set()),
+]
+
+SQLITE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+
+async def seed() -> dict:
+    """A product, a purchase batch and two orders, so the follow-up (selectinload) queries run too."""
+    async with database.SessionLocal() as db:
+        suffix = os.urandom(4).hex()
+        product = await crud.create_product(db, schemas.ProductCreate(sku=f"PLAN-{suffix}", name=f"plan check {suffix}", stock_quantity=5))
+        product_id = product.id
+        batch = await crud.create_purchase_batch(db, schemas.PurchaseBatchCreate(
+            purchase_date=TODAY, source="plan check", total_jpy=200, total_twd_card_bill=50, total_twd_foreign_fee=0, total_shipping_twd=0,
+            items=[schemas.PurchaseItemCreate(product_id=product_id, qty=2, unit_price_jpy=100, item_weight_g=10)],
+        ))
+        batch_id = batch.id
+        order_ids = []
+        for day in (MONTH_AGO, TODAY):
+            order = await crud.create_sales_order(db, schemas.OrderCreate(
+                platform_order_id=f"PLAN-{suffix}-{day}", order_date=day,
+                items=[schemas.OrderItemCreate(product_name=f"plan check {suffix}", quantity=1, unit_price=10, total_price=10)],
+            ))
+            order_ids.append(order.id)
+        _, cursor = await crud.get_sales_orders(db, limit=1)
+        return {"product": product_id, "batch": batch_id, "order": order_ids[0], "cursor": cursor}
+
+
+def full_scans(conn, statement: str, parameters) -> list:
+    if conn.dialect.name == "sqlite":
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+        # Scans of materialized subqueries (anon_1, ...) are not table scans
+        return [match.group(1) for row in plan
+                if (match := SQLITE_SCAN.match(row[-1])) and match.group(1) in database.Base.metadata.tables]
+
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    scans, nodes = [], [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+async def check(verbose: bool = False) -> bool:
+    await migrations.upgrade()
+    ids = await seed()
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    sync_engine = database.engine.sync_engine
+    ok = True
+    for name, query, allowed in SCENARIOS:
+        captured.clear()
+        event.listen(sync_engine, "before_cursor_execute", capture)
+        try:
+            async with database.SessionLocal() as db:
+                await query(db, ids)
+        finally:
+            event.remove(sync_engine, "before_cursor_execute", capture)
+
+        problems = []
+        async with database.engine.begin() as conn:
+            for statement, parameters in captured:
+                scans = await conn.run_sync(full_scans, statement, parameters)
+                bad = sorted(set(scans) - allowed)
+                if bad:
+                    problems.append((bad, statement))
+                elif verbose:
+                    print(f"  {' '.join(statement.split())[:160]}")
+
+        print(f"{'FAIL' if problems else 'ok':>4}  {name} ({len(captured)} queries)")
+        for tables, statement in problems:
+            print(f"      full scan of {', '.join(tables)}: {' '.join(statement.split())}")
+        ok = ok and not problems
+
+    await database.engine.dispose()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true", help="also print the statements that passed")
+    args = parser.parse_args()
+
+    if not asyncio.run(check(args.verbose)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
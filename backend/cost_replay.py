@@ -0,0 +1,266 @@
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sales_rollup
+import stock
+from database import chunked
+from models import InventoryMovement, Product, PurchaseBatch, PurchaseItem, SalesItem, SalesOrder
+
+# Rebuilds Product.avg_cost_twd and SalesItem.historical_cost_basis from the purchase/sales ledger.
+#
+# Replay rules (same formula as stock.receive_stock):
+# - Each product starts at qty 0 / avg cost 0; only products with purchase history are replayed.
+# - Events are ordered by date, then by inventory_movements.id: the order the changes were
+#   actually booked in. Rows from before the ledger have no movement; they come first on their
+#   day, purchases before sales.
+# - A purchase, or the opening stock a product was created with: if Old Qty + New Qty > 0,
+#   New Avg = ((Old Qty * Old Avg) + (New Qty * New Unit Cost)) / (Old Qty + New Qty)
+# - A sale removes qty and snapshots the average in effect as its cost basis.
+# - Adjustments, stocktake corrections and negative opening stock change the qty only.
+# A product whose replayed qty differs from current_qty has history the ledger does not
+# explain (e.g. deleted orders), so its costs are reported and left as they are.
+
+PURCHASE, SALE, ADJUSTMENT = 0, 1, 2
+UNDATED = date.max.toordinal()  # Orders without a date sort last
+COST_TOLERANCE = 1e-6
+MAX_REPORTED_MISMATCHES = 20
+
+# inventory_movements kinds that stand for a purchase_items / sales_items row (by reference_id),
+# and the ones replayed from the ledger itself. order_edit is already in sales_items.qty.
+LINE_KINDS = ("purchase", "sale", "import")
+OPENING_KINDS = ("opening",)
+ADJUSTMENT_KINDS = ("adjustment", "stocktake")
+
+
+def replay_ledger(product: np.ndarray, day: np.ndarray, kind: np.ndarray, qty: np.ndarray,
+                  unit_cost: np.ndarray, seq: np.ndarray, n_products: int):
+    """
+    Replays every product's ledger at once.
+
+    Inputs are parallel arrays, one entry per event: product code (0..n_products-1), day ordinal,
+    kind (PURCHASE/SALE/ADJUSTMENT), qty (positive; signed for adjustments), unit cost (purchases)
+    and a sequence. Same-day events follow the sequence; on equal sequence purchases go first.
+    Returns (cost_at_event, final_avg): the average cost in effect after each event (input order)
+    and the final average per product code.
+
+    Events are sorted once; running quantities come from one grouped cumsum. Only the average
+    itself is a recurrence, so it advances one purchase "rank" at a time for all products
+    together: the loop runs max(purchases per product) times, each step a vector op.
+    """
+    n = len(product)
+    final_avg = np.zeros(n_products)
+    cost_at_event = np.zeros(n)
+    if n == 0:
+        return cost_at_event, final_avg
+
+    order = np.lexsort((kind != PURCHASE, seq, day, product))
+    p = product[order]
+    is_purchase = kind[order] == PURCHASE
+    signed = np.where(kind[order] == SALE, -qty[order], qty[order]).astype(np.float64)
+    cost = unit_cost[order].astype(np.float64)
+
+    # Running qty on hand per product, just before each event
+    group_start = np.r_[True, p[1:] != p[:-1]]
+    start_index = np.maximum.accumulate(np.where(group_start, np.arange(n), 0))
+    running = np.cumsum(signed)
+    qty_after = running - (running[start_index] - signed[start_index])
+    qty_before = qty_after - signed
+
+    # k-th purchase of each product, for k = 0, 1, ...
+    purchases_so_far = np.cumsum(is_purchase)
+    purchases_before_group = purchases_so_far[start_index] - is_purchase[start_index]
+    purchase_index = np.flatnonzero(is_purchase)
+    rank = purchases_so_far[purchase_index] - purchases_before_group[purchase_index] - 1
+    rank_order = np.argsort(rank, kind="stable")
+    by_rank = purchase_index[rank_order]
+    bounds = np.searchsorted(rank[rank_order], np.arange(rank.max() + 2)) if len(rank) else [0]
+
+    avg = np.zeros(n_products)
+    avg_after = np.zeros(n)
+    for k in range(len(bounds) - 1):
+        idx = by_rank[bounds[k]:bounds[k + 1]]
+        products_k = p[idx]
+        old_qty, new_qty = qty_before[idx], signed[idx]
+        total = old_qty + new_qty
+        old_avg = avg[products_k]
+        new_avg = np.where(
+            total > 0,
+            (old_qty * old_avg + new_qty * cost[idx]) / np.where(total > 0, total, 1),
+            old_avg,
+        )
+        avg[products_k] = new_avg
+        avg_after[idx] = new_avg
+
+    # Average in effect at each event = the one set by the latest purchase of the same product so far
+    last_purchase = np.maximum.accumulate(np.where(is_purchase, np.arange(n), -1))
+    has_purchase = last_purchase >= start_index
+    cost_sorted = np.where(has_purchase, avg_after[np.maximum(last_purchase, 0)], 0.0)
+
+    cost_at_event[order] = cost_sorted
+    return cost_at_event, avg
+
+
+async def _load_movements(db: AsyncSession, product_ids: List[str]) -> List:
+    m = InventoryMovement
+    movements = []
+    for chunk in chunked(product_ids):
+        result = await db.execute(
+            select(m.id, m.product_id, m.kind, m.movement_date, m.qty_change, m.unit_cost_twd, m.reference_id)
+            .where(m.product_id.in_(chunk), m.kind.in_(LINE_KINDS + OPENING_KINDS + ADJUSTMENT_KINDS))
+        )
+        movements += result.all()
+    return movements
+
+
+def _line_sequence(lines: List, reference: str, sign: int, line_movements: Dict) -> np.ndarray:
+    """
+    Sequence per purchase/sales line: the id of the ledger row booked for it. Several lines of one
+    product in one batch/order are told apart by qty (an edited sales line falls back to the first
+    row); lines from before the ledger have none and get 0.
+    """
+    seq = np.zeros(len(lines), dtype=np.int64)
+    used = set()
+    for i, row in enumerate(lines):
+        candidates = line_movements.get((getattr(row, reference), row.product_id))
+        if not candidates:
+            continue
+        match = next((m for m in candidates if m.id not in used and m.qty_change == sign * (row.qty or 0)), candidates[0])
+        used.add(match.id)
+        seq[i] = match.id
+    return seq
+
+
+async def replay_costs(db: AsyncSession, product_ids: Optional[Iterable[str]] = None, dry_run: bool = False) -> Dict:
+    """
+    Recomputes average costs and sales cost snapshots from the ledger and writes back only
+    the rows that changed (not committed; the caller commits). Limited to `product_ids` if given.
+    """
+    started = time.perf_counter()
+    product_ids = set(product_ids) if product_ids is not None else None
+
+    purchase_stmt = (
+        select(PurchaseItem.product_id, PurchaseBatch.purchase_date, PurchaseItem.qty, PurchaseItem.final_cost_twd,
+               PurchaseItem.batch_id)
+        .join(PurchaseBatch, PurchaseItem.batch_id == PurchaseBatch.id)
+        .where(PurchaseItem.product_id.is_not(None))
+    )
+    if product_ids is not None:
+        purchase_stmt = purchase_stmt.where(PurchaseItem.product_id.in_(product_ids))
+    purchases = (await db.execute(purchase_stmt)).all()
+
+    # Replayed products: the ones with purchase history
+    codes = {}
+    for row in purchases:
+        codes.setdefault(row.product_id, len(codes))
+
+    sales = []
+    movements = []
+    if codes:
+        sales_stmt = (
+            select(SalesItem.product_id, SalesOrder.order_date, SalesItem.qty, SalesItem.historical_cost_basis, SalesItem.id,
+                   SalesItem.order_id, SalesOrder.platform_source)
+            .join(SalesOrder, SalesItem.order_id == SalesOrder.id)
+            .where(SalesItem.product_id.is_not(None))
+        )
+        if product_ids is not None:
+            sales_stmt = sales_stmt.where(SalesItem.product_id.in_(product_ids))
+        sales = [row for row in (await db.execute(sales_stmt)).all() if row.product_id in codes]
+        movements = await _load_movements(db, list(codes))
+
+    line_movements = defaultdict(list)
+    for row in sorted(movements, key=lambda row: row.id):
+        if row.kind in LINE_KINDS:
+            line_movements[(row.reference_id, row.product_id)].append(row)
+    ledger_events = [row for row in movements if row.kind in OPENING_KINDS + ADJUSTMENT_KINDS]
+
+    n_purchases, n_sales = len(purchases), len(sales)
+    count = n_purchases + n_sales + len(ledger_events)
+    product = np.fromiter(
+        (codes[row.product_id] for rows in (purchases, sales, ledger_events) for row in rows), dtype=np.int64, count=count
+    )
+    day = np.fromiter(
+        (UNDATED if row[1] is None else row[1].toordinal() for rows in (purchases, sales) for row in rows), dtype=np.int64,
+        count=n_purchases + n_sales,
+    )
+    day = np.r_[day, np.fromiter((row.movement_date.toordinal() for row in ledger_events), dtype=np.int64, count=len(ledger_events))]
+    kind = np.r_[
+        np.full(n_purchases, PURCHASE), np.full(n_sales, SALE),
+        # A negative opening (backfilled for stock that predates the ledger) has no cost to average in
+        [PURCHASE if row.kind in OPENING_KINDS and row.qty_change > 0 else ADJUSTMENT for row in ledger_events],
+    ].astype(np.int8)
+    qty = np.r_[
+        np.fromiter((row.qty or 0 for rows in (purchases, sales) for row in rows), dtype=np.float64, count=n_purchases + n_sales),
+        np.fromiter((row.qty_change for row in ledger_events), dtype=np.float64, count=len(ledger_events)),
+    ]
+    unit_cost = np.r_[
+        np.fromiter((row.final_cost_twd or 0.0 for row in purchases), dtype=np.float64, count=n_purchases),
+        np.zeros(n_sales),
+        np.fromiter((row.unit_cost_twd or 0.0 for row in ledger_events), dtype=np.float64, count=len(ledger_events)),
+    ]
+    seq = np.r_[
+        _line_sequence(purchases, "batch_id", 1, line_movements),
+        _line_sequence(sales, "order_id", -1, line_movements),
+        np.fromiter((row.id for row in ledger_events), dtype=np.int64, count=len(ledger_events)),
+    ]
+
+    cost_at_event, final_avg = replay_ledger(product, day, kind, qty, unit_cost, seq, len(codes))
+    replayed_qty = np.bincount(product, weights=np.where(kind == SALE, -qty, qty), minlength=len(codes))
+
+    current = {}
+    ids = list(codes)
+    for chunk in chunked(ids):
+        result = await db.execute(select(Product.id, Product.current_qty, Product.avg_cost_twd).where(Product.id.in_(chunk)))
+        current.update({row.id: row for row in result.all()})
+    mismatched = sorted(
+        product_id for product_id, code in codes.items()
+        if product_id in current and replayed_qty[code] != (current[product_id].current_qty or 0)
+    )
+    skipped = set(mismatched)
+
+    # Only rows whose value actually moves are written
+    sales_cost = cost_at_event[n_purchases:n_purchases + n_sales]
+    sales_updates = []
+    rollup_lines = []
+    for row, cost in zip(sales, sales_cost):
+        if row.product_id in skipped:
+            continue
+        if row.historical_cost_basis is None or abs(row.historical_cost_basis - cost) > COST_TOLERANCE:
+            sales_updates.append({"b_id": row.id, "b_cost": float(cost)})
+            cogs_change = (row.qty or 0) * (float(cost) - (row.historical_cost_basis or 0))
+            rollup_lines.append(sales_rollup.line(row.order_date, row.platform_source, row.product_id, cogs=cogs_change))
+
+    product_updates = [
+        {"b_id": product_id, "b_cost": float(final_avg[code])}
+        for product_id, code in codes.items()
+        if product_id in current and product_id not in skipped
+        and (current[product_id].avg_cost_twd is None or abs(current[product_id].avg_cost_twd - final_avg[code]) > COST_TOLERANCE)
+    ]
+
+    if not dry_run:
+        await stock.set_avg_costs(db, {row["b_id"]: row["b_cost"] for row in product_updates})
+        if sales_updates:
+            items = SalesItem.__table__
+            await db.execute(
+                update(items).where(items.c.id == bindparam("b_id")).values(historical_cost_basis=bindparam("b_cost")),
+                sales_updates,
+            )
+            await sales_rollup.apply(db, rollup_lines)
+
+    return {
+        "products_replayed": len(codes),
+        "purchase_events": n_purchases,
+        "sales_events": n_sales,
+        "ledger_events": len(ledger_events),
+        "qty_mismatches": len(mismatched),
+        "qty_mismatch_product_ids": mismatched[:MAX_REPORTED_MISMATCHES],
+        "updated_products": len(product_updates),
+        "updated_sales_items": len(sales_updates),
+        "dry_run": dry_run,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
@@ -1,11 +1,9 @@
 import asyncio
-from database import engine, Base
-import models
+import migrations
 
 async def init_db():
-    async with engine.begin() as conn:
-        # Create all tables
-        await conn.run_sync(Base.metadata.create_all)
+    # Creates a new database, or applies the pending migrations to an existing one
+    await migrations.upgrade()
     print("Database Initialized")
 
 if __name__ == "__main__":
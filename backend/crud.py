@@ -1,9 +1,19 @@
+from sqlalchemy import func, insert, or_, tuple_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, with_expression
+from typing import Dict, List, Optional
+from datetime import date
+import base64
 import models
 import schemas
 import uuid
+import import_cache
+import import_service
+import sales_rollup
+import stock
+import stock_events
+from database import chunked
 
 # --- Product CRUD ---
 async def get_product(db: AsyncSession, product_id: str):
@@ -20,9 +30,16 @@ async def create_product(db: AsyncSession, product: schemas.ProductCreate):
         name=product.name,
         weight_g=product.weight_g,
         current_qty=product.stock_quantity, # Initial stock
-        avg_cost_twd=product.cost_price     # Initial cost
+        avg_cost_twd=product.cost_price,    # Initial cost
+        reorder_threshold=product.reorder_threshold,
     )
     db.add(db_product)
+    await db.flush()
+    # Initial stock is the product's first ledger entry
+    await stock.record_movements(db, [
+        stock.movement(db_product.id, product.stock_quantity or 0, "opening", unit_cost_twd=product.cost_price)
+    ])
+    await stock.update_summary(db, products_added=1, value=(product.stock_quantity or 0) * (product.cost_price or 0.0))
     await db.commit()
     await db.refresh(db_product)
     return db_product
@@ -43,6 +60,17 @@ async def create_purchase_batch(db: AsyncSession, batch: schemas.PurchaseBatchCr
     if total_weight > 0:
         shipping_rate_per_g = batch.total_shipping_twd / total_weight
 
+    # Unknown products are refused before anything is written: their items and ledger rows
+    # would point at no product
+    product_ids = {item.product_id for item in batch.items}
+    found = set()
+    for chunk in chunked(product_ids):
+        result = await db.execute(select(models.Product.id).where(models.Product.id.in_(chunk)))
+        found.update(result.scalars().all())
+    missing = sorted(product_ids - found)
+    if missing:
+        raise ValueError(f"Product not found: {', '.join(missing)}")
+
     # 2. Create Batch Record
     db_batch = models.PurchaseBatch(
         purchase_date=batch.purchase_date,
@@ -58,7 +86,9 @@ async def create_purchase_batch(db: AsyncSession, batch: schemas.PurchaseBatchCr
     db.add(db_batch)
     await db.flush() # Get ID
 
-    # 3. Process Items & Update Inventory/Cost
+    # 3. Process Items
+    item_rows = []
+    receipts = []
     for item_data in batch.items:
         # Calculate Final Cost TWD for this item
         # Cost = (Unit Price JPY * ExRate) + (Weight * Shipping Rate)
@@ -66,42 +96,34 @@ async def create_purchase_batch(db: AsyncSession, batch: schemas.PurchaseBatchCr
         item_shipping_cost = item_data.item_weight_g * shipping_rate_per_g
         final_cost_twd = item_base_cost + item_shipping_cost
 
-        db_item = models.PurchaseItem(
-            batch_id=db_batch.id,
-            product_id=item_data.product_id,
-            qty=item_data.qty,
-            unit_price_jpy=item_data.unit_price_jpy,
-            item_weight_g=item_data.item_weight_g,
-            final_cost_twd=final_cost_twd
-        )
-        db.add(db_item)
+        item_rows.append({
+            "id": models.generate_uuid(),
+            "batch_id": db_batch.id,
+            "product_id": item_data.product_id,
+            "qty": item_data.qty,
+            "unit_price_jpy": item_data.unit_price_jpy,
+            "item_weight_g": item_data.item_weight_g,
+            "final_cost_twd": final_cost_twd,
+        })
+        receipts.append((item_data.product_id, item_data.qty, final_cost_twd, item_data.item_weight_g))
 
-        # 4. Update Product Inventory & Weighted Average Cost
-        product = await get_product(db, item_data.product_id)
-        if product:
-            old_qty = product.current_qty or 0
-            old_avg_cost = product.avg_cost_twd or 0.0
-            new_qty = item_data.qty
-            
-            # Weighted Average Formula
-            # New Avg = ((Old Qty * Old Avg) + (New Qty * New Unit Cost)) / (Old Qty + New Qty)
-            total_old_value = old_qty * old_avg_cost
-            total_new_value = new_qty * final_cost_twd
-            
-            if (old_qty + new_qty) > 0:
-                new_avg_cost = (total_old_value + total_new_value) / (old_qty + new_qty)
-                product.avg_cost_twd = new_avg_cost
-            
-            product.current_qty = old_qty + new_qty
-            # Update weight to latest if needed, or keep average? Let's update to latest known weight
-            if item_data.item_weight_g > 0:
-                product.weight_g = item_data.item_weight_g
-                
-            db.add(product)
+    # 4. Bulk insert the items, then update Product Inventory & Weighted Average Cost
+    # in one batched statement computed by the database (safe under concurrent writes)
+    if item_rows:
+        await db.execute(insert(models.PurchaseItem), item_rows)
+    await stock.receive_stock(db, receipts, movement_date=batch.purchase_date, reference_id=db_batch.id)
 
+    batch_id = db_batch.id
     await db.commit()
-    await db.refresh(db_batch)
-    return db_batch
+    return await get_purchase_batch(db, batch_id)
+
+async def get_purchase_batch(db: AsyncSession, batch_id: str):
+    result = await db.execute(
+        select(models.PurchaseBatch)
+        .options(selectinload(models.PurchaseBatch.items))
+        .filter(models.PurchaseBatch.id == batch_id)
+    )
+    return result.scalars().first()
 
 async def get_purchase_batches(db: AsyncSession, skip: int = 0, limit: int = 100):
     result = await db.execute(
@@ -126,6 +148,8 @@ async def create_sales_order(db: AsyncSession, order: schemas.OrderCreate):
     await db.flush()
 
     # 2. Process Items
+    movements = []
+    rollup_items = []
     for item_data in order.items:
         # Find Product by Name or SKU (Logic allows Fuzzy Match later, strict for now)
         # We assume the schema passed product_name, but we ideally need product_id.
@@ -151,38 +175,385 @@ async def create_sales_order(db: AsyncSession, order: schemas.OrderCreate):
             historical_cost_basis=historical_cost
         )
         db.add(db_item)
+        movements.append(stock.movement(product.id, -item_data.quantity, "sale", order.order_date, db_order.id))
+        rollup_items.append((product.id, item_data.quantity, item_data.unit_price, historical_cost))
 
-        # 3. Deduct Inventory
-        if product.current_qty is not None:
-            product.current_qty -= item_data.quantity
-        db.add(product)
+    # 3. Deduct Inventory (atomic decrement, not a read-modify-write of current_qty)
+    await stock.add_stock(db, movements)
+    await sales_rollup.apply(db, sales_rollup.order_lines(db_order.order_date, db_order.platform_source, rollup_items))
 
+    order_id = db_order.id
     await db.commit()
-    await db.refresh(db_order)
-    return db_order
+    return await get_sales_order(db, order_id)
 
-async def get_sales_orders(db: AsyncSession, skip: int = 0, limit: int = 100):
+async def get_sales_order(db: AsyncSession, order_id: str):
     result = await db.execute(
         select(models.SalesOrder)
         .options(
-            selectinload(models.SalesOrder.items).selectinload(models.SalesItem.product)
+            selectinload(models.SalesOrder.items).selectinload(models.SalesItem.product),
+            *with_order_totals(),
+        )
+        .filter(models.SalesOrder.id == order_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+async def create_sales_orders(db: AsyncSession, orders: List[schemas.OrderCreate], commit_every: Optional[int] = None):
+    """
+    Creates many orders with bulk statements. Returns one result per input order
+    ({"platform_order_id", "status": "created"|"failed", "order_id", "error"}), in input order.
+    Orders are committed together, or every `commit_every` orders; a failing order does not
+    stop the others.
+    """
+    results = [
+        {"platform_order_id": order.platform_order_id, "status": "failed", "order_id": None, "error": None}
+        for order in orders
+    ]
+
+    # 1. Resolve every product name and existing order number with chunked IN lookups
+    products = {}
+    names = {item.product_name for order in orders for item in order.items}
+    for chunk in chunked(names):
+        result = await db.execute(
+            select(models.Product.name, models.Product.id, models.Product.avg_cost_twd).where(models.Product.name.in_(chunk))
+        )
+        for row in result.all():
+            products.setdefault(row.name, row)  # First match wins, like the single-order lookup
+    existing = await import_service.fetch_existing_order_nos(db, (order.platform_order_id for order in orders))
+
+    # 2. Validate each order on its own
+    valid = []
+    seen = set()
+    for i, order in enumerate(orders):
+        missing = [item.product_name for item in order.items if item.product_name not in products]
+        if order.platform_order_id in existing or order.platform_order_id in seen:
+            results[i]["error"] = f"Order already exists: {order.platform_order_id}"
+        elif missing:
+            results[i]["error"] = f"Product not found: {missing[0]}"
+        else:
+            seen.add(order.platform_order_id)
+            valid.append(i)
+
+    # 3. Write and commit in chunks
+    chunk_size = commit_every if commit_every and commit_every > 0 else max(len(valid), 1)
+    for start in range(0, len(valid), chunk_size):
+        await _commit_sales_orders(db, orders, valid[start:start + chunk_size], products, results)
+    return results
+
+async def _commit_sales_orders(db: AsyncSession, orders, indices: List[int], products: Dict, results: List[Dict]):
+    # If the chunk fails, its orders are retried one by one so only the bad one is reported
+    order_rows, item_rows, movements, rollup_lines = [], [], [], []
+    for i in indices:
+        order = orders[i]
+        order_id = models.generate_uuid()
+        order_rows.append({
+            "id": order_id,
+            "order_no": order.platform_order_id,
+            "platform_source": "Myship", # Defaulting for now
+            "order_date": order.order_date,
+            "customer_name": order.customer_name,
+        })
+        rollup_items = []
+        for item in order.items:
+            product = products[item.product_name]
+            item_rows.append({
+                "id": models.generate_uuid(),
+                "order_id": order_id,
+                "product_id": product.id,
+                "qty": item.quantity,
+                "unit_price_sold": item.unit_price,
+                "historical_cost_basis": product.avg_cost_twd,
+            })
+            movements.append(stock.movement(product.id, -item.quantity, "sale", order.order_date, order_id))
+            rollup_items.append((product.id, item.quantity, item.unit_price, product.avg_cost_twd))
+        rollup_lines += sales_rollup.order_lines(order.order_date, "Myship", rollup_items)
+        results[i]["order_id"] = order_id
+
+    try:
+        await db.execute(insert(models.SalesOrder), order_rows)
+        if item_rows:
+            await db.execute(insert(models.SalesItem), item_rows)
+        await stock.add_stock(db, movements)
+        await sales_rollup.apply(db, rollup_lines)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        for i in indices:
+            results[i]["order_id"] = None
+        if len(indices) > 1:
+            for i in indices:
+                await _commit_sales_orders(db, orders, [i], products, results)
+            return
+        results[indices[0]]["error"] = str(getattr(e, "orig", None) or e)
+        return
+
+    for i in indices:
+        results[i]["status"] = "created"
+
+def _order_total(expression):
+    # Correlated aggregate over the order's items; evaluated only for the rows returned
+    item = models.SalesItem
+    return (
+        select(func.coalesce(expression, 0))
+        .where(item.order_id == models.SalesOrder.id)
+        .scalar_subquery()
+    )
+
+def with_order_totals():
+    """Loader options that fill SalesOrder.item_count/revenue/cost/margin in the same query."""
+    item = models.SalesItem
+    revenue = func.sum(item.qty * item.unit_price_sold)
+    cost = func.sum(item.qty * func.coalesce(item.historical_cost_basis, 0))
+    order = models.SalesOrder
+    return [
+        with_expression(order.item_count, _order_total(func.count(item.id))),
+        with_expression(order.revenue, _order_total(revenue)),
+        with_expression(order.cost, _order_total(cost)),
+        with_expression(order.margin, _order_total(revenue - cost)),
+    ]
+
+def sales_order_conditions(filters: Optional[schemas.SalesOrderFilter]) -> list:
+    if filters is None:
+        return []
+    order = models.SalesOrder
+    conditions = []
+    if filters.date_from:
+        conditions.append(order.order_date >= filters.date_from)
+    if filters.date_to:
+        conditions.append(order.order_date <= filters.date_to)
+    if filters.platform_source:
+        conditions.append(order.platform_source == filters.platform_source)
+    if filters.customer:
+        conditions.append(order.customer_name == filters.customer)
+    if filters.product_id:
+        # Probes ix_sales_items_product_order once per candidate order
+        conditions.append(
+            select(models.SalesItem.id)
+            .where(models.SalesItem.order_id == order.id, models.SalesItem.product_id == filters.product_id)
+            .exists()
+        )
+    if filters.q:
+        # Free-text search is not index-backed; it only narrows the rows the keyset walks
+        pattern = f"%{filters.q}%"
+        conditions.append(or_(order.order_no.ilike(pattern), order.customer_name.ilike(pattern)))
+    return conditions
+
+def encode_sales_cursor(order: models.SalesOrder) -> str:
+    raw = f"{order.order_date.isoformat() if order.order_date else ''}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_sales_cursor(cursor: str):
+    try:
+        day, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return (date.fromisoformat(day) if day else None), order_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+async def get_sales_orders(db: AsyncSession, skip: int = 0, limit: int = 100,
+                           filters: Optional[schemas.SalesOrderFilter] = None, cursor: Optional[str] = None,
+                           with_items: bool = True):
+    """
+    Lists orders newest first, ordered by (order_date, id) descending; orders without a date come last.
+    Returns (orders, next_cursor). Passing next_cursor back continues right after the last order,
+    with an index range scan instead of an OFFSET, so every page costs the same.
+    Totals are always included; with_items=False skips loading items and products (summary view).
+    """
+    order = models.SalesOrder
+    conditions = sales_order_conditions(filters)
+    after_date, after_id = decode_sales_cursor(cursor) if cursor else (None, None)
+
+    options = with_order_totals()
+    if with_items:
+        options.append(selectinload(order.items).selectinload(models.SalesItem.product))
+
+    def page(stmt, remaining):
+        return stmt.options(*options).where(*conditions).limit(remaining)
+
+    if skip and not cursor:
+        # Legacy OFFSET paging, same order; deep pages get slower, prefer the cursor
+        stmt = (
+            select(order)
+            .order_by(order.order_date.is_(None), order.order_date.desc(), order.id.desc())
+            .offset(skip)
+        )
+        orders = list((await db.execute(page(stmt, limit + 1))).scalars().all())
+    else:
+        orders = []
+        # 1. Dated orders: keyset on the (order_date, id) row value
+        if after_date is not None or not cursor:
+            stmt = select(order).where(order.order_date.is_not(None)).order_by(order.order_date.desc(), order.id.desc())
+            if cursor:
+                # Typed explicitly: a plain tuple_() would bind the id as text, whatever the key format
+                after = tuple_(after_date, after_id, types=[order.order_date.type, order.id.type])
+                stmt = stmt.where(tuple_(order.order_date, order.id) < after)
+            orders = list((await db.execute(page(stmt, limit + 1))).scalars().all())
+
+        # 2. Then orders without a date (never inside a date range), keyset on id
+        has_date_range = filters is not None and (filters.date_from or filters.date_to)
+        if len(orders) <= limit and not has_date_range:
+            stmt = select(order).where(order.order_date.is_(None)).order_by(order.id.desc())
+            if cursor and after_date is None:
+                stmt = stmt.where(order.id < after_id)
+            orders += (await db.execute(page(stmt, limit + 1 - len(orders)))).scalars().all()
+
+    next_cursor = encode_sales_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
+
+async def count_sales_orders(db: AsyncSession, filters: Optional[schemas.SalesOrderFilter] = None) -> int:
+    # Separate from the page query: a COUNT over the same index-backed conditions, no rows loaded
+    stmt = select(func.count()).select_from(models.SalesOrder).where(*sales_order_conditions(filters))
+    return (await db.execute(stmt)).scalar()
+
+# --- Dashboard aggregates ---
+# All GROUP BY queries over a date window: orders by ix_sales_orders_date_id, their items by
+# ix_sales_items_order_id. Results are a handful of rows whatever the history size.
+
+def _window_items(date_from: date, date_to: date):
+    order, item = models.SalesOrder, models.SalesItem
+    revenue = item.qty * item.unit_price_sold
+    cost = item.qty * func.coalesce(item.historical_cost_basis, 0)
+    join = (
+        select()
+        .select_from(order)
+        .join(item, item.order_id == order.id)
+        .where(order.order_date >= date_from, order.order_date <= date_to)
+    )
+    return join, revenue, cost
+
+async def get_sales_totals(db: AsyncSession, date_from: date, date_to: date) -> Dict:
+    order = models.SalesOrder
+    window, revenue, cost = _window_items(date_from, date_to)
+    row = (await db.execute(
+        window.add_columns(
+            func.coalesce(func.sum(revenue), 0).label("revenue"),
+            func.coalesce(func.sum(cost), 0).label("cogs"),
+            func.coalesce(func.sum(models.SalesItem.qty), 0).label("units"),
+        )
+    )).one()
+    # Orders without items still count as orders
+    order_count = (await db.execute(
+        select(func.count()).select_from(order).where(order.order_date >= date_from, order.order_date <= date_to)
+    )).scalar()
+    return {
+        "revenue": row.revenue,
+        "cogs": row.cogs,
+        "margin": row.revenue - row.cogs,
+        "order_count": order_count,
+        "units_sold": row.units,
+    }
+
+async def get_daily_revenue(db: AsyncSession, date_from: date, date_to: date) -> List[Dict]:
+    order = models.SalesOrder
+    window, revenue, cost = _window_items(date_from, date_to)
+    result = await db.execute(
+        window.add_columns(
+            order.order_date,
+            func.sum(revenue).label("revenue"),
+            func.sum(cost).label("cogs"),
+            func.count(func.distinct(order.id)).label("order_count"),
         )
+        .group_by(order.order_date)
+        .order_by(order.order_date)
+    )
+    return [
+        {"order_date": row.order_date, "revenue": row.revenue, "cogs": row.cogs, "order_count": row.order_count}
+        for row in result.all()
+    ]
+
+async def get_top_products(db: AsyncSession, date_from: date, date_to: date, limit: int = 5) -> List[Dict]:
+    item, product = models.SalesItem, models.Product
+    window, revenue, cost = _window_items(date_from, date_to)
+    top = (
+        window.add_columns(
+            item.product_id,
+            func.sum(item.qty).label("units"),
+            func.sum(revenue).label("revenue"),
+            func.sum(cost).label("cogs"),
+        )
+        .where(item.product_id.is_not(None))
+        .group_by(item.product_id)
+        .order_by(func.sum(revenue).desc())
+        .limit(limit)
+        .subquery()
+    )
+    # Names are looked up for the top rows only
+    result = await db.execute(
+        select(top, product.name)
+        .join(product, product.id == top.c.product_id)
+        .order_by(top.c.revenue.desc())
+    )
+    return [
+        {
+            "product_id": row.product_id,
+            "name": row.name,
+            "units_sold": row.units,
+            "revenue": row.revenue,
+            "margin": row.revenue - row.cogs,
+        }
+        for row in result.all()
+    ]
+
+def _below_threshold():
+    # Matches the ix_products_stock_below_threshold expression, so it is an index range scan
+    product = models.Product
+    return product.current_qty - product.reorder_threshold
+
+async def count_low_stock_products(db: AsyncSession) -> int:
+    stmt = select(func.count()).select_from(models.Product).where(_below_threshold() < 0)
+    return (await db.execute(stmt)).scalar()
+
+async def get_low_stock_products(db: AsyncSession, skip: int = 0, limit: int = 100):
+    # Furthest below threshold first
+    result = await db.execute(
+        select(models.Product)
+        .where(_below_threshold() < 0)
+        .order_by(_below_threshold(), models.Product.id)
         .offset(skip)
         .limit(limit)
     )
     return result.scalars().all()
 
+async def set_reorder_threshold(db: AsyncSession, product_id: str, threshold: int):
+    db_product = await get_product(db, product_id)
+    if db_product is None:
+        return None
+    # Moving the threshold past the current stock is a crossing too
+    qty = db_product.current_qty or 0
+    event = stock_events.crossing(db_product.id, db_product.name, qty, qty, threshold, old_threshold=db_product.reorder_threshold)
+    if event:
+        stock_events.queue(db, [event])
+    db_product.reorder_threshold = threshold
+    await db.commit()
+    await db.refresh(db_product)
+    return db_product
+
+async def get_recent_orders(db: AsyncSession, limit: int = 10):
+    order = models.SalesOrder
+    result = await db.execute(
+        select(order.id, order.order_no.label("platform_order_id"), order.customer_name, order.order_date)
+        .order_by(order.order_date.desc(), order.id.desc())
+        .limit(limit)
+    )
+    return [dict(row._mapping) for row in result.all()]
+
 async def delete_all_sales_orders(db: AsyncSession):
     # Depending on cascade rules, deleting orders might autoflush items.
     # explicit delete of items first is safer if cascade isn't set up perfectly.
     await db.execute(models.SalesItem.__table__.delete())
     await db.execute(models.SalesOrder.__table__.delete())
+    await sales_rollup.clear(db)
+    # Import checkpoints and cached order history describe the deleted orders
+    await db.execute(models.ImportCheckpoint.__table__.delete())
     await db.commit()
+    import_cache.clear()
 
 async def delete_all_products(db: AsyncSession):
     # This might fail if there are foreign keys from sales/purchases not cleared first.
     # So we should ideally clear those first or ensure cascade.
+    await db.execute(models.InventorySnapshot.__table__.delete())
+    await db.execute(models.InventoryMovement.__table__.delete())
     await db.execute(models.Product.__table__.delete())
+    await stock.reset_summary(db)
     await db.commit()
 
 async def delete_all_purchases(db: AsyncSession):
@@ -210,36 +581,48 @@ async def update_sales_order_items(db: AsyncSession, order_id: str, updates: sch
 
     # Map existing items by ID for easy access
     existing_items = {item.id: item for item in order.items}
+    movements = []
+    rollup_lines = []
 
     for update_item in updates.items:
         if update_item.id in existing_items:
             db_item = existing_items[update_item.id]
-            
+
             # Handle Quantity Change -> Inventory Impact
-            old_qty = db_item.qty
-            new_qty = update_item.quantity
-            
-            if old_qty != new_qty:
-                qty_diff = new_qty - old_qty
-                
-                # Fetch product to update inventory
-                product_stmt = select(models.Product).filter(models.Product.id == db_item.product_id)
-                prod_result = await db.execute(product_stmt)
-                product = prod_result.scalars().first()
-                
-                if product:
-                     # If we sold MORE, stock goes DOWN. 
-                     # diff = 5 - 3 = +2. current -= 2.
-                     product.current_qty -= qty_diff
-                     db.add(product)
-                
-                db_item.qty = new_qty
-            
-            # Handle Price Change
-            db_item.unit_price_sold = update_item.unit_price
-            
-            db.add(db_item)
-    
+            old_qty, old_price = await _set_sales_item(db, db_item, update_item.quantity, update_item.unit_price)
+            qty_diff = update_item.quantity - old_qty
+            rollup_lines += [
+                sales_rollup.item_line(order.order_date, order.platform_source, db_item.product_id,
+                                       update_item.quantity, update_item.unit_price, db_item.historical_cost_basis),
+                sales_rollup.item_line(order.order_date, order.platform_source, db_item.product_id,
+                                       -old_qty, old_price, db_item.historical_cost_basis),
+            ]
+
+            # If we sold MORE, stock goes DOWN.
+            # diff = 5 - 3 = +2. current -= 2.
+            if qty_diff and db_item.product_id:
+                movements.append(stock.movement(db_item.product_id, -qty_diff, "order_edit", order.order_date, order.id))
+
+    await stock.add_stock(db, movements)
+    await sales_rollup.apply(db, rollup_lines)
     await db.commit()
-    await db.refresh(order)
-    return order
+    return await get_sales_order(db, order_id)
+
+async def _set_sales_item(db: AsyncSession, db_item: models.SalesItem, new_qty: int, unit_price, attempts: int = 3):
+    """
+    Writes qty/price only if the row still has the qty and price we last saw (optimistic check)
+    and returns them. If a concurrent edit changed them first, re-reads and retries, so the stock
+    and rollup diffs are taken against the values actually replaced.
+    """
+    items = models.SalesItem.__table__
+    old_qty, old_price = db_item.qty, db_item.unit_price_sold
+    for _ in range(attempts):
+        result = await db.execute(
+            update(items)
+            .where(items.c.id == db_item.id, items.c.qty == old_qty, items.c.unit_price_sold == old_price)
+            .values(qty=new_qty, unit_price_sold=unit_price)
+        )
+        if result.rowcount:
+            return old_qty, old_price
+        old_qty, old_price = (await db.execute(select(items.c.qty, items.c.unit_price_sold).where(items.c.id == db_item.id))).one()
+    raise RuntimeError(f"Order item {db_item.id} kept changing, please retry")
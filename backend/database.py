@@ -1,16 +1,89 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 import os
+from typing import Iterable
+
+from db_metrics import TimedQueuePool
 
 # Default to SQLite for local development, allow env override
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./sql_app.db")
+# Optional read replica: read-only GET endpoints use it through get_read_db
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Storage profile: "sqlite", "postgres", or "auto" (picked from the URL scheme)
+DB_PROFILE = os.getenv("DB_PROFILE", "auto")
+
+# SQLite profile, applied to every new connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))
+
+# Postgres profile
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Seconds; below typical server/proxy idle timeouts
+
+# Max values per IN (...) lookup, for every chunked lookup. Keeps us well below SQLite's
+# bound-parameter limit, so query count grows with the number of chunks, not the number of rows.
+LOOKUP_CHUNK_SIZE = 500
+
+
+def chunked(values: Iterable, size: int = LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _profile(url: str) -> str:
+    if DB_PROFILE != "auto":
+        return DB_PROFILE
+    return "sqlite" if url.startswith("sqlite") else "postgres"
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer instead of "database is locked";
+    # synchronous=NORMAL is durable in WAL mode except for the last commits on power loss
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}") # Negative = KiB
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.close()
 
-engine = create_async_engine(
-    DATABASE_URL, 
-    echo=True,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+
+def make_engine(url: str):
+    profile = _profile(url)
+    # Statement logging is opt-in (SQL_ECHO=1); per-request counts and timings come from db_metrics
+    options = {"echo": os.getenv("SQL_ECHO", "0") == "1"}
+    if profile == "sqlite":
+        options["connect_args"] = {"check_same_thread": False}
+        if ":memory:" not in url:
+            options["poolclass"] = TimedQueuePool
+    elif profile == "postgres":
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=True,
+        )
+    else:
+        raise ValueError(f"Unknown DB_PROFILE: {profile}")
+
+    new_engine = create_async_engine(url, **options)
+    if profile == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL)
+read_engine = make_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
+engines = {"primary": engine, **({"replica": read_engine} if read_engine is not engine else {})}
 
 SessionLocal = sessionmaker(
     autocommit=False,
@@ -19,8 +92,21 @@ SessionLocal = sessionmaker(
     class_=AsyncSession
 )
 
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine,
+    class_=AsyncSession
+)
+
 Base = declarative_base()
 
 async def get_db():
     async with SessionLocal() as session:
         yield session
+
+async def get_read_db():
+    # For endpoints that only read. With a replica, results can lag the primary slightly,
+    # so anything that must see its own writes (or writes itself) uses get_db.
+    async with ReadSessionLocal() as session:
+        yield session
@@ -0,0 +1,223 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Per-request SQL instrumentation, from SQLAlchemy engine events (see install()):
+# - query count and DB time per request, returned as X-DB-Queries / X-DB-Time-Ms headers
+#   by DBMetricsMiddleware and aggregated per route for GET /metrics/db
+# - statements slower than SQL_SLOW_QUERY_MS are logged with their duration
+# - a statement run SQL_N_PLUS_ONE_THRESHOLD or more times in one request is logged as a
+#   suspected N+1 (executemany counts once; bulk paths are not flagged)
+# - connection pool checkout waits and utilization (TimedQueuePool, used by database.py)
+# Per statement the cost is two perf_counter() calls and a few counter updates; nothing is
+# formatted or logged unless a threshold is crossed.
+
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "10"))
+
+# Bounded so ad-hoc statements (e.g. IN lists of varying length) cannot grow memory without limit
+MAX_TRACKED_STATEMENTS = 500
+
+logger = logging.getLogger("sql")
+
+
+class RequestStats:
+    __slots__ = ("queries", "seconds", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+
+class RouteStats:
+    __slots__ = ("requests", "queries", "seconds", "max_queries", "max_seconds", "n_plus_one")
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.seconds = 0.0
+        self.max_queries = 0
+        self.max_seconds = 0.0
+        self.n_plus_one = 0
+
+    def to_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "db_ms": round(self.seconds * 1000, 1),
+            "avg_queries": round(self.queries / self.requests, 1) if self.requests else 0,
+            "avg_db_ms": round(self.seconds * 1000 / self.requests, 2) if self.requests else 0,
+            "max_queries": self.max_queries,
+            "max_db_ms": round(self.max_seconds * 1000, 1),
+            "n_plus_one_requests": self.n_plus_one,
+        }
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("db_request_stats", default=None)
+_routes: Dict[str, RouteStats] = {}
+_statements: Dict[str, list] = {}  # statement -> [count, seconds, max_seconds]
+_slow_queries = 0
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    global _slow_queries
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+
+    totals = _statements.get(statement)
+    if totals is None and len(_statements) < MAX_TRACKED_STATEMENTS:
+        totals = _statements[statement] = [0, 0.0, 0.0]
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] = max(totals[2], elapsed)
+
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS:
+        _slow_queries += 1
+        logger.warning("Slow query (%.1f ms%s): %s", elapsed * 1000, ", executemany" if executemany else "", statement)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """The default async queue pool, plus how long checkouts wait for a free connection."""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.peak_checked_out = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+        return connection
+
+
+def pool_stats(engine) -> Dict:
+    pool = getattr(engine, "sync_engine", engine).pool
+    stats = {"pool": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, TimedQueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "utilization": round(pool.checkedout() / capacity, 3) if capacity else 0,
+            "peak_checked_out": pool.peak_checked_out,
+            "checkouts": pool.checkouts,
+            "avg_wait_ms": round(pool.wait_seconds * 1000 / pool.checkouts, 3) if pool.checkouts else 0,
+            "max_wait_ms": round(pool.max_wait_seconds * 1000, 1),
+            "timeouts": pool.timeouts,
+        })
+    return stats
+
+
+def install(engine):
+    """Hooks the timing events on an engine (the sync engine behind an AsyncEngine)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def finish_request(route: str, stats: RequestStats):
+    """Folds one request into the per-route totals and reports suspected N+1 statements."""
+    route_stats = _routes.get(route)
+    if route_stats is None:
+        route_stats = _routes[route] = RouteStats()
+    route_stats.requests += 1
+    route_stats.queries += stats.queries
+    route_stats.seconds += stats.seconds
+    route_stats.max_queries = max(route_stats.max_queries, stats.queries)
+    route_stats.max_seconds = max(route_stats.max_seconds, stats.seconds)
+
+    repeated = [(statement, count) for statement, count in stats.statements.items() if count >= SQL_N_PLUS_ONE_THRESHOLD]
+    if repeated:
+        route_stats.n_plus_one += 1
+        for statement, count in repeated:
+            logger.warning("Suspected N+1 in %s: %d executions of: %s", route, count, statement)
+
+
+def snapshot(top: int = 20) -> Dict:
+    """Aggregated metrics since start (or the last reset): per route and the most expensive statements."""
+    statements = sorted(_statements.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    return {
+        "slow_query_ms": SQL_SLOW_QUERY_MS,
+        "slow_queries": _slow_queries,
+        "routes": {route: stats.to_dict() for route, stats in sorted(_routes.items())},
+        "top_statements": [
+            {
+                "statement": statement,
+                "count": count,
+                "total_ms": round(seconds * 1000, 1),
+                "avg_ms": round(seconds * 1000 / count, 3),
+                "max_ms": round(max_seconds * 1000, 1),
+            }
+            for statement, (count, seconds, max_seconds) in statements
+        ],
+    }
+
+
+def reset():
+    global _slow_queries
+    _routes.clear()
+    _statements.clear()
+    _slow_queries = 0
+
+
+class DBMetricsMiddleware:
+    """ASGI middleware (works with streaming responses) that scopes the counters to one request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.queries).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.seconds * 1000:.1f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _current.reset(token)
+            # The route template (e.g. /sales/{order_id}) groups requests; unmatched paths are pooled
+            route = scope.get("route")
+            finish_request(f"{scope['method']} {getattr(route, 'path', '(unmatched)')}", stats)
@@ -0,0 +1,124 @@
+import csv
+import datetime
+import io
+import os
+import tempfile
+from typing import AsyncIterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from openpyxl import Workbook
+from sqlalchemy import select
+
+import crud
+import database
+import schemas
+from models import Product, PurchaseBatch, PurchaseItem, SalesItem, SalesOrder
+
+# Streaming exports behind GET /sales/export and GET /purchases/export. Rows come from a server-side
+# cursor (yield_per) in partitions of EXPORT_PARTITION_SIZE and are written out one partition at a
+# time, so memory stays flat however many lines are exported. The headers are the ones the importers
+# read, so an exported file can be uploaded again.
+EXPORT_PARTITION_SIZE = int(os.getenv("EXPORT_PARTITION_SIZE", "1000"))
+
+# Blocks read back from the finished .xlsx file
+XLSX_BLOCK_SIZE = 1024 * 1024
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+# Maihuobian order columns (order_preprocessor), one row per item; 小計 and 平台 are informational
+SALES_HEADERS = ["訂單編號", "訂單日期", "買家會員名稱", "商品名稱", "數量", "單價", "小計", "平台"]
+
+# Supplier invoice columns (purchase_import), one row per item, with the batch it belongs to
+PURCHASE_HEADERS = ["進貨日期", "來源", "商品編號", "商品名稱", "數量", "單價(JPY)", "單件重量(g)", "成本(TWD)"]
+
+
+def sales_export_query(filters: Optional[schemas.SalesOrderFilter] = None):
+    """Item lines of the filtered orders, oldest first; the lines of one order stay together (the importer needs that)."""
+    order, item = SalesOrder, SalesItem
+    return (
+        select(
+            order.order_no, order.order_date, order.customer_name, Product.name, item.qty, item.unit_price_sold,
+            item.qty * item.unit_price_sold, order.platform_source,
+        )
+        .select_from(order)
+        .join(item, item.order_id == order.id)
+        .outerjoin(Product, Product.id == item.product_id)
+        .where(*crud.sales_order_conditions(filters))
+        .order_by(order.order_date, order.id, item.id)
+    )
+
+
+def purchases_export_query(date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None):
+    batch, item = PurchaseBatch, PurchaseItem
+    conditions = []
+    if date_from:
+        conditions.append(batch.purchase_date >= date_from)
+    if date_to:
+        conditions.append(batch.purchase_date <= date_to)
+    return (
+        select(
+            batch.purchase_date, batch.source, Product.sku, Product.name, item.qty, item.unit_price_jpy,
+            item.item_weight_g, item.final_cost_twd,
+        )
+        .select_from(batch)
+        .join(item, item.batch_id == batch.id)
+        .outerjoin(Product, Product.id == item.product_id)
+        .where(*conditions)
+        .order_by(batch.purchase_date, batch.id, item.id)
+    )
+
+
+async def _partitions(query) -> AsyncIterator[List[tuple]]:
+    # Own session: the response body is sent after the endpoint (and its dependencies) returned
+    async with database.ReadSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_PARTITION_SIZE))
+        async for rows in result.partitions():
+            yield [tuple(row) for row in rows]
+
+
+async def _csv(headers: List[str], query) -> AsyncIterator[bytes]:
+    # UTF-8 with BOM: Excel opens it with the right encoding, and the importer reads it as utf-8-sig
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    async for rows in _partitions(query):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def _xlsx(headers: List[str], query) -> AsyncIterator[bytes]:
+    # Write-only workbooks spool their rows to a temp file; the zip can only be sent once it is complete
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(headers)
+
+    def append(rows):
+        for row in rows:
+            sheet.append(row)
+
+    async for rows in _partitions(query):
+        await run_in_threadpool(append, rows)
+
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=".xlsx")
+    os.close(fd)
+    try:
+        await run_in_threadpool(workbook.save, path)
+        with open(path, "rb") as f:
+            while block := await run_in_threadpool(f.read, XLSX_BLOCK_SIZE):
+                yield block
+    finally:
+        os.remove(path)
+
+
+def stream(format: str, headers: List[str], query) -> AsyncIterator[bytes]:
+    return _xlsx(headers, query) if format == "xlsx" else _csv(headers, query)
+
+
+def filename(prefix: str, format: str) -> str:
+    return f"{prefix}_{datetime.date.today():%Y%m%d}.{format}"
@@ -0,0 +1,113 @@
+import json
+import os
+import pickle
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Parsed uploads and per-source order history live here, keyed by content hash
+IMPORT_CACHE_DIR = os.getenv("IMPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_cache"))
+
+
+# Files an import running in this process is writing or reading; clear() leaves them alone
+_in_use: Set[str] = set()
+
+
+def _path(*parts: str) -> str:
+    return os.path.join(IMPORT_CACHE_DIR, *parts)
+
+
+# --- Parsed chunks ---
+# One file per upload hash: a stream of pickled (parsed_orders, stats) records, one per chunk,
+# so replaying a cached file is as memory-bounded as parsing it.
+
+def has_parsed(file_hash: str) -> bool:
+    return os.path.exists(_path("parsed", f"{file_hash}.pkl"))
+
+
+def iter_parsed(file_hash: str) -> Iterator[Tuple[List[Dict], Dict]]:
+    path = _path("parsed", f"{file_hash}.pkl")
+    _in_use.add(path)
+    try:
+        with open(path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+    finally:
+        _in_use.discard(path)
+
+
+class ParsedWriter:
+    """Writes parsed chunks to a temp file; only a fully parsed file becomes visible on commit()."""
+
+    def __init__(self, file_hash: str):
+        os.makedirs(_path("parsed"), exist_ok=True)
+        self.final_path = _path("parsed", f"{file_hash}.pkl")
+        fd, self.tmp_path = tempfile.mkstemp(dir=_path("parsed"), suffix=".tmp")
+        _in_use.add(self.tmp_path)
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, parsed_orders: List[Dict], stats: Dict):
+        pickle.dump((parsed_orders, stats), self.file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def commit(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.final_path)
+        _in_use.discard(self.tmp_path)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        _in_use.discard(self.tmp_path)
+
+
+# --- Import summaries ---
+
+def save_summary(file_hash: str, results: Dict):
+    os.makedirs(_path("summaries"), exist_ok=True)
+    with open(_path("summaries", f"{file_hash}.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False)
+
+
+def load_summary(file_hash: str) -> Optional[Dict]:
+    try:
+        with open(_path("summaries", f"{file_hash}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# --- Order numbers already imported per source ---
+# Append-only text file, one order number per line. Lets a re-uploaded superset export skip
+# the groups it already imported without parsing them. Only a hint: the importer keeps the
+# numbers that are still in sales_orders (see import_service.find_imported_order_nos).
+
+def load_seen_order_nos(source: str) -> Set[str]:
+    try:
+        with open(_path("seen", f"{source}.txt"), encoding="utf-8") as f:
+            return {line.rstrip("\n") for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def add_seen_order_nos(source: str, order_nos: Iterable[str]):
+    os.makedirs(_path("seen"), exist_ok=True)
+    with open(_path("seen", f"{source}.txt"), "a", encoding="utf-8") as f:
+        f.writelines(f"{order_no}\n" for order_no in order_nos)
+
+
+def clear():
+    """
+    Drops cached parses, summaries and order history, e.g. after sales orders were deleted.
+    Files an import in progress is writing or reading stay; they are valid whatever the database holds.
+    """
+    for directory, _, names in os.walk(IMPORT_CACHE_DIR):
+        for name in names:
+            path = os.path.join(directory, name)
+            if path not in _in_use:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import database
+import import_service
+
+# Max sales imports running at once. Further uploads wait in the queue,
+# so a burst of large files cannot starve normal API traffic.
+IMPORT_MAX_CONCURRENCY = int(os.getenv("IMPORT_MAX_CONCURRENCY", "2"))
+
+# Finished jobs kept in memory for status polling
+MAX_FINISHED_JOBS = 100
+
+# Reading/parsing runs here, off the event loop. DB writes stay on the loop,
+# bounded by the same concurrency limit.
+_parse_executor = ThreadPoolExecutor(max_workers=IMPORT_MAX_CONCURRENCY, thread_name_prefix="import-parse")
+_import_slots = asyncio.Semaphore(IMPORT_MAX_CONCURRENCY)
+
+logger = logging.getLogger("import")
+
+_jobs: Dict[str, "ImportJob"] = {}
+_tasks = set()  # Strong references so running tasks are not garbage collected
+
+
+class ImportJob:
+    def __init__(self, filename: Optional[str]):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.status = "queued"  # queued -> running -> success | failed
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.results = import_service.new_results()
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            **self.results,
+        }
+
+
+def submit(file_path: str, filename: Optional[str] = None, file_hash: Optional[str] = None) -> ImportJob:
+    """Queues an import of a spooled upload. The job owns `file_path` and removes it when done."""
+    job = ImportJob(filename)
+    _jobs[job.id] = job
+    _prune_finished()
+
+    task = asyncio.create_task(_run(job, file_path, file_hash))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_job(job_id: str) -> Optional[ImportJob]:
+    return _jobs.get(job_id)
+
+
+async def preview(db: AsyncSession, file_path: str, file_hash: Optional[str] = None) -> Dict:
+    """
+    Runs a dry-run import right away. It only reads, so it does not wait for an import slot,
+    but its parsing shares the pool with running imports.
+    """
+    return await import_service.preview_orders(db, file_path, executor=_parse_executor, file_hash=file_hash)
+
+
+async def _run(job: ImportJob, file_path: str, file_hash: Optional[str]):
+    try:
+        async with _import_slots:
+            job.status = "running"
+            async with database.SessionLocal() as db:
+                await import_service.parse_and_save_orders(
+                    db, file_path, results=job.results, executor=_parse_executor, file_hash=file_hash
+                )
+            job.status = "success"
+    except Exception as e:
+        logger.exception("Import job %s (%s) failed", job.id, job.filename)
+        job.results["errors"].append(str(e))
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.now()
+        os.remove(file_path)
+
+
+def _prune_finished():
+    finished = sorted(
+        (job for job in _jobs.values() if job.finished_at is not None),
+        key=lambda job: job.finished_at,
+    )
+    for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del _jobs[job.id]
@@ -1,10 +1,23 @@
+import asyncio
+import contextlib
+import os
+import weakref
 import pandas as pd
-from io import BytesIO
-from typing import List, Dict
-from datetime import datetime
+from collections import defaultdict
+from concurrent.futures import Executor
+from datetime import date, datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+from sqlalchemy import insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from models import SalesOrder, SalesItem, Product
+from database import chunked
+from models import ImportCheckpoint, SalesOrder, SalesItem, Product, generate_uuid
+import import_cache
+import sales_rollup
+import stock
+import order_reader
+from order_preprocessor import preprocess_orders
+from product_name_parser import ParsedItem, parse_product_name
 
 # Traditional Chinese Headers for Maihuobian (賣貨便)
 # Based on common export formats:
@@ -18,310 +31,530 @@ COLUMN_MAPPING = {
     # "小計": "subtotal" 
 }
 
-async def parse_and_save_orders(db: AsyncSession, file_content: bytes) -> Dict:
+# platform_source of imported orders; order history for superset uploads is kept per source
+IMPORT_SOURCE = "Maihuobian"
+
+# Orders per commit. Keeps write transactions (and the SQLite write lock) short on large files.
+IMPORT_COMMIT_EVERY = int(os.getenv("IMPORT_COMMIT_EVERY", "500"))
+
+async def fetch_existing_order_nos(db: AsyncSession, order_nos: Iterable[str]) -> Set[str]:
+    existing = set()
+    for chunk in chunked(set(order_nos)):
+        result = await db.execute(select(SalesOrder.order_no).where(SalesOrder.order_no.in_(chunk)))
+        existing.update(result.scalars().all())
+    return existing
+
+async def fetch_product_ids_by_name(db: AsyncSession, names: Iterable[str]) -> Dict[str, str]:
+    """Maps product name -> id. If several products share a name, the first one wins."""
+    product_ids = {}
+    for chunk in chunked(set(names)):
+        result = await db.execute(select(Product.name, Product.id).where(Product.name.in_(chunk)))
+        for name, product_id in result.all():
+            product_ids.setdefault(name, product_id)
+    return product_ids
+
+
+def new_results() -> Dict:
+    return {
+        "rows_parsed": 0,
+        "created_orders": 0,
+        "skipped_orders": 0,
+        "created_products": 0,
+        "resumed_after_order": None,
+        "duplicate_file": False,
+        "errors": []
+    }
+
+
+def parse_order_chunk(df: pd.DataFrame, results: Dict, seen_order_nos: Set[str]) -> List[Dict]:
     """
-    Parses the Excel file and saves orders to the database.
-    Returns a summary of actions.
+    CPU-only half of the import: turns one chunk of raw rows (complete order groups) into
+    parsed orders. Touches no database, so it can run in a worker thread.
+    `seen_order_nos` carries across chunks.
     """
-    try:
-        # 1. Read Excel (Read without header first to find the correct row)
-        # Maihuobian exports often have metadata rows at the top.
-        df_raw = pd.read_excel(BytesIO(file_content), header=None)
-        
-        # Find the row that contains "訂單編號"
-        header_row_index = -1
-        for i, row in df_raw.head(10).iterrows():
-            # Check if any cell in this row contains the key column
-            if row.astype(str).str.contains("訂單編號").any():
-                header_row_index = i
-                break
-        
-        if header_row_index == -1:
-             # Fallback: maybe it is simplified "订单编号"
-            for i, row in df_raw.head(10).iterrows():
-                if row.astype(str).str.contains("订单编号").any():
-                    header_row_index = i
-                    break
-        
-        if header_row_index == -1:
-             raise ValueError("Could not find header row containing '訂單編號' in the first 10 rows.")
+    results["rows_parsed"] += len(df)
 
-        # Reload with correct header
-        # Note: 'header' in read_excel is 0-indexed. 
-        # If we found it at index i, that's the row we want as header.
-        df = pd.read_excel(BytesIO(file_content), header=header_row_index)
-        
-        # 2. Normalize Headers (strip whitespace)
-        df.columns = df.columns.str.strip()
-        print(f"DEBUG: Found columns in Excel: {df.columns.tolist()}")
-        
-        # 3. Verify Columns (Check at least Order No exists)
-        if "訂單編號" not in df.columns:
-             # Fallback check for Simplified Chinese just in case
-            if "订单编号" in df.columns:
-                 # Remap simplified keys if needed, but assuming user said "Attachment is example of Maihuobian" which is Taiwan-based.
-                 pass
+    # 1. Normalize the whole chunk column-wise, then parse orders from plain tuples (no DB access here).
+    # Each parsed order keeps its sub-items as (product_name, qty, unit_price).
+    rows = preprocess_orders(df)
+
+    # Orders with unreadable cells are reported and left out instead of aborting the file
+    failed = rows.loc[rows["error"].notna(), ["order_no", "error"]].drop_duplicates("order_no")
+    if len(failed):
+        for order_no, error in failed.itertuples(index=False, name=None):
+            results["errors"].append(f"Order {order_no}: {error}")
+        seen_order_nos.update(failed["order_no"])
+        rows = rows[~rows["order_no"].isin(failed["order_no"])]
+
+    # order_no -> parsed order, or None for an order whose first rows came in an earlier chunk
+    orders_by_no = {}
+    split_rows = defaultdict(int)
+
+    # One order might have multiple rows (items); details come from its first row
+    loop_columns = ["order_no", "order_date", "customer_name", "product_name", "qty", "line_revenue"]
+    for order_no, order_date, customer_name, product_name, qty, total_line_revenue in rows[
+        loop_columns
+    ].itertuples(index=False, name=None):
+        if order_no not in orders_by_no:
+            if order_no in seen_order_nos:
+                # Rows not next to each other in the file, and the first ones were already parsed
+                # (possibly committed) with an earlier chunk: reported, not silently dropped
+                orders_by_no[order_no] = None
             else:
-                 # List what we found to help debug
-                 raise ValueError(f"Required column '訂單編號' not found. Found columns: {list(df.columns)}")
+                seen_order_nos.add(order_no)
+                orders_by_no[order_no] = {
+                    "order_no": order_no,
+                    "order_date": order_date,
+                    "customer_name": customer_name,
+                    "items": [],
+                }
+
+        order_info = orders_by_no[order_no]
+        if order_info is None:
+            split_rows[order_no] += 1
+            continue
 
-        # 4. Group by Order ID
-        # One order might have multiple rows (items)
-        grouped = df.groupby("訂單編號")
+        # Execute parsing (memoized on the raw name)
+        parsed_products = parse_product_name(product_name)
         
-        results = {
-            "created_orders": 0,
-            "skipped_orders": 0,
-            "created_products": 0,
-            "errors": []
-        }
-
-        for order_no, group in grouped:
-            order_no = str(order_no).strip()
-            
-            # Check if order exists
-            stmt = select(SalesOrder).where(SalesOrder.order_no == order_no)
-            result = await db.execute(stmt)
-            existing_order = result.scalars().first()
-            
-            if existing_order:
-                results["skipped_orders"] += 1
-                continue
-            
-            # Get Order details from the first row of the group
-            first_row = group.iloc[0]
-            
-            # Parse Date
-            order_date_raw = first_row.get("訂單日期")
-            order_date = None
-            if pd.notna(order_date_raw):
-                try:
-                    order_date = pd.to_datetime(order_date_raw).date()
-                except:
-                    order_date = datetime.now().date() # Fallback
-
-            # Create Order
-            new_order = SalesOrder(
-                order_no=order_no,
-                order_date=order_date,
-                customer_name=str(first_row.get("買家會員名稱", "")),
-                platform_source="Maihuobian"
-            )
-            
-            # Calculate totals based on items
-            total_amount = 0
-            
-            for _, item_row in group.iterrows():
-                # Logic updated per user request: 
-                # Check "商品名稱(品名/規格)" first, then "賣場名稱", then generic "商品名稱"
-                raw_product_name = None
-                
-                # Try specific columns
-                for col_candidate in ["商品名稱(品名/規格)", "賣場名稱", "商品名稱"]:
-                    if col_candidate in df.columns:
-                        val = item_row.get(col_candidate)
-                        if pd.notna(val) and str(val).strip():
-                            raw_product_name = str(val).strip()
-                            break
-                            
-                product_name = raw_product_name if raw_product_name else "Unknown Product"
-                
-                # Helper to clean numbers strings like "1,180"
-                def clean_number(val):
-                    if pd.isna(val): return 0
-                    if isinstance(val, (int, float)): return val
-                    return float(str(val).replace(',', '').strip())
-
-                qty = int(clean_number(item_row.get("數量", 0)))
-                unit_price = float(clean_number(item_row.get("單價", 0)))
-                
-                
-                # --- Complex Product Parsing Logic ---
-                import re
-                
-                def parse_complex_product_name(raw: str) -> List[Dict]:
-                    """
-                    Parses strings like:
-                    1. "ItemA 26張" -> [{"name": "ItemA", "qty": 26}]
-                    2. "ItemA+ItemB" -> [{"name": "ItemA", "qty": 1}, {"name": "ItemB", "qty": 1}]
-                    3. "ItemA+ItemB 各1" -> [{"name": "ItemA", "qty": 1}, {"name": "ItemB", "qty": 1}]
-                    4. "23A 1盒 23C 1盒" -> [{"name": "23A", "qty": 1}, {"name": "23C", "qty": 1}]
-                    5. "23A epick 兩盒" -> [{"name": "23A epick", "qty": 2}]
-                    6. "A+B+C Suffix" -> ["A Suffix", "B Suffix", "C Suffix"]
-                    7. "Group1 / Group2" -> Parse both
-                    """
-                    if not raw: return []
-                    raw = str(raw).strip()
-                    
-                    # 0. Split by '/' first (distinct groups)
-                    if '/' in raw:
-                        major_parts = raw.split('/')
-                        results = []
-                        for p in major_parts:
-                            results.extend(parse_complex_product_name(p))
-                        return results
-
-                    # 1. Normalize chinese numbers and units
-                    raw = raw.replace("兩", " 2")
-                    raw = raw.replace("兩盒", " 2盒").replace("兩個", " 2個").replace("兩張", " 2張")
-                    
-                    # 2. Check global "Each" (各)
-                    default_qty = 1
-                    each_match = re.search(r"各(\d+)", raw)
-                    if each_match:
-                        default_qty = int(each_match.group(1))
-                        raw = raw.replace(each_match.group(0), " ") # Remove "各1"
-                        
-                    # 3. Split by '+'
-                    # Logic for "A+B+C Suffix":
-                    # If split by +, and the LAST part contains a space, we treat the part after space as strict suffix 
-                    # for previous parts that DO NOT have space.
-                    parts = [p.strip() for p in raw.split('+') if p.strip()]
-                    
-                    if len(parts) > 1:
-                        last_part = parts[-1]
-                        # Check if last part has space 'Name Suffix'
-                        # We use strict check: Must have space, and we take everything after first space as suffix
-                        if ' ' in last_part:
-                            # Split only on first space
-                            last_name, suffix = last_part.split(' ', 1)
-                            suffix = ' ' + suffix # Keep space for appending
-                            
-                            # Apply to previous parts if they look like "just names" (no space)
-                            new_parts = []
-                            for idx, p in enumerate(parts):
-                                if idx == len(parts) - 1:
-                                    new_parts.append(p) # Last part already has suffix
-                                else:
-                                    if ' ' not in p:
-                                        new_parts.append(p + suffix)
-                                    else:
-                                        new_parts.append(p)
-                            parts = new_parts
-
-                    parsed_items = []
-                    
-                    for part in parts:
-                        # 4. For each part, looks for specific patterns "Name QtyUnit"
-                        # Regex: Non-greedy name, space(optional), digits, specific units
-                        # We use findall to catch "23A 1盒 23C 1盒" inside one part if no + exists
-                        pattern = r"(.+?)\s*(\d+)\s*[盒個張套組支本]"
-                        matches = re.findall(pattern, part)
-                        
-                        if matches:
-                            # If we found explicit sub-items
-                            for m in matches:
-                                n = m[0].strip()
-                                q = int(m[1])
-                                parsed_items.append({"name": n, "qty": q})
-                        else:
-                            # No explicit unit pattern found, check simple tail digit "Name 26"
-                            simple_match = re.search(r"^(.+?)\s+(\d+)$", part)
-                            if simple_match:
-                                parsed_items.append({"name": simple_match.group(1).strip(), "qty": int(simple_match.group(2))})
-                            else:
-                                # Fallback: Whole part is name, use default/each qty
-                                parsed_items.append({"name": part, "qty": default_qty})
-                                
-                    return parsed_items
-
-                # Execute parsing
-                parsed_products = parse_complex_product_name(product_name)
-                
-                # If for some reason nothing parsed, fallback to raw
-                if not parsed_products:
-                    parsed_products = [{"name": product_name, "qty": 1}]
-
-                # Distribute Price
-                # Total line revenue = qty * unit_price
-                # We divide this revenue equally among the parsed items (simple heuristic)
-                total_line_revenue = qty * unit_price
-                num_sub_items = len(parsed_products)
-                revenue_per_sub_item = total_line_revenue / num_sub_items if num_sub_items > 0 else 0
-                
-                for p_info in parsed_products:
-                    sub_name = p_info["name"]
-                    bundle_qty = p_info["qty"]
-                    
-                    # Total qty for this sub-product = OrderQty * BundleQty
-                    # e.g. Order 2 boxes, each box is "A+B". Then we have 2 A and 2 B.
-                    final_qty = qty * bundle_qty
-                    
-                    # Unit price per atomic item
-                    # Total revenue for this chunk = revenue_per_sub_item
-                    # Unit price = revenue_per_sub_item / final_qty
-                    # Note: Revenue per sub item is for the "Whole Order Line". 
-                    # Actually: revenue_per_sub_item is (TotalLine / N). 
-                    # If line qty is 2, then we have 2 * BundleQty items.
-                    # Price per unit = (TotalLine / N) / (LineQty * BundleQty) NO.
-                    # Let's verify:
-                    # Line: "A+B", Qty 1, Price 1000. -> A (1), B (1). Rev 1000.
-                    # sub_items = 2. rev_per_sub = 500.
-                    # A: final_qty = 1*1=1. unit_price = 500/1 = 500.
-                    # B: final_qty = 1*1=1. unit_price = 500/1 = 500. Sum = 1000. Correct.
-                    
-                    # Line: "A 2pcs", Qty 3, Price 100 (Unit 33.33). Total 100.
-                    # parsed: A (2). items=1. rev_per_sub = 100.
-                    # A: final_qty = 3 * 2 = 6. 
-                    # unit_price = 100 / 6 = 16.66.
-                    # 6 * 16.66 = 100. Correct.
-                    
-                    final_unit_price = 0
-                    if final_qty > 0:
-                        final_unit_price = revenue_per_sub_item / float(bundle_qty) # Wait, logic above says /final_qty?
-                        # R = 100. N=1. 
-                        # FinalQty = 6. 
-                        # UnitPrice = 100 / 6 = 16.66.
-                        # Wait, revenue_per_sub_item is TOTAL revenue allocated to this variant in the entire line.
-                        # So yes, UnitPrice = AllocatedRevenue / TotalQuantityOfThisVariant
-                        final_unit_price = revenue_per_sub_item # This is the "Total for this variant"
-                        # We need unit price sold.
-                        # Unit Price Sold = (Total Allocated Revenue) / (Line Qty * Bundle Qty) ???
-                        # NO. unit_price in DB is "Price of one atomic item".
-                        # Yes.
-                        # Rev = 100.
-                        # final_qty = 6.
-                        # atomic_price = 100 / 6 = 16.66.
-                        # So atomic_price = revenue_per_sub_item / final_qty ? 
-                        # revenue_per_sub_item = 100. final_qty = 6. 100/6 = 16.66.
-                        # Correct.
-                        
-                        # Wait, what if Qty is 0? Avoid div by 0.
-                        final_unit_price = revenue_per_sub_item / final_qty
-
-                    # Find or Create Product
-                    prod_stmt = select(Product).where(Product.name == sub_name)
-                    prod_res = await db.execute(prod_stmt)
-                    product = prod_res.scalars().first()
-                    
-                    if not product:
-                        product = Product(name=sub_name)
-                        db.add(product)
-                        await db.flush()
-                        results["created_products"] += 1
-                    
-                    # Create Sales Item
-                    sales_item = SalesItem(
-                        order=new_order,
-                        product=product,
-                        qty=final_qty,
-                        unit_price_sold=final_unit_price,
-                    )
-                    db.add(sales_item)
-                    
-                    # Deduct Inventory
-                    if product.current_qty is None:
-                        product.current_qty = 0
-                    product.current_qty -= final_qty
-                    db.add(product)
+        # If for some reason nothing parsed, fallback to raw
+        if not parsed_products:
+            parsed_products = (ParsedItem(product_name, 1),)
+
+        # Distribute Price
+        # Total line revenue = qty * unit_price (precomputed column)
+        # We divide this revenue equally among the parsed items (simple heuristic)
+        num_sub_items = len(parsed_products)
+        revenue_per_sub_item = total_line_revenue / num_sub_items if num_sub_items > 0 else 0
+        
+        for sub_name, bundle_qty in parsed_products:
+            # Total qty for this sub-product = OrderQty * BundleQty
+            # e.g. Order 2 boxes, each box is "A+B". Then we have 2 A and 2 B.
+            final_qty = qty * bundle_qty
             
-            new_order.total_amount_received = total_amount
-            db.add(new_order)
-            results["created_orders"] += 1
+            # Price of one unit: the item's share of the line revenue spread over its units (0 for a zero qty)
+            final_unit_price = revenue_per_sub_item / final_qty if final_qty > 0 else 0
+
+            order_info["items"].append((sub_name, final_qty, final_unit_price))
+
+    for order_no, row_count in split_rows.items():
+        results["errors"].append(
+            f"Order {order_no}: rows are not next to each other in the file; "
+            f"{row_count} row(s) after the gap were not imported"
+        )
+    return [o for o in orders_by_no.values() if o is not None]
+
+
+async def plan_parsed_orders(
+    db: AsyncSession, parsed_orders: List[Dict], pending_product_ids: Optional[Dict[str, str]] = None
+) -> Dict:
+    """
+    Read-only half of saving: resolves a batch of parsed orders against the database
+    and builds the rows to insert plus the aggregated stock deductions.
+
+    `pending_product_ids` holds products planned by earlier batches but never written
+    (dry runs), so a new product is only planned once per file.
+    """
+    pending_product_ids = pending_product_ids if pending_product_ids is not None else {}
+
+    # 2. Resolve existing orders and products with chunked IN (...) lookups
+    existing_order_nos = await fetch_existing_order_nos(
+        db, [o["order_no"] for o in parsed_orders]
+    )
+    new_orders = [o for o in parsed_orders if o["order_no"] not in existing_order_nos]
+
+    product_names = {name for o in new_orders for name, _, _ in o["items"]}
+    product_ids = {name: pending_product_ids[name] for name in product_names if name in pending_product_ids}
+    product_ids.update(await fetch_product_ids_by_name(db, product_names - product_ids.keys()))
+
+    # 3. Build bulk insert payloads
+    product_rows = []
+    for name in sorted(product_names - product_ids.keys()):
+        product_ids[name] = generate_uuid()
+        product_rows.append({"id": product_ids[name], "name": name})
+
+    order_rows = []
+    item_rows = []
+    stock_deductions = defaultdict(int)
+    movements = []
+    rollup_lines = []
+    for o in new_orders:
+        order_id = generate_uuid()
+        # A blank date would get today from the column default; resolve it once so the
+        # ledger and rollups book the order on the same day as the stored row
+        order_date = o["order_date"] or date.today()
+        order_rows.append({
+            "id": order_id,
+            "order_no": o["order_no"],
+            "order_date": order_date,
+            "customer_name": o["customer_name"],
+            "platform_source": IMPORT_SOURCE,
+            "total_amount_received": round(sum(qty * unit_price for _, qty, unit_price in o["items"])),
+        })
+        for name, final_qty, final_unit_price in o["items"]:
+            product_id = product_ids[name]
+            item_rows.append({
+                "id": generate_uuid(),
+                "order_id": order_id,
+                "product_id": product_id,
+                "qty": final_qty,
+                "unit_price_sold": final_unit_price,
+            })
+            stock_deductions[product_id] += final_qty
+            movements.append(stock.movement(product_id, -final_qty, "import", order_date, order_id))
+        # Imported lines carry no cost snapshot (COGS 0 until a cost replay fills it in)
+        rollup_lines += sales_rollup.order_lines(
+            order_date, IMPORT_SOURCE,
+            ((product_ids[name], qty, unit_price, None) for name, qty, unit_price in o["items"]),
+        )
+
+    return {
+        "product_ids": product_ids,
+        "product_rows": product_rows,
+        "order_rows": order_rows,
+        "item_rows": item_rows,
+        "stock_deductions": stock_deductions,
+        "movements": movements,
+        "rollup_lines": rollup_lines,
+        "skipped_orders": len(parsed_orders) - len(new_orders),
+    }
+
+
+async def save_parsed_orders(db: AsyncSession, parsed_orders: List[Dict]) -> Dict[str, int]:
+    """
+    Writes a batch of parsed orders without committing.
+    Returns the counts to add to the summary once the batch is committed.
+    """
+    plan = await plan_parsed_orders(db, parsed_orders)
+
+    # 4. Write: one executemany per table, one aggregated stock update per product,
+    #    one ledger row per order line
+    if plan["product_rows"]:
+        await db.execute(insert(Product), plan["product_rows"])
+        await stock.update_summary(db, products_added=len(plan["product_rows"]))
+    if plan["order_rows"]:
+        await db.execute(insert(SalesOrder), plan["order_rows"])
+    if plan["item_rows"]:
+        await db.execute(insert(SalesItem), plan["item_rows"])
+    await stock.add_stock(db, plan["movements"])
+    await sales_rollup.apply(db, plan["rollup_lines"])
+
+    return {
+        "created_orders": len(plan["order_rows"]),
+        "skipped_orders": plan["skipped_orders"],
+        "created_products": len(plan["product_rows"]),
+    }
+
+
+async def find_imported_order_nos(db: AsyncSession, order_nos: Iterable[str], seen: Set[str]) -> Set[str]:
+    """
+    Which of `order_nos` earlier imports of this source committed. Only the numbers on the
+    on-disk list (`seen`) are looked up, and only those still in sales_orders count, so a stale
+    list (deleted orders, a recreated database) cannot make the importer skip an order.
+    """
+    candidates = seen.intersection(order_nos)
+    return await fetch_existing_order_nos(db, candidates) if candidates else set()
+
+
+def _stats_since(results: Dict, before: Dict) -> Dict:
+    return {
+        "rows_parsed": results["rows_parsed"] - before["rows_parsed"],
+        "skipped_orders": results["skipped_orders"] - before["skipped_orders"],
+        "errors": results["errors"][before["errors"]:],
+    }
+
+
+async def iter_parsed_chunks(
+    db: AsyncSession,
+    file_path: str,
+    chunk_size: Optional[int],
+    results: Dict,
+    resume_after: Optional[str] = None,
+    file_hash: Optional[str] = None,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[List[Dict]]:
+    """
+    Yields parsed orders chunk by chunk. Reading and parsing run on `executor` (the loop's
+    default pool if None); only the lookups in between run on the event loop.
+
+    - Order groups earlier imports of this source committed are counted as skipped and passed
+      over before parsing. Each chunk looks up its own order numbers (find_imported_order_nos),
+      so the cost follows the file, not the import history.
+    - `resume_after`: everything up to and including that order (already committed by an
+      earlier run of the same file) is passed over unparsed.
+    - `file_hash`: a file parsed before is replayed from the on-disk cache instead of being
+      read again; a file parsed in full (no order groups passed over) is written to the cache.
+    """
+    loop = asyncio.get_running_loop()
+    seen = import_cache.load_seen_order_nos(IMPORT_SOURCE)
+
+    if file_hash and import_cache.has_parsed(file_hash):
+        records = import_cache.iter_parsed(file_hash)
+        try:
+            while (record := await loop.run_in_executor(executor, next, records, None)) is not None:
+                parsed_orders, stats = record
+                results["rows_parsed"] += stats["rows_parsed"]
+                results["skipped_orders"] += stats["skipped_orders"]
+                results["errors"].extend(stats["errors"])
+                imported = await find_imported_order_nos(db, (o["order_no"] for o in parsed_orders), seen)
+                fresh = [o for o in parsed_orders if o["order_no"] not in imported]
+                results["skipped_orders"] += len(parsed_orders) - len(fresh)
+                yield fresh
+        finally:
+            records.close()
+        return
+
+    # A resumed run skips the prefix, so it cannot produce a complete cache entry
+    writer = import_cache.ParsedWriter(file_hash) if file_hash and resume_after is None else None
+    reader = order_reader.iter_order_chunks(file_path, chunk_size)
+    seen_order_nos = set()
+    try:
+        while (df := await loop.run_in_executor(executor, next, reader, None)) is not None:
+            if resume_after is not None:
+                positions = (df[order_reader.ORDER_NO_COLUMN] == resume_after).to_numpy().nonzero()[0]
+                if len(positions) == 0:
+                    continue
+                # Order groups never span chunks, so the rest of this chunk is new
+                df = df.iloc[positions[-1] + 1:]
+                resume_after = None
+
+            before = {
+                "rows_parsed": results["rows_parsed"],
+                "skipped_orders": results["skipped_orders"],
+                "errors": len(results["errors"]),
+            }
+
+            imported_order_nos = await find_imported_order_nos(db, df[order_reader.ORDER_NO_COLUMN].unique(), seen)
+            if imported_order_nos:
+                imported = df[order_reader.ORDER_NO_COLUMN].isin(imported_order_nos)
+                results["rows_parsed"] += int(imported.sum())
+                results["skipped_orders"] += len(imported_order_nos)
+                df = df[~imported]
+                # The cache entry would lack these groups, and they may be deleted and imported again later
+                if writer:
+                    writer.abort()
+                    writer = None
+
+            parsed_orders = await loop.run_in_executor(executor, parse_order_chunk, df, results, seen_order_nos)
+            if writer:
+                await loop.run_in_executor(executor, writer.write, parsed_orders, _stats_since(results, before))
+            yield parsed_orders
+
+        if writer:
+            writer.commit()
+            writer = None
+    finally:
+        reader.close()
+        if writer:
+            writer.abort()
+
+
+# One lock per file hash being imported. Two uploads of the same file then run one after the other,
+# and the second finds the first one's checkpoint (a duplicate if it completed, a resume if it
+# failed) instead of racing it for the checkpoint row and the orders.
+_file_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _file_lock(file_hash: Optional[str]):
+    if not file_hash:
+        return contextlib.nullcontext()
+    lock = _file_locks.get(file_hash)
+    if lock is None:
+        lock = _file_locks[file_hash] = asyncio.Lock()
+    return lock
 
+
+async def _start_checkpoint(db: AsyncSession, file_hash: str) -> Optional[str]:
+    """Returns the order to resume after if an earlier import of this file did not complete."""
+    checkpoint = await db.get(ImportCheckpoint, file_hash)
+    if checkpoint is None:
+        db.add(ImportCheckpoint(file_hash=file_hash, status="running"))
         await db.commit()
-        return results
+        return None
+
+    resume_after = checkpoint.last_order_no if checkpoint.status != "completed" else None
+    checkpoint.status = "running"
+    await db.commit()
+    return resume_after
+
+
+async def _completed_import_summary(db: AsyncSession, file_hash: str) -> Optional[Dict]:
+    checkpoint = await db.get(ImportCheckpoint, file_hash)
+    if checkpoint is None or checkpoint.status != "completed":
+        return None
+    return import_cache.load_summary(file_hash)
+
+
+async def _update_checkpoint(db: AsyncSession, file_hash: str, **values):
+    await db.execute(
+        update(ImportCheckpoint)
+        .where(ImportCheckpoint.file_hash == file_hash)
+        .values(updated_at=datetime.now(), **values)
+    )
+
 
+async def commit_order_batch(db: AsyncSession, batch: List[Dict], results: Dict, file_hash: Optional[str] = None):
+    """
+    Saves and commits a batch of parsed orders together with the checkpoint,
+    then records its order numbers as imported for this source.
+    If the batch fails, its orders are retried one by one so a single bad order
+    ends up in results["errors"] instead of aborting the file.
+    """
+    try:
+        counts = await save_parsed_orders(db, batch)
+        if file_hash:
+            await _update_checkpoint(
+                db, file_hash,
+                last_order_no=batch[-1]["order_no"],
+                committed_orders=ImportCheckpoint.committed_orders + counts["created_orders"],
+            )
+        await db.commit()
     except Exception as e:
         await db.rollback()
-        raise e
+        if len(batch) > 1:
+            for order in batch:
+                await commit_order_batch(db, [order], results, file_hash)
+            return
+
+        # DB errors carry the statement and parameters; the driver message is enough here
+        results["errors"].append(f"Order {batch[0]['order_no']}: {getattr(e, 'orig', None) or e}")
+        if file_hash:
+            # Move past the failed order so a resumed run does not hit it again
+            await _update_checkpoint(db, file_hash, last_order_no=batch[0]["order_no"])
+            await db.commit()
+        return
+
+    import_cache.add_seen_order_nos(IMPORT_SOURCE, [o["order_no"] for o in batch])
+    for key, value in counts.items():
+        results[key] += value
+
+
+async def parse_and_save_orders(
+    db: AsyncSession,
+    file_path: str,
+    chunk_size: Optional[int] = None,
+    results: Optional[Dict] = None,
+    executor: Optional[Executor] = None,
+    file_hash: Optional[str] = None,
+    commit_every: Optional[int] = None,
+) -> Dict:
+    """
+    Streams the spooled Excel/CSV file and saves orders to the database.
+    Returns a summary of actions.
+
+    Reading and parsing run on `executor` (the loop's default pool if None) one chunk at a time,
+    so the event loop stays free while a large file imports. Pass `results` to watch progress.
+
+    Orders are committed every `commit_every` orders. With `file_hash`, each commit also records
+    the last committed order, and a re-run of a failed import resumes after it. A file that was
+    already imported completely short-circuits right away, and parsed rows are cached by hash.
+    Imports of the same file wait for each other.
+    """
+    results = results if results is not None else new_results()
+    commit_every = commit_every or IMPORT_COMMIT_EVERY
+
+    async with _file_lock(file_hash):
+        if file_hash:
+            previous = await _completed_import_summary(db, file_hash)
+            if previous is not None:
+                # Identical file: every order in it was created or skipped last time
+                results["duplicate_file"] = True
+                results["rows_parsed"] = previous["rows_parsed"]
+                results["skipped_orders"] = previous["created_orders"] + previous["skipped_orders"]
+                results["errors"].extend(previous["errors"])
+                return results
+
+        resume_after = await _start_checkpoint(db, file_hash) if file_hash else None
+        results["resumed_after_order"] = resume_after
+        chunks = iter_parsed_chunks(db, file_path, chunk_size, results, resume_after, file_hash, executor)
+
+        try:
+            async for parsed_orders in chunks:
+                for batch in chunked(parsed_orders, commit_every):
+                    await commit_order_batch(db, batch, results, file_hash)
+
+            if file_hash:
+                await _update_checkpoint(db, file_hash, status="completed")
+                await db.commit()
+                import_cache.save_summary(file_hash, results)
+            return results
+
+        except Exception as e:
+            await db.rollback()
+            if file_hash:
+                await _update_checkpoint(db, file_hash, status="failed")
+                await db.commit()
+            raise e
+
+        finally:
+            await chunks.aclose()
+
+
+async def preview_orders(
+    db: AsyncSession,
+    file_path: str,
+    chunk_size: Optional[int] = None,
+    executor: Optional[Executor] = None,
+    file_hash: Optional[str] = None,
+) -> Dict:
+    """
+    Dry run of parse_and_save_orders: same parsing and resolution pipeline, read-only lookups,
+    nothing written or flushed. Returns which orders are new or skipped, which products
+    would be auto-created, and the net stock change per product.
+
+    With `file_hash` the parsed rows are cached, so importing the previewed file skips parsing.
+    """
+    results = new_results()
+    chunks = iter_parsed_chunks(db, file_path, chunk_size, results, None, file_hash, executor)
+
+    new_order_nos = []
+    pending_product_ids = {}  # new product name -> planned id
+    product_names = {}        # product id -> name, for every product the file touches
+    qty_deltas = defaultdict(int)
+
+    try:
+        async for parsed_orders in chunks:
+            plan = await plan_parsed_orders(db, parsed_orders, pending_product_ids)
+
+            results["skipped_orders"] += plan["skipped_orders"]
+            new_order_nos.extend(row["order_no"] for row in plan["order_rows"])
+            for row in plan["product_rows"]:
+                pending_product_ids[row["name"]] = row["id"]
+            for name, product_id in plan["product_ids"].items():
+                product_names[product_id] = name
+            for product_id, qty in plan["stock_deductions"].items():
+                qty_deltas[product_id] -= qty
+    finally:
+        await chunks.aclose()
+
+    # Current stock of the existing products, to show the projected quantity
+    current_qty = {}
+    planned_ids = set(pending_product_ids.values())
+    existing_ids = [pid for pid in qty_deltas if pid not in planned_ids]
+    for chunk in chunked(existing_ids):
+        result = await db.execute(select(Product.id, Product.current_qty).where(Product.id.in_(chunk)))
+        current_qty.update({pid: qty or 0 for pid, qty in result.all()})
+
+    stock_changes = []
+    for product_id, delta in qty_deltas.items():
+        is_new = product_id not in current_qty
+        before = current_qty.get(product_id, 0)
+        stock_changes.append({
+            "product_id": None if is_new else product_id,
+            "product_name": product_names[product_id],
+            "is_new_product": is_new,
+            "current_qty": before,
+            "qty_delta": delta,
+            "projected_qty": before + delta,
+        })
+    stock_changes.sort(key=lambda change: change["product_name"])
+
+    return {
+        "rows_parsed": results["rows_parsed"],
+        "new_orders": len(new_order_nos),
+        "skipped_orders": results["skipped_orders"],
+        "new_order_nos": new_order_nos,
+        "new_products": sorted(pending_product_ids),
+        "stock_changes": stock_changes,
+        "errors": results["errors"],
+    }
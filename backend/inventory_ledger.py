@@ -0,0 +1,210 @@
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, insert, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import chunked
+from models import InventoryMovement, InventorySnapshot, Product
+
+# Reads over the append-only inventory_movements ledger (written by stock.py).
+#
+# A snapshot row holds one product's stock at the end of snapshot_date, counting the
+# movements up to last_movement_id. Stock on date X is then:
+#   latest snapshot with snapshot_date <= X
+#   + movements dated after the snapshot date, up to X
+#   + back-dated movements (dated <= snapshot date) appended after the snapshot was taken
+# so a query reads one snapshot row and a short tail instead of the whole history.
+
+def _latest_snapshots(as_of: datetime.date, product_ids: Optional[List[str]] = None):
+    """Subquery: each product's latest snapshot on or before `as_of`."""
+    latest_date = (
+        select(InventorySnapshot.product_id, func.max(InventorySnapshot.snapshot_date).label("snapshot_date"))
+        .where(InventorySnapshot.snapshot_date <= as_of)
+        .group_by(InventorySnapshot.product_id)
+    )
+    if product_ids is not None:
+        latest_date = latest_date.where(InventorySnapshot.product_id.in_(product_ids))
+    latest_date = latest_date.subquery()
+    return (
+        select(InventorySnapshot.product_id, InventorySnapshot.snapshot_date,
+               InventorySnapshot.qty, InventorySnapshot.last_movement_id)
+        .join(latest_date, and_(
+            InventorySnapshot.product_id == latest_date.c.product_id,
+            InventorySnapshot.snapshot_date == latest_date.c.snapshot_date,
+        ))
+        .subquery()
+    )
+
+
+def _tail_movements(as_of: datetime.date, snap, product_ids: Optional[List[str]] = None,
+                    max_movement_id: Optional[int] = None):
+    """
+    Subquery of (product_id, qty_change): the movements to add to the snapshots, as a UNION ALL of three
+    disjoint reads, each an index range per product rather than a pass over the whole ledger:
+    - products without a snapshot: all their movements up to `as_of`
+    - movements dated after the snapshot date, up to `as_of`, on (product_id, movement_date)
+    - back-dated movements (dated on or before the snapshot date) appended after the snapshot,
+      on (product_id, id > last_movement_id)
+    """
+    m = InventoryMovement
+    has_snapshot = (
+        select(InventorySnapshot.product_id)
+        .where(InventorySnapshot.product_id == Product.id, InventorySnapshot.snapshot_date <= as_of)
+        .exists()
+    )
+    without_snapshot = select(Product.id).where(~has_snapshot)
+    if product_ids is not None:
+        without_snapshot = without_snapshot.where(Product.id.in_(product_ids))
+    unsnapshotted = (
+        select(m.product_id, m.qty_change)
+        .where(m.product_id.in_(without_snapshot), m.movement_date <= as_of)
+    )
+    dated_after = (
+        select(m.product_id, m.qty_change)
+        .join(snap, snap.c.product_id == m.product_id)
+        .where(m.movement_date > snap.c.snapshot_date, m.movement_date <= as_of)
+    )
+    appended_after = (
+        select(m.product_id, m.qty_change)
+        .join(snap, snap.c.product_id == m.product_id)
+        .where(m.id > snap.c.last_movement_id, m.movement_date <= snap.c.snapshot_date)
+    )
+    parts = []
+    for part in (unsnapshotted, dated_after, appended_after):
+        if product_ids is not None:
+            part = part.where(m.product_id.in_(product_ids))
+        if max_movement_id is not None:
+            part = part.where(m.id <= max_movement_id)
+        parts.append(part)
+    return union_all(*parts).subquery()
+
+
+async def _ledger_qty(db: AsyncSession, as_of: datetime.date, product_ids: Optional[List[str]] = None,
+                      max_movement_id: Optional[int] = None) -> Dict[str, Dict]:
+    """{product_id: {"qty", "tail"}} for products with a snapshot or movements; tail = movements read."""
+    snap = _latest_snapshots(as_of, product_ids)
+    movements = _tail_movements(as_of, snap, product_ids, max_movement_id)
+    tail = (
+        select(movements.c.product_id, func.sum(movements.c.qty_change).label("qty"), func.count().label("tail"))
+        .group_by(movements.c.product_id)
+    )
+
+    stock = {row.product_id: {"qty": row.qty or 0, "tail": 0} for row in (await db.execute(select(snap))).all()}
+    for row in (await db.execute(tail)).all():
+        entry = stock.setdefault(row.product_id, {"qty": 0, "tail": 0})
+        entry["qty"] += row.qty or 0
+        entry["tail"] = row.tail
+    return stock
+
+
+async def stock_as_of(db: AsyncSession, as_of: datetime.date, product_ids: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Stock per product at the end of `as_of`. Products without ledger entries are left out (0)."""
+    if product_ids is None:
+        return {product_id: entry["qty"] for product_id, entry in (await _ledger_qty(db, as_of)).items()}
+
+    product_ids = list(product_ids)
+    stock = {}
+    for chunk in chunked(product_ids):
+        stock.update({product_id: entry["qty"] for product_id, entry in (await _ledger_qty(db, as_of, chunk)).items()})
+    return stock
+
+
+async def movement_history(db: AsyncSession, product_id: str, date_from: Optional[datetime.date] = None,
+                           date_to: Optional[datetime.date] = None, limit: int = 100) -> List[Dict]:
+    """
+    A product's movements, newest first, each with the balance after it.
+    The balance starts from stock_as_of(date_to) and is walked back over the page.
+    """
+    date_to = date_to or datetime.date.today()
+    stmt = (
+        select(InventoryMovement)
+        .where(InventoryMovement.product_id == product_id, InventoryMovement.movement_date <= date_to)
+        .order_by(InventoryMovement.movement_date.desc(), InventoryMovement.id.desc())
+        .limit(limit)
+    )
+    if date_from is not None:
+        stmt = stmt.where(InventoryMovement.movement_date >= date_from)
+    rows = (await db.execute(stmt)).scalars().all()
+
+    balance = (await stock_as_of(db, date_to, [product_id])).get(product_id, 0)
+    history = []
+    for row in rows:
+        history.append({
+            "id": row.id,
+            "movement_date": row.movement_date,
+            "kind": row.kind,
+            "qty_change": row.qty_change,
+            "balance_after": balance,
+            "unit_cost_twd": row.unit_cost_twd,
+            "reference_id": row.reference_id,
+            "reason": row.reason,
+            "created_at": row.created_at,
+        })
+        balance -= row.qty_change
+    return history
+
+
+async def backfill_opening_movements(db: AsyncSession) -> int:
+    """
+    Books an "opening" movement for products whose current_qty predates the ledger
+    (no opening movement yet and current_qty != sum of their movements), dated on their
+    first movement, or today. One INSERT ... SELECT; returns the number of rows written.
+    """
+    m = InventoryMovement
+    ledger = (
+        select(m.product_id, func.sum(m.qty_change).label("qty"), func.min(m.movement_date).label("first_date"))
+        .group_by(m.product_id)
+        .subquery()
+    )
+    has_opening = select(m.id).where(m.product_id == Product.id, m.kind == "opening").exists()
+    missing = func.coalesce(Product.current_qty, 0) - func.coalesce(ledger.c.qty, 0)
+    source = (
+        select(
+            Product.id,
+            func.coalesce(ledger.c.first_date, datetime.date.today()),
+            literal("opening"),
+            missing,
+            Product.avg_cost_twd,
+            literal(datetime.datetime.now()),
+        )
+        .outerjoin(ledger, ledger.c.product_id == Product.id)
+        .where(~has_opening, missing != 0)
+    )
+    result = await db.execute(
+        insert(m).from_select(["product_id", "movement_date", "kind", "qty_change", "unit_cost_twd", "created_at"], source)
+    )
+    return result.rowcount or 0
+
+
+async def take_snapshots(db: AsyncSession, snapshot_date: Optional[datetime.date] = None) -> Dict:
+    """
+    Writes a snapshot on `snapshot_date` (default today) for every product with movements since
+    its previous snapshot (not committed; the caller commits). Taking it again the same day replaces it.
+    """
+    snapshot_date = snapshot_date or datetime.date.today()
+    opening = await backfill_opening_movements(db)
+
+    # Movements appended while this runs are left to the next snapshot's tail
+    last_movement_id = (await db.execute(select(func.max(InventoryMovement.id)))).scalar() or 0
+    stock = await _ledger_qty(db, snapshot_date, max_movement_id=last_movement_id)
+    rows = [
+        {"product_id": product_id, "snapshot_date": snapshot_date, "qty": entry["qty"], "last_movement_id": last_movement_id}
+        for product_id, entry in stock.items()
+        if entry["tail"]
+    ]
+
+    snapshots = InventorySnapshot.__table__
+    for chunk in chunked(rows):
+        await db.execute(snapshots.delete().where(
+            snapshots.c.snapshot_date == snapshot_date,
+            snapshots.c.product_id.in_([row["product_id"] for row in chunk]),
+        ))
+        await db.execute(insert(snapshots), chunk)
+
+    return {
+        "snapshot_date": snapshot_date,
+        "snapshots": len(rows),
+        "opening_movements": opening,
+        "last_movement_id": last_movement_id,
+    }
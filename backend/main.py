@@ -1,11 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.ext.asyncio import AsyncSession
-from database import engine, get_db
-from routers import products, purchases, sales, inventory
+from database import engine, engines, get_db
+from routers import products, purchases, sales, inventory, dashboard, reports, metrics
 import import_service
+import maintenance
+import db_metrics
 
-app = FastAPI(title="Ecommerce Inventory System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Periodic jobs (inventory snapshots, stats reconciliation)
+    maintenance.start()
+    yield
+    await maintenance.stop()
+
+app = FastAPI(title="Ecommerce Inventory System", lifespan=lifespan)
 
 # CORS Setup (Allow frontend)
 origins = [
@@ -20,12 +30,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-DB-Queries", "X-DB-Time-Ms"], # Keyset cursor of GET /sales, SQL metrics
 )
 
+# Query count / DB time per request (headers + GET /metrics/db), slow-query and N+1 logging
+for db_engine in engines.values():
+    db_metrics.install(db_engine)
+app.add_middleware(db_metrics.DBMetricsMiddleware)
+
 app.include_router(products.router)
 app.include_router(purchases.router)
 app.include_router(sales.router)
 app.include_router(inventory.router)
+app.include_router(dashboard.router)
+app.include_router(reports.router)
+app.include_router(metrics.router)
 
 
 
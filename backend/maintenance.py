@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List
+
+import database
+import inventory_ledger
+import sales_rollup
+import stock
+
+# Background jobs that run on a fixed interval while the API is up (started by main.py).
+# An interval of 0 disables the job.
+INVENTORY_SNAPSHOT_INTERVAL_HOURS = float(os.getenv("INVENTORY_SNAPSHOT_INTERVAL_HOURS", "24"))
+INVENTORY_RECONCILE_INTERVAL_HOURS = float(os.getenv("INVENTORY_RECONCILE_INTERVAL_HOURS", "1"))
+SALES_ROLLUP_REBUILD_INTERVAL_HOURS = float(os.getenv("SALES_ROLLUP_REBUILD_INTERVAL_HOURS", "24"))
+
+logger = logging.getLogger("maintenance")
+
+_tasks: List[asyncio.Task] = []
+
+
+async def take_inventory_snapshots():
+    async with database.SessionLocal() as db:
+        result = await inventory_ledger.take_snapshots(db)
+        await db.commit()
+    return result
+
+
+async def reconcile_inventory_summary():
+    async with database.SessionLocal() as db:
+        result = await stock.reconcile_summary(db)
+        await db.commit()
+    return result
+
+
+async def rebuild_sales_rollups():
+    async with database.SessionLocal() as db:
+        result = await sales_rollup.rebuild(db)
+        await db.commit()
+    return result
+
+
+async def _every(hours: float, job: Callable[[], Awaitable]):
+    while True:
+        await asyncio.sleep(hours * 3600)
+        try:
+            await job()
+        except Exception:
+            # Keep the loop alive; the next run starts from whatever was committed
+            logger.exception("Maintenance job %s failed", job.__name__)
+
+
+def start():
+    jobs = [
+        (INVENTORY_SNAPSHOT_INTERVAL_HOURS, take_inventory_snapshots),
+        (INVENTORY_RECONCILE_INTERVAL_HOURS, reconcile_inventory_summary),
+        (SALES_ROLLUP_REBUILD_INTERVAL_HOURS, rebuild_sales_rollups),
+    ]
+    for hours, job in jobs:
+        if hours > 0:
+            _tasks.append(asyncio.create_task(_every(hours, job)))
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,114 @@
+"""
+Converts an existing database from string keys to compact ones (DB_ID_FORMAT=binary), in place:
+    DB_ID_FORMAT=binary python migrate_ids.py
+
+Ids keep their value (the API sees the same strings); only the storage changes. Existing UUID4 ids
+stay as they are, new rows get UUID7. Runs in one transaction, so a failure leaves the database
+untouched. Back up the database file first anyway.
+"""
+import asyncio
+
+from sqlalchemy import Column, MetaData, String, Table, inspect, insert, literal_column, select
+from sqlalchemy.schema import AddConstraint
+from sqlalchemy.types import LargeBinary, Uuid
+
+import migrations
+from database import engine, Base
+import models
+
+# Rows copied per INSERT when rebuilding SQLite tables
+COPY_CHUNK_SIZE = 5000
+
+
+def _id_columns(table):
+    return [column for column in table.columns if isinstance(column.type, models.CompactId)]
+
+
+def already_migrated(conn) -> bool:
+    inspector = inspect(conn)
+    if not inspector.has_table("products"):
+        return False
+    id_type = next(column["type"] for column in inspector.get_columns("products") if column["name"] == "id")
+    return isinstance(id_type, (LargeBinary, Uuid))
+
+
+def _migrate_sqlite(conn):
+    # SQLite cannot change a column type: rename each table aside, recreate it from the models and copy
+    # the rows over (the CompactId bind converts the ids), then drop the old table.
+    tables = [table for table in Base.metadata.sorted_tables if inspect(conn).has_table(table.name)]
+    for table in tables:
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {table.name}__old")
+        indexes = conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (f"{table.name}__old",),
+        ).scalars().all()
+        for index in indexes:
+            conn.exec_driver_sql(f"DROP INDEX {index}")
+
+    Base.metadata.create_all(conn)
+
+    for table in tables:
+        # The old table, read with the model's column types except for the ids, which are still text
+        old = Table(
+            f"{table.name}__old", MetaData(),
+            *[Column(column.name, String if isinstance(column.type, models.CompactId) else column.type) for column in table.columns],
+        )
+        rowid = literal_column("rowid")
+        copied, last_rowid = 0, -1
+        while True:
+            rows = conn.execute(
+                select(old, rowid.label("_rowid")).where(rowid > last_rowid).order_by(rowid).limit(COPY_CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            last_rowid = rows[-1]["_rowid"]
+            conn.execute(insert(table), [{key: value for key, value in row.items() if key != "_rowid"} for row in rows])
+            copied += len(rows)
+        print(f"{table.name}: {copied} rows")
+
+    for table in reversed(tables):
+        conn.exec_driver_sql(f"DROP TABLE {table.name}__old")
+
+
+def _migrate_postgres(conn):
+    # ALTER ... TYPE uuid in place; foreign keys are dropped around it since both sides change type
+    tables = [table for table in Base.metadata.sorted_tables if inspect(conn).has_table(table.name)]
+    inspector = inspect(conn)
+    for table in tables:
+        for foreign_key in inspector.get_foreign_keys(table.name):
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} DROP CONSTRAINT "{foreign_key["name"]}"')
+    for table in tables:
+        for column in _id_columns(table):
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE uuid USING {column.name}::uuid")
+            print(f"{table.name}.{column.name}: uuid")
+    for table in tables:
+        for constraint in table.foreign_key_constraints:
+            conn.execute(AddConstraint(constraint))
+
+
+async def migrate():
+    if models.DB_ID_FORMAT != "binary":
+        raise SystemExit("Set DB_ID_FORMAT=binary (for this run and for the API from now on).")
+
+    async with engine.begin() as conn:
+        if await conn.run_sync(already_migrated):
+            print("Keys are already compact; nothing to do")
+            return
+        # The copy expects the current schema. Pending migrations have to run under the old key format:
+        # run from here they would create their tables with binary keys next to the string ones.
+        if await conn.run_sync(migrations.current_version) < migrations.LATEST_VERSION:
+            raise SystemExit("Run python create_db.py (without DB_ID_FORMAT=binary) first to apply the pending migrations.")
+        if conn.dialect.name == "sqlite":
+            await conn.run_sync(_migrate_sqlite)
+        else:
+            await conn.run_sync(_migrate_postgres)
+
+    if engine.dialect.name == "sqlite":
+        # Give the space freed by the shorter keys back to the file system
+        async with engine.connect() as conn:
+            await (await conn.execution_options(isolation_level="AUTOCOMMIT")).exec_driver_sql("VACUUM")
+    print("Keys migrated")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,300 @@
+"""
+Versioned schema migrations, applied by `python create_db.py`.
+
+A new database is created from the models and stamped with the latest version. An existing one runs
+the migrations after its recorded version (a database from before versioning starts at 1), each in
+its own transaction together with its schema_migrations row, so a failure stops at the last good version.
+
+To change the schema: change models.py, then append a migration that brings an existing database to
+the same shape, with its own frozen table definitions or DDL (never the models, which keep changing).
+Applied migrations are not edited. DDL should be safe to re-run (IF NOT EXISTS), since a migration may
+meet a database where part of it was already applied by hand, or created by an older create_db.py.
+"""
+import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, func, insert, inspect, select
+from sqlalchemy.schema import CreateIndex
+
+from database import engine, Base
+from models import IdType, SchemaMigration
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, name: str):
+    def register(upgrade: Callable):
+        MIGRATIONS.append((version, name, upgrade))
+        return upgrade
+    return register
+
+
+# Each migration creates its tables from the frozen definitions below, not from models.py: a
+# migration must build the same schema in every release, whatever the models look like by then.
+# Keys use the configured IdType, like the tables they join. Later changes get their own migration.
+_frozen = MetaData()
+
+
+def _create_tables(conn, *tables: Table):
+    # checkfirst skips tables that exist already; IF NOT EXISTS then adds any of their indexes that are missing
+    for table in tables:
+        table.create(conn, checkfirst=True)
+        for index in table.indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _add_column(conn, table_name: str, column_ddl: str):
+    # "name TYPE [DEFAULT ...]", skipped if the column is there (SQLite has no ADD COLUMN IF NOT EXISTS)
+    name = column_ddl.split()[0]
+    if name not in {column["name"] for column in inspect(conn).get_columns(table_name)}:
+        conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_ddl}")
+
+
+baseline_products = Table(
+    "products", _frozen,
+    Column("id", IdType, primary_key=True),
+    Column("sku", String, unique=True, index=True),
+    Column("name", String, index=True),
+    Column("weight_g", Integer),
+    Column("current_qty", Integer),
+    Column("avg_cost_twd", Float),
+)
+baseline_purchase_batches = Table(
+    "purchase_batches", _frozen,
+    Column("id", IdType, primary_key=True),
+    Column("purchase_date", Date),
+    Column("source", String),
+    Column("currency", String),
+    Column("total_jpy", Integer),
+    Column("total_twd_card_bill", Integer),
+    Column("total_twd_foreign_fee", Integer),
+    Column("total_shipping_twd", Integer),
+    Column("exchange_rate", Float),
+    Column("shipping_rate_per_g", Float),
+)
+baseline_purchase_items = Table(
+    "purchase_items", _frozen,
+    Column("id", IdType, primary_key=True),
+    Column("batch_id", IdType, ForeignKey("purchase_batches.id")),
+    Column("product_id", IdType, ForeignKey("products.id")),
+    Column("qty", Integer),
+    Column("unit_price_jpy", Integer),
+    Column("item_weight_g", Integer),
+    Column("final_cost_twd", Float),
+)
+baseline_sales_orders = Table(
+    "sales_orders", _frozen,
+    Column("id", IdType, primary_key=True),
+    Column("order_no", String, unique=True, index=True),
+    Column("platform_source", String),
+    Column("order_date", Date),
+    Column("customer_name", String),
+    Column("total_amount_received", Integer),
+    Column("shipping_fee_paid_by_customer", Integer),
+)
+baseline_sales_items = Table(
+    "sales_items", _frozen,
+    Column("id", IdType, primary_key=True),
+    Column("order_id", IdType, ForeignKey("sales_orders.id")),
+    Column("product_id", IdType, ForeignKey("products.id")),
+    Column("qty", Integer),
+    Column("unit_price_sold", Integer),
+    Column("historical_cost_basis", Float),
+)
+
+
+@migration(1, "baseline")
+def baseline(conn):
+    # The schema create_db.py built before versioning
+    _create_tables(conn, baseline_products, baseline_purchase_batches, baseline_purchase_items,
+                   baseline_sales_orders, baseline_sales_items)
+
+
+@migration(2, "foreign key and query path indexes")
+def foreign_key_indexes(conn):
+    # purchase_items had none; the sales ones are listed too for databases whose baseline predates them
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS ix_purchase_items_batch_id ON purchase_items (batch_id)",
+        "CREATE INDEX IF NOT EXISTS ix_purchase_items_product_id ON purchase_items (product_id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_items_order_id ON sales_items (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_items_product_order ON sales_items (product_id, order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_orders_date_id ON sales_orders (order_date, id)",
+    ):
+        conn.exec_driver_sql(ddl)
+
+
+sales_daily_totals = Table(
+    "sales_daily_totals", _frozen,
+    Column("day", Date, primary_key=True),
+    Column("platform_source", String, primary_key=True),
+    Column("orders", Integer),
+    Column("units", Integer),
+    Column("revenue", Float),
+    Column("cogs", Float),
+)
+sales_daily_products = Table(
+    "sales_daily_products", _frozen,
+    Column("day", Date, primary_key=True),
+    Column("platform_source", String, primary_key=True),
+    Column("product_id", IdType, primary_key=True),
+    Column("units", Integer),
+    Column("revenue", Float),
+    Column("cogs", Float),
+)
+
+
+@migration(3, "sales daily rollups")
+def sales_rollups(conn):
+    # Filled from the existing sales; from here on the write paths keep them current. The backfill is
+    # frozen SQL too: sales_rollup.rebuild() follows the current models and may change.
+    _create_tables(conn, sales_daily_totals, sales_daily_products)
+    conn.exec_driver_sql("DELETE FROM sales_daily_totals")
+    conn.exec_driver_sql("DELETE FROM sales_daily_products")
+    # Orders without items still count as orders, hence the outer join; undated orders are not rolled up
+    conn.exec_driver_sql("""
+        INSERT INTO sales_daily_totals (day, platform_source, orders, units, revenue, cogs)
+        SELECT o.order_date, COALESCE(o.platform_source, ''), COUNT(DISTINCT o.id),
+               COALESCE(SUM(i.qty), 0), COALESCE(SUM(i.qty * i.unit_price_sold), 0.0),
+               COALESCE(SUM(i.qty * COALESCE(i.historical_cost_basis, 0)), 0.0)
+        FROM sales_orders o LEFT OUTER JOIN sales_items i ON i.order_id = o.id
+        WHERE o.order_date IS NOT NULL
+        GROUP BY o.order_date, COALESCE(o.platform_source, '')
+    """)
+    conn.exec_driver_sql("""
+        INSERT INTO sales_daily_products (day, platform_source, product_id, units, revenue, cogs)
+        SELECT o.order_date, COALESCE(o.platform_source, ''), i.product_id,
+               COALESCE(SUM(i.qty), 0), COALESCE(SUM(i.qty * i.unit_price_sold), 0.0),
+               COALESCE(SUM(i.qty * COALESCE(i.historical_cost_basis, 0)), 0.0)
+        FROM sales_orders o JOIN sales_items i ON i.order_id = o.id
+        WHERE o.order_date IS NOT NULL AND i.product_id IS NOT NULL
+        GROUP BY o.order_date, COALESCE(o.platform_source, ''), i.product_id
+    """)
+
+
+import_checkpoints = Table(
+    "import_checkpoints", _frozen,
+    Column("file_hash", String, primary_key=True),
+    Column("status", String),
+    Column("last_order_no", String),
+    Column("committed_orders", Integer),
+    Column("updated_at", DateTime),
+)
+
+
+@migration(4, "import checkpoints")
+def import_checkpoint_table(conn):
+    _create_tables(conn, import_checkpoints)
+
+
+inventory_movements = Table(
+    "inventory_movements", _frozen,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("product_id", IdType, ForeignKey("products.id"), nullable=False),
+    Column("movement_date", Date),
+    Column("kind", String),
+    Column("qty_change", Integer),
+    Column("unit_cost_twd", Float),
+    Column("reference_id", String),
+    Column("reason", String),
+    Column("created_at", DateTime),
+    Index("ix_inventory_movements_product_date_id", "product_id", "movement_date", "id"),
+)
+inventory_snapshots = Table(
+    "inventory_snapshots", _frozen,
+    Column("product_id", IdType, ForeignKey("products.id"), primary_key=True),
+    Column("snapshot_date", Date, primary_key=True),
+    Column("qty", Integer),
+    Column("last_movement_id", Integer),
+)
+
+
+@migration(5, "inventory ledger")
+def inventory_ledger_tables(conn):
+    _create_tables(conn, inventory_movements, inventory_snapshots)
+
+
+inventory_summary = Table(
+    "inventory_summary", _frozen,
+    Column("id", Integer, primary_key=True),
+    Column("product_count", Integer),
+    Column("total_value_twd", Float),
+    Column("reconciled_at", DateTime),
+)
+
+
+@migration(6, "inventory summary")
+def inventory_summary_table(conn):
+    # Its row is written by the first reconciliation (GET /inventory/stats computes it on first use)
+    _create_tables(conn, inventory_summary)
+
+
+@migration(7, "reorder thresholds")
+def reorder_thresholds(conn):
+    _add_column(conn, "products", "reorder_threshold INTEGER DEFAULT 10")
+    # Expression index, which reflection does not report, so IF NOT EXISTS rather than an inspector check
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_products_stock_below_threshold ON products (current_qty - reorder_threshold)"
+    )
+
+
+@migration(8, "sales order filter indexes")
+def sales_filter_indexes(conn):
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS ix_sales_orders_source_date_id ON sales_orders (platform_source, order_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_sales_orders_customer_date_id ON sales_orders (customer_name, order_date, id)",
+    ):
+        conn.exec_driver_sql(ddl)
+
+
+@migration(9, "inventory ledger append-order index")
+def inventory_movements_append_index(conn):
+    # Back-dated movements appended since a product's snapshot: product_id = ? AND id > last_movement_id
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_inventory_movements_product_id_id ON inventory_movements (product_id, id)"
+    )
+
+
+LATEST_VERSION = max(version for version, _, _ in MIGRATIONS)
+
+
+def current_version(conn) -> int:
+    # 0: no schema_migrations rows yet (a new database, or one from before versioning)
+    if not inspect(conn).has_table(SchemaMigration.__tablename__):
+        return 0
+    return conn.execute(select(func.max(SchemaMigration.version))).scalar() or 0
+
+
+def _record(conn, version: int, name: str):
+    conn.execute(insert(SchemaMigration).values(version=version, name=name, applied_at=datetime.datetime.now()))
+
+
+def _create_new(conn) -> bool:
+    # An empty database gets the current schema directly; returns False if there were tables already
+    if inspect(conn).get_table_names():
+        return False
+    Base.metadata.create_all(conn)
+    for version, name, _ in sorted(MIGRATIONS):
+        _record(conn, version, name)
+    return True
+
+
+async def upgrade() -> List[int]:
+    """Applies pending migrations; returns the versions applied."""
+    async with engine.begin() as conn:
+        if await conn.run_sync(_create_new):
+            print(f"Created schema at version {LATEST_VERSION}")
+            return [version for version, _, _ in MIGRATIONS]
+        await conn.run_sync(lambda sync_conn: SchemaMigration.__table__.create(sync_conn, checkfirst=True))
+
+    applied = []
+    for version, name, migrate in sorted(MIGRATIONS):
+        async with engine.begin() as conn:
+            if version <= await conn.run_sync(current_version):
+                continue
+            await conn.run_sync(migrate)
+            await conn.run_sync(_record, version, name)
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    if not applied:
+        print(f"Schema is up to date (version {LATEST_VERSION})")
+    return applied
@@ -1,30 +1,86 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Date, DateTime, Index, LargeBinary
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import relationship, query_expression
+from sqlalchemy.types import TypeDecorator
 from database import Base
 import datetime
+import os
+import time
 import uuid
 
+# How primary/foreign keys are stored. The API always sees UUID strings.
+# - "string": random UUID4 text (36 chars), the original layout
+# - "uuid7": time-ordered UUID7 text, so new rows append to the key indexes instead of landing anywhere
+# - "binary": UUID7 in 16 bytes (BLOB on SQLite, native uuid on Postgres)
+# An existing database is converted to "binary" with migrate_ids.py.
+DB_ID_FORMAT = os.getenv("DB_ID_FORMAT", "string")
+if DB_ID_FORMAT not in ("string", "uuid7", "binary"):
+    raise ValueError(f"Unknown DB_ID_FORMAT: {DB_ID_FORMAT}")
+
+def _uuid7():
+    # RFC 9562: 48-bit Unix ms timestamp, then version/variant bits over 74 random bits
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
 def generate_uuid():
-    return str(uuid.uuid4())
+    return str(uuid.uuid4() if DB_ID_FORMAT == "string" else _uuid7())
+
+class CompactId(TypeDecorator):
+    """UUID string in Python, 16 bytes in the database."""
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        # bytes.fromhex rather than uuid.UUID: this runs for every key bound and read
+        try:
+            raw = bytes.fromhex(value.replace("-", ""))
+        except (ValueError, TypeError, AttributeError):
+            raw = None
+        if raw is None or len(raw) != 16:
+            return None # Not an id we issued (e.g. a mistyped URL): compares equal to nothing
+        return value if dialect.name == "postgresql" else raw
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        h = value.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+IdType = CompactId if DB_ID_FORMAT == "binary" else String
+
+DEFAULT_REORDER_THRESHOLD = 10
 
 class Product(Base):
     __tablename__ = "products"
 
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(IdType, primary_key=True, default=generate_uuid)
     sku = Column(String, unique=True, index=True)
     name = Column(String, index=True)
     weight_g = Column(Integer, default=0)
     current_qty = Column(Integer, default=0)
     avg_cost_twd = Column(Float, default=0.0)
+    reorder_threshold = Column(Integer, default=DEFAULT_REORDER_THRESHOLD) # Low stock below this qty
 
     # Relationships
     purchase_items = relationship("PurchaseItem", back_populates="product")
     sales_items = relationship("SalesItem", back_populates="product")
 
+# Low-stock lookups filter and sort on this expression, so they are an index range scan
+Index("ix_products_stock_below_threshold", Product.current_qty - Product.reorder_threshold)
+
 class PurchaseBatch(Base):
     __tablename__ = "purchase_batches"
 
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(IdType, primary_key=True, default=generate_uuid)
     purchase_date = Column(Date, default=datetime.date.today)
     source = Column(String)
     currency = Column(String, default="JPY")
@@ -42,9 +98,9 @@ class PurchaseBatch(Base):
 class PurchaseItem(Base):
     __tablename__ = "purchase_items"
 
-    id = Column(String, primary_key=True, default=generate_uuid)
-    batch_id = Column(String, ForeignKey("purchase_batches.id"))
-    product_id = Column(String, ForeignKey("products.id"))
+    id = Column(IdType, primary_key=True, default=generate_uuid)
+    batch_id = Column(IdType, ForeignKey("purchase_batches.id"))
+    product_id = Column(IdType, ForeignKey("products.id"))
     
     qty = Column(Integer, default=0)
     unit_price_jpy = Column(Integer, default=0)
@@ -54,10 +110,16 @@ class PurchaseItem(Base):
     batch = relationship("PurchaseBatch", back_populates="items")
     product = relationship("Product", back_populates="purchase_items")
 
+    # Foreign key lookups: items of a batch (selectinload) and purchases of a product (cost replay)
+    __table_args__ = (
+        Index("ix_purchase_items_batch_id", "batch_id"),
+        Index("ix_purchase_items_product_id", "product_id"),
+    )
+
 class SalesOrder(Base):
     __tablename__ = "sales_orders"
 
-    id = Column(String, primary_key=True, default=generate_uuid)
+    id = Column(IdType, primary_key=True, default=generate_uuid)
     order_no = Column(String, unique=True, index=True)
     platform_source = Column(String, default="Myship")
     order_date = Column(Date, default=datetime.date.today)
@@ -68,6 +130,19 @@ class SalesOrder(Base):
 
     items = relationship("SalesItem", back_populates="order", cascade="all, delete-orphan")
 
+    # Per-order totals, filled by SQL aggregation when the query asks for them (crud.with_order_totals)
+    item_count = query_expression()
+    revenue = query_expression()
+    cost = query_expression()
+    margin = query_expression()
+
+    # Keyset pagination of GET /sales: (order_date, id), optionally behind an equality filter
+    __table_args__ = (
+        Index("ix_sales_orders_date_id", "order_date", "id"),
+        Index("ix_sales_orders_source_date_id", "platform_source", "order_date", "id"),
+        Index("ix_sales_orders_customer_date_id", "customer_name", "order_date", "id"),
+    )
+
     @property
     def platform_order_id(self):
         return self.order_no
@@ -75,9 +150,9 @@ class SalesOrder(Base):
 class SalesItem(Base):
     __tablename__ = "sales_items"
 
-    id = Column(String, primary_key=True, default=generate_uuid)
-    order_id = Column(String, ForeignKey("sales_orders.id"))
-    product_id = Column(String, ForeignKey("products.id"))
+    id = Column(IdType, primary_key=True, default=generate_uuid)
+    order_id = Column(IdType, ForeignKey("sales_orders.id"))
+    product_id = Column(IdType, ForeignKey("products.id"))
     
     qty = Column(Integer, default=0)
     unit_price_sold = Column(Integer, default=0)
@@ -86,6 +161,11 @@ class SalesItem(Base):
     order = relationship("SalesOrder", back_populates="items")
     product = relationship("Product", back_populates="sales_items")
 
+    __table_args__ = (
+        Index("ix_sales_items_order_id", "order_id"),
+        Index("ix_sales_items_product_order", "product_id", "order_id"),
+    )
+
     @property
     def product_name(self):
         return self.product.name if self.product else "Unknown"
@@ -101,3 +181,86 @@ class SalesItem(Base):
     @property
     def total_price(self):
         return self.qty * self.unit_price_sold
+
+class ImportCheckpoint(Base):
+    __tablename__ = "import_checkpoints"
+
+    # One row per uploaded file content, so a failed import can resume where it stopped
+    file_hash = Column(String, primary_key=True)
+    status = Column(String, default="running") # running / failed / completed
+    last_order_no = Column(String) # Last order (in file order) whose batch was committed
+    committed_orders = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.datetime.now)
+
+class InventoryMovement(Base):
+    __tablename__ = "inventory_movements"
+
+    # Append-only: one row per stock change, written by stock.py together with the qty update
+    id = Column(Integer, primary_key=True, autoincrement=True) # Also the append order
+    product_id = Column(IdType, ForeignKey("products.id"), nullable=False)
+    movement_date = Column(Date, default=datetime.date.today) # Business date (order / purchase date)
+    kind = Column(String) # opening / purchase / sale / import / order_edit / adjustment
+    qty_change = Column(Integer, default=0)
+    unit_cost_twd = Column(Float) # Purchases only
+    reference_id = Column(String) # Purchase batch or sales order id
+    reason = Column(String)
+    created_at = Column(DateTime, default=datetime.datetime.now)
+
+    # Stock as of a date reads the movements after a snapshot as two index ranges: by date, and by
+    # append order for back-dated ones (see inventory_ledger.py)
+    __table_args__ = (
+        Index("ix_inventory_movements_product_date_id", "product_id", "movement_date", "id"),
+        Index("ix_inventory_movements_product_id_id", "product_id", "id"),
+    )
+
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+
+    # Stock of one product at the end of snapshot_date, counting movements up to last_movement_id.
+    # "Stock on date X" = latest snapshot before X + the movements after it.
+    product_id = Column(IdType, ForeignKey("products.id"), primary_key=True)
+    snapshot_date = Column(Date, primary_key=True)
+    qty = Column(Integer, default=0)
+    last_movement_id = Column(Integer, default=0)
+
+class InventorySummary(Base):
+    __tablename__ = "inventory_summary"
+
+    # Single row (id 1) of running totals behind GET /inventory/stats.
+    # stock.py applies deltas on every write; a periodic reconciliation recomputes them from products.
+    id = Column(Integer, primary_key=True)
+    product_count = Column(Integer, default=0)
+    total_value_twd = Column(Float, default=0.0)
+    reconciled_at = Column(DateTime)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    # One row per migration applied by migrations.py
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(DateTime, default=datetime.datetime.now)
+
+class SalesDailyTotal(Base):
+    __tablename__ = "sales_daily_totals"
+
+    # Sales per day and platform, kept up to date by sales_rollup.py as orders are written (GET /reports).
+    # Items of undated orders are not rolled up.
+    day = Column(Date, primary_key=True)
+    platform_source = Column(String, primary_key=True)
+    orders = Column(Integer, default=0)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+    cogs = Column(Float, default=0.0)
+
+class SalesDailyProduct(Base):
+    __tablename__ = "sales_daily_products"
+
+    # The same per product (items without a product are only in the totals). Derived data, so no
+    # foreign key: clearing products or sales must not be blocked by it.
+    day = Column(Date, primary_key=True)
+    platform_source = Column(String, primary_key=True)
+    product_id = Column(IdType, primary_key=True)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+    cogs = Column(Float, default=0.0)
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pandas as pd
+
+from order_reader import ORDER_NO_COLUMN
+
+# Check "商品名稱(品名/規格)" first, then "賣場名稱", then generic "商品名稱"
+PRODUCT_NAME_COLUMNS = ["商品名稱(品名/規格)", "賣場名稱", "商品名稱"]
+QTY_COLUMN = "數量"
+UNIT_PRICE_COLUMN = "單價"
+ORDER_DATE_COLUMN = "訂單日期"
+CUSTOMER_COLUMN = "買家會員名稱"
+
+# Columns produced by preprocess_orders, in the order the DB loop unpacks them
+NORMALIZED_COLUMNS = [
+    "order_no",
+    "order_date",
+    "customer_name",
+    "product_name",
+    "qty",
+    "unit_price",
+    "line_revenue",
+]
+
+
+def _clean_text(series: pd.Series) -> pd.Series:
+    # Stripped strings, with blanks turned into NA
+    text = series.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def _clean_numbers(df: pd.DataFrame, column: str, errors: pd.Series) -> pd.Series:
+    """
+    Vectorized clean_number: "1,180" -> 1180.0, empty -> 0.
+    Cells that are not numbers get a message in `errors` (first problem per row wins).
+    """
+    if column not in df.columns:
+        return pd.Series(0.0, index=df.index)
+
+    text = _clean_text(df[column]).str.replace(",", "", regex=False)
+    numbers = pd.to_numeric(text.astype(object), errors="coerce").astype(float)
+
+    invalid = numbers.isna() & text.notna() & errors.isna()
+    if invalid.any():
+        errors[invalid] = f"Invalid number in '{column}': " + text[invalid].astype(str)
+
+    return numbers.fillna(0.0)
+
+
+def _parse_dates(df: pd.DataFrame) -> pd.Series:
+    if ORDER_DATE_COLUMN not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+
+    raw = df[ORDER_DATE_COLUMN]
+    present = raw.notna() & (raw.astype("string").str.strip() != "")
+
+    # One call with format inference; only cells it could not read go through the slow per-element path
+    dates = pd.to_datetime(raw, errors="coerce")
+    retry = present & dates.isna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(raw[retry].astype(str), errors="coerce", format="mixed")
+
+    result = dates.dt.date.astype(object).where(dates.notna(), None)
+    # Unreadable dates fall back to today, blank dates stay empty
+    result[present & dates.isna()] = datetime.now().date()
+    return result
+
+
+def preprocess_orders(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Normalizes a chunk of raw export rows column-wise before the database loop.
+
+    Returns one row per input row with NORMALIZED_COLUMNS plus an `error` column
+    (None, or a message for rows whose numbers could not be read).
+    """
+    out = pd.DataFrame(index=df.index)
+    errors = pd.Series(None, index=df.index, dtype=object)
+
+    out["order_no"] = df[ORDER_NO_COLUMN].astype(str).str.strip()
+    out["order_date"] = _parse_dates(df)
+
+    if CUSTOMER_COLUMN in df.columns:
+        out["customer_name"] = _clean_text(df[CUSTOMER_COLUMN]).fillna("").astype(object)
+    else:
+        out["customer_name"] = ""
+
+    # Coalesce the candidate name columns in priority order
+    product_name = pd.Series(pd.NA, index=df.index, dtype="string")
+    for column in PRODUCT_NAME_COLUMNS:
+        if column in df.columns:
+            product_name = product_name.fillna(_clean_text(df[column]))
+    out["product_name"] = product_name.fillna("Unknown Product").astype(object)
+
+    out["qty"] = _clean_numbers(df, QTY_COLUMN, errors).astype(int)
+    out["unit_price"] = _clean_numbers(df, UNIT_PRICE_COLUMN, errors)
+    out["line_revenue"] = out["qty"] * out["unit_price"]
+
+    out["error"] = errors
+    return out
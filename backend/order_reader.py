@@ -0,0 +1,162 @@
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import UploadFile
+from openpyxl import load_workbook
+
+# Rows per DataFrame chunk handed to the importer.
+# Peak memory while importing is bounded by this, not by the size of the uploaded file.
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+
+# Uploads are copied to disk in blocks of this size instead of `await file.read()`
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+# Maihuobian exports often have metadata rows at the top
+HEADER_SCAN_ROWS = 10
+ORDER_NO_COLUMN = "訂單編號"
+ORDER_NO_COLUMN_SIMPLIFIED = "订单编号"
+
+logger = logging.getLogger("import")
+
+
+async def spool_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Streams an upload to a temporary file and returns (path, sha256 of the content).
+    The caller is responsible for removing the file when done.
+    """
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix)
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                block = await file.read(SPOOL_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+def _is_xlsx(path: str) -> bool:
+    # .xlsx is a zip container; anything else is treated as CSV
+    with open(path, "rb") as f:
+        return f.read(4) == b"PK\x03\x04"
+
+
+def _detect_csv_encoding(path: str) -> str:
+    with open(path, "rb") as f:
+        sample = f.read(SPOOL_BLOCK_SIZE)
+    try:
+        sample.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as e:
+        # A multi-byte char cut at the end of the sample is still valid UTF-8
+        if e.start >= len(sample) - 3:
+            return "utf-8-sig"
+        return "cp950"  # Big5 exports from Taiwanese platforms
+
+
+def iter_rows(path: str) -> Iterator[tuple]:
+    """Yields raw row tuples one at a time (read-only openpyxl for .xlsx, csv module otherwise)."""
+    if _is_xlsx(path):
+        workbook = load_workbook(path, read_only=True, data_only=True)
+        try:
+            for row in workbook.active.iter_rows(values_only=True):
+                yield row
+        finally:
+            workbook.close()
+    else:
+        with open(path, newline="", encoding=_detect_csv_encoding(path)) as f:
+            for row in csv.reader(f):
+                # Empty CSV cells behave like empty Excel cells
+                yield tuple(v if v.strip() != "" else None for v in row)
+
+
+def normalize_columns(row: tuple) -> List[str]:
+    # Mirrors pandas: strip names, "Unnamed: i" for blanks, "name.1" for duplicates
+    columns = []
+    seen = {}
+    for i, value in enumerate(row):
+        name = str(value).strip() if value is not None else ""
+        if not name:
+            name = f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
+
+
+def clean_number(val):
+    """Cleans number strings like "1,180". Empty cells count as 0."""
+    if pd.isna(val): return 0
+    if isinstance(val, (int, float)): return val
+    return float(str(val).replace(',', '').strip())
+
+
+def find_header(rows: Iterator[tuple]) -> List[str]:
+    """Consumes rows until the one containing '訂單編號' and returns it as column names."""
+    for _ in range(HEADER_SCAN_ROWS):
+        row = next(rows, None)
+        if row is None:
+            break
+        cells = [str(v) for v in row if v is not None]
+        if any(ORDER_NO_COLUMN in c or ORDER_NO_COLUMN_SIMPLIFIED in c for c in cells):
+            columns = normalize_columns(row)
+            logger.debug("Found columns: %s", columns)
+            if ORDER_NO_COLUMN not in columns:
+                if ORDER_NO_COLUMN_SIMPLIFIED not in columns:
+                    raise ValueError(f"Required column '{ORDER_NO_COLUMN}' not found. Found columns: {columns}")
+                # Simplified Chinese export: remap so downstream code only knows one name
+                columns[columns.index(ORDER_NO_COLUMN_SIMPLIFIED)] = ORDER_NO_COLUMN
+            return columns
+
+    raise ValueError(f"Could not find header row containing '{ORDER_NO_COLUMN}' in the first {HEADER_SCAN_ROWS} rows.")
+
+
+def iter_order_chunks(path: str, chunk_size: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Streams the file once and yields DataFrames of roughly `chunk_size` rows.
+
+    Rows of one order are listed next to each other in the exports, so a chunk is only
+    cut where the order number changes: every order group arrives whole in one chunk.
+    (In a file where they are not, rows after the gap can land in a later chunk; the
+    importer reports that order as an error.)
+    Rows without an order number (blank or footer rows) are dropped.
+    """
+    chunk_size = chunk_size or IMPORT_CHUNK_SIZE
+    rows = iter_rows(path)
+    columns = find_header(rows)
+    width = len(columns)
+    key_index = columns.index(ORDER_NO_COLUMN)
+
+    buffer = []
+    last_order_no = None
+    for row in rows:
+        row = list(row[:width]) + [None] * (width - len(row))
+        order_no = row[key_index]
+        if order_no is None or not str(order_no).strip():
+            continue
+        order_no = str(order_no).strip()
+        row[key_index] = order_no
+
+        if len(buffer) >= chunk_size and order_no != last_order_no:
+            yield pd.DataFrame(buffer, columns=columns)
+            buffer = []
+
+        buffer.append(row)
+        last_order_no = order_no
+
+    if buffer:
+        yield pd.DataFrame(buffer, columns=columns)
@@ -0,0 +1,90 @@
+import os
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+# Bundle names like "23A 1盒 23C 1盒" repeat thousands of times in one export,
+# so parsed results are memoized on the raw name.
+PARSE_CACHE_SIZE = int(os.getenv("PRODUCT_NAME_CACHE_SIZE", "4096"))
+
+EACH_PATTERN = re.compile(r"各(\d+)")
+# Non-greedy name, space(optional), digits, specific units
+UNIT_QTY_PATTERN = re.compile(r"(.+?)\s*(\d+)\s*[盒個張套組支本]")
+TAIL_QTY_PATTERN = re.compile(r"^(.+?)\s+(\d+)$")
+
+
+class ParsedItem(NamedTuple):
+    name: str
+    qty: int
+
+
+def parse_product_name(raw) -> Tuple[ParsedItem, ...]:
+    """
+    Parses strings like:
+    1. "ItemA 26張" -> [("ItemA", 26)]
+    2. "ItemA+ItemB" -> [("ItemA", 1), ("ItemB", 1)]
+    3. "ItemA+ItemB 各1" -> [("ItemA", 1), ("ItemB", 1)]
+    4. "23A 1盒 23C 1盒" -> [("23A", 1), ("23C", 1)]
+    5. "23A epick 兩盒" -> [("23A epick", 2)]
+    6. "A+B+C Suffix" -> ["A Suffix", "B Suffix", "C Suffix"]
+    7. "Group1 / Group2" -> Parse both
+
+    Results are tuples so the cached value can be shared safely between callers.
+    """
+    if not raw: return ()
+    return _parse_cached(str(raw).strip())
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_cached(raw: str) -> Tuple[ParsedItem, ...]:
+    # 0. Split by '/' first (distinct groups)
+    if '/' in raw:
+        results = []
+        for p in raw.split('/'):
+            results.extend(parse_product_name(p))
+        return tuple(results)
+
+    # 1. Normalize chinese numbers ("兩盒" -> " 2盒")
+    raw = raw.replace("兩", " 2")
+
+    # 2. Check global "Each" (各)
+    default_qty = 1
+    each_match = EACH_PATTERN.search(raw)
+    if each_match:
+        default_qty = int(each_match.group(1))
+        raw = raw.replace(each_match.group(0), " ") # Remove "各1"
+
+    # 3. Split by '+'
+    # Logic for "A+B+C Suffix":
+    # If split by +, and the LAST part contains a space, we treat the part after space as strict suffix
+    # for previous parts that DO NOT have space.
+    parts = [p.strip() for p in raw.split('+') if p.strip()]
+
+    if len(parts) > 1:
+        last_part = parts[-1]
+        # We use strict check: Must have space, and we take everything after first space as suffix
+        if ' ' in last_part:
+            suffix = ' ' + last_part.split(' ', 1)[1] # Keep space for appending
+            parts = [p + suffix if ' ' not in p else p for p in parts[:-1]] + [last_part]
+
+    parsed_items = []
+
+    for part in parts:
+        # 4. For each part, looks for specific patterns "Name QtyUnit"
+        # We use findall to catch "23A 1盒 23C 1盒" inside one part if no + exists
+        matches = UNIT_QTY_PATTERN.findall(part)
+
+        if matches:
+            # If we found explicit sub-items
+            for name, qty in matches:
+                parsed_items.append(ParsedItem(name.strip(), int(qty)))
+        else:
+            # No explicit unit pattern found, check simple tail digit "Name 26"
+            simple_match = TAIL_QTY_PATTERN.search(part)
+            if simple_match:
+                parsed_items.append(ParsedItem(simple_match.group(1).strip(), int(simple_match.group(2))))
+            else:
+                # Fallback: Whole part is name, use default/each qty
+                parsed_items.append(ParsedItem(part, default_qty))
+
+    return tuple(parsed_items)
@@ -0,0 +1,158 @@
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import schemas
+import stock
+from database import chunked
+from models import Product, generate_uuid
+from order_reader import HEADER_SCAN_ROWS, clean_number, iter_rows, normalize_columns
+
+# Supplier invoices name their columns differently; the first alias present wins
+SKU_COLUMNS = ["商品編號", "SKU", "JAN", "品號"]
+NAME_COLUMNS = ["商品名稱", "品名"]
+QTY_COLUMNS = ["數量"]
+UNIT_PRICE_COLUMNS = ["單價(JPY)", "日幣單價", "單價"]
+WEIGHT_COLUMNS = ["單件重量(g)", "重量(g)", "重量"]
+
+
+def _pick(columns: List[str], aliases: List[str]) -> Optional[int]:
+    for alias in aliases:
+        if alias in columns:
+            return columns.index(alias)
+    return None
+
+
+def _find_header(rows: Iterator[tuple]) -> List[str]:
+    """Consumes rows until the one containing '數量' and returns it as column names."""
+    for _ in range(HEADER_SCAN_ROWS):
+        row = next(rows, None)
+        if row is None:
+            break
+        columns = normalize_columns(row)
+        if _pick(columns, QTY_COLUMNS) is not None:
+            return columns
+
+    raise ValueError(f"Could not find header row containing '{QTY_COLUMNS[0]}' in the first {HEADER_SCAN_ROWS} rows.")
+
+
+def _cell(row: tuple, index: Optional[int]):
+    if index is None or index >= len(row):
+        return None
+    return row[index]
+
+
+def _number(row: tuple, index: Optional[int], column: str, line: int) -> int:
+    try:
+        return int(round(clean_number(_cell(row, index))))
+    except ValueError:
+        raise ValueError(f"Row {line}: invalid number in '{column}': {_cell(row, index)}")
+
+
+def read_purchase_lines(file_path: str) -> List[Dict]:
+    """
+    Reads a supplier spreadsheet (.xlsx or .csv) into purchase lines:
+    {"sku", "name", "qty", "unit_price_jpy", "item_weight_g"}.
+    Rows without a SKU/name or a quantity (blank, subtotal or footer rows) are skipped.
+    """
+    rows = iter_rows(file_path)
+    columns = _find_header(rows)
+
+    sku_index = _pick(columns, SKU_COLUMNS)
+    name_index = _pick(columns, NAME_COLUMNS)
+    if sku_index is None and name_index is None:
+        raise ValueError(f"Need a product column ({NAME_COLUMNS[0]} or {SKU_COLUMNS[0]}). Found columns: {columns}")
+    qty_index = _pick(columns, QTY_COLUMNS)
+    price_index = _pick(columns, UNIT_PRICE_COLUMNS)
+    weight_index = _pick(columns, WEIGHT_COLUMNS)
+
+    lines = []
+    # Errors name the data row (1 = first row under the header)
+    for line, row in enumerate(rows, start=1):
+        sku = _cell(row, sku_index)
+        name = _cell(row, name_index)
+        sku = str(sku).strip() if sku is not None else ""
+        name = str(name).strip() if name is not None else ""
+        if not sku and not name:
+            continue
+
+        qty = _number(row, qty_index, QTY_COLUMNS[0], line)
+        if qty <= 0:
+            continue
+
+        lines.append({
+            "sku": sku or None,
+            "name": name or sku,
+            "qty": qty,
+            "unit_price_jpy": _number(row, price_index, UNIT_PRICE_COLUMNS[-1], line),
+            "item_weight_g": _number(row, weight_index, WEIGHT_COLUMNS[-1], line),
+        })
+
+    if not lines:
+        raise ValueError("No purchase lines found in file.")
+    return lines
+
+
+async def resolve_products(db: AsyncSession, lines: List[Dict]) -> Dict[str, int]:
+    """
+    Sets `product_id` on every line: matched by SKU first, then by name.
+    Products that do not exist yet are inserted in one statement (not committed).
+    Lookups go in chunks of LOOKUP_CHUNK_SIZE, so large invoices stay under the parameter limit.
+    """
+    skus = {line["sku"] for line in lines if line["sku"]}
+    names = {line["name"] for line in lines}
+
+    by_sku, by_name = {}, {}
+    for chunk in chunked(skus):
+        result = await db.execute(select(Product.id, Product.sku).where(Product.sku.in_(chunk)))
+        by_sku.update({row.sku: row.id for row in result.all()})
+    for chunk in chunked(names):
+        result = await db.execute(select(Product.id, Product.name).where(Product.name.in_(chunk)))
+        for row in result.all():
+            by_name.setdefault(row.name, row.id)  # First match wins, as in the sales importer
+
+    new_rows = []
+    for line in lines:
+        product_id = by_sku.get(line["sku"]) if line["sku"] else None
+        if product_id is None:
+            product_id = by_name.get(line["name"])
+        if product_id is None:
+            product_id = generate_uuid()
+            new_rows.append({"id": product_id, "sku": line["sku"], "name": line["name"], "current_qty": 0})
+            if line["sku"]:
+                by_sku[line["sku"]] = product_id
+            by_name[line["name"]] = product_id
+        line["product_id"] = product_id
+
+    if new_rows:
+        await db.execute(insert(Product), new_rows)
+        await stock.update_summary(db, products_added=len(new_rows))
+    return {"created_products": len(new_rows)}
+
+
+async def import_purchase_batch(db: AsyncSession, lines: List[Dict], header: Dict):
+    """
+    Creates a purchase batch from parsed lines through crud.create_purchase_batch, so uploaded
+    invoices get the same exchange-rate and shipping-per-gram costing as manual entries.
+    `total_jpy` defaults to the invoice's own sum when not given.
+    """
+    await resolve_products(db, lines)
+
+    if header.get("total_jpy") is None:
+        header["total_jpy"] = sum(line["qty"] * line["unit_price_jpy"] for line in lines)
+
+    batch = schemas.PurchaseBatchCreate(
+        **header,
+        items=[
+            schemas.PurchaseItemCreate(
+                product_id=line["product_id"],
+                qty=line["qty"],
+                unit_price_jpy=line["unit_price_jpy"],
+                item_weight_g=line["item_weight_g"],
+            )
+            for line in lines
+        ],
+    )
+    return await crud.create_purchase_batch(db, batch)
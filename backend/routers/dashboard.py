@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from typing import Optional
+import database
+import schemas
+import crud
+import stock
+
+router = APIRouter(
+    prefix="/dashboard",
+    tags=["dashboard"],
+)
+
+DEFAULT_WINDOW_DAYS = 30
+
+@router.get("/summary", response_model=schemas.DashboardSummary)
+async def get_dashboard_summary(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    top: int = 5,
+    db: AsyncSession = Depends(database.get_db),
+):
+    """
+    Everything the dashboard shows, aggregated in SQL over [date_from, date_to]
+    (default: the last 30 days). The response size does not grow with the history.
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    window = date_to - date_from
+    previous_to = date_from - timedelta(days=1)
+
+    inventory = await stock.get_summary(db)
+    if inventory is None:
+        inventory = await stock.reconcile_summary(db)
+        await db.commit()
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": await crud.get_sales_totals(db, date_from, date_to),
+        "previous_totals": await crud.get_sales_totals(db, previous_to - window, previous_to),
+        "daily": await crud.get_daily_revenue(db, date_from, date_to),
+        "top_products": await crud.get_top_products(db, date_from, date_to, top),
+        "recent_orders": await crud.get_recent_orders(db),
+        "product_count": inventory["product_count"],
+        "inventory_value_twd": inventory["total_value_twd"],
+        "low_stock_count": await crud.count_low_stock_products(db),
+    }
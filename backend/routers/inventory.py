@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import func
+import os
 import database
-import models
 import schemas
+import stock
+import cost_replay
+import inventory_ledger
+import order_reader
+import stocktake
+from datetime import date
+from typing import Optional
 
 router = APIRouter(
     prefix="/inventory",
@@ -13,43 +19,116 @@ router = APIRouter(
 
 @router.get("/stats")
 async def get_inventory_stats(db: AsyncSession = Depends(database.get_db)):
-    # Total Products
-    result_count = await db.execute(select(func.count(models.Product.id)))
-    total_products = result_count.scalar()
-
-    # Total Stock Value (Sum of Current Qty * Avg Cost)
-    # Note: This is an approximation if using avg_cost
-    result_value = await db.execute(select(func.sum(models.Product.current_qty * models.Product.avg_cost_twd)))
-    total_value = result_value.scalar() or 0.0
+    # Running totals kept by stock.py, so this is one row read whatever the catalog size.
+    # Total Stock Value = Sum of Current Qty * Avg Cost (an approximation if using avg_cost)
+    summary = await stock.get_summary(db)
+    if summary is None:
+        # First call on this database: compute the totals once
+        summary = await stock.reconcile_summary(db)
+        await db.commit()
 
     return {
-        "total_active_products": total_products,
-        "total_inventory_value_twd": total_value
+        "total_active_products": summary["product_count"],
+        "total_inventory_value_twd": summary["total_value_twd"]
     }
 
+@router.post("/stats/reconcile")
+async def reconcile_inventory_stats(db: AsyncSession = Depends(database.get_db)):
+    """Recomputes the stats totals from products (also done periodically) and reports the drift fixed."""
+    summary = await stock.reconcile_summary(db)
+    await db.commit()
+    return summary
+
 @router.post("/adjust")
 async def adjust_inventory(adjustment: schemas.InventoryAdjustmentCreate, db: AsyncSession = Depends(database.get_db)):
-    # Get Product
-    result = await db.execute(select(models.Product).filter(models.Product.id == adjustment.product_id))
-    product = result.scalars().first()
-    
-    if not product:
+    # Update Qty in one atomic statement, so concurrent adjustments/imports are never lost
+    # The change and its reason are recorded in the inventory ledger
+    new_qty = await stock.adjust_stock(db, adjustment.product_id, adjustment.change_qty, adjustment.reason)
+    if new_qty is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    # Update Qty
-    if product.current_qty is None:
-        product.current_qty = 0
-    
-    product.current_qty += adjustment.change_qty
-    
-    # Optional: Log reason to a new table 'InventoryLog' if needed in future
-    # for now, just update state
-    
-    db.add(product)
     await db.commit()
-    await db.refresh(product)
-    
-    return {"message": "Inventory updated", "new_qty": product.current_qty}
+
+    return {"message": "Inventory updated", "new_qty": new_qty}
+
+@router.post("/stocktake", response_model=schemas.StocktakeReport)
+async def apply_stocktake(stocktake_request: schemas.StocktakeRequest, dry_run: bool = False, db: AsyncSession = Depends(database.get_db)):
+    """
+    Sets stock to counted quantities in one transaction and reports the discrepancies.
+    With dry_run, only reports them.
+    """
+    lines = [line.model_dump() for line in stocktake_request.lines]
+    report = await stocktake.apply_stocktake(db, lines, stocktake_request.reason, dry_run)
+    if not dry_run:
+        await db.commit()
+    return report
+
+@router.post("/stocktake/upload", response_model=schemas.StocktakeReport)
+async def upload_stocktake(
+    file: UploadFile = File(...),
+    reason: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    db: AsyncSession = Depends(database.get_db),
+):
+    # Sheet columns: 商品編號 (or 商品ID) and 盤點數量 (or 實際數量 / 數量)
+    file_path, _ = await order_reader.spool_upload(file)
+    try:
+        lines = await run_in_threadpool(stocktake.read_stocktake_lines, file_path)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        # Anything else the reader raises (a damaged .xlsx, an unexpected layout) is still a bad file
+        raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
+    finally:
+        os.remove(file_path)
+
+    report = await stocktake.apply_stocktake(db, lines, reason, dry_run)
+    if not dry_run:
+        await db.commit()
+    return report
+
+@router.get("/stock-as-of")
+async def get_stock_as_of(as_of: date, product_id: Optional[str] = None, db: AsyncSession = Depends(database.get_read_db)):
+    """Stock per product at the end of `as_of`, from the latest snapshot plus the movements after it."""
+    product_ids = [product_id] if product_id else None
+    stock_by_product = await inventory_ledger.stock_as_of(db, as_of, product_ids)
+    if product_id:
+        return {"as_of": as_of, "items": [{"product_id": product_id, "qty": stock_by_product.get(product_id, 0)}]}
+    return {
+        "as_of": as_of,
+        "items": [{"product_id": pid, "qty": qty} for pid, qty in stock_by_product.items()],
+    }
+
+@router.get("/movements")
+async def get_movements(
+    product_id: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """A product's stock movements, newest first, with the balance after each one."""
+    return await inventory_ledger.movement_history(db, product_id, date_from, date_to, limit)
+
+@router.post("/snapshots")
+async def take_snapshots(snapshot_date: Optional[date] = None, db: AsyncSession = Depends(database.get_db)):
+    """Writes stock snapshots now (also done periodically, see INVENTORY_SNAPSHOT_INTERVAL_HOURS)."""
+    result = await inventory_ledger.take_snapshots(db, snapshot_date)
+    await db.commit()
+    return result
+
+@router.post("/recalculate-costs")
+async def recalculate_costs(dry_run: bool = False, db: AsyncSession = Depends(database.get_db)):
+    """
+    Rebuilds avg_cost_twd and sales cost snapshots from the purchase/sales history and the ledger,
+    e.g. after a batch's card bill or shipping was corrected or sales were edited.
+    With dry_run, only reports how many rows would change. Products whose replayed qty does not
+    match current_qty are listed and left as they are.
+    """
+    result = await cost_replay.replay_costs(db, dry_run=dry_run)
+    if not dry_run:
+        await db.commit()
+    return result
 
 @router.delete("/clear")
 async def clear_all_data(db: AsyncSession = Depends(database.get_db)):
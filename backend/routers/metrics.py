@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+import database
+import db_metrics
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"],
+)
+
+@router.get("/db")
+def get_db_metrics(top: int = 20):
+    """SQL query counts and timings per route, and the statements with the most total DB time."""
+    return db_metrics.snapshot(top)
+
+@router.delete("/db")
+def reset_db_metrics():
+    db_metrics.reset()
+    return {"message": "DB metrics reset"}
+
+@router.get("/pool")
+def get_pool_metrics():
+    """Connection pool state and checkout waits, per engine (primary and, if configured, replica)."""
+    return {name: db_metrics.pool_stats(db_engine) for name, db_engine in database.engines.items()}
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
+import asyncio
+import json
 import database
 import schemas
 import crud
+import stock_events
 
 router = APIRouter(
     prefix="/products",
@@ -15,11 +19,46 @@ async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depe
     return await crud.create_product(db=db, product=product)
 
 @router.get("/", response_model=List[schemas.Product])
-async def read_products(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)):
+async def read_products(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_read_db)):
     return await crud.get_products(db, skip=skip, limit=limit)
 
+@router.get("/low-stock", response_model=List[schemas.Product])
+async def read_low_stock_products(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_read_db)):
+    # Products below their own reorder_threshold, furthest below first
+    return await crud.get_low_stock_products(db, skip=skip, limit=limit)
+
+SSE_HEARTBEAT_SECONDS = 15
+
+@router.get("/low-stock/events")
+async def low_stock_events(request: Request):
+    """
+    Server-sent events: one "low_stock" event each time a committed sale, import, order edit,
+    purchase or adjustment (or a threshold change) moves a product across its reorder_threshold.
+    """
+    async def stream():
+        subscriber = stock_events.subscribe()
+        try:
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(subscriber.get(), SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n" # Comment line, keeps proxies from closing the stream
+                    continue
+                yield f"event: low_stock\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+        finally:
+            stock_events.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@router.put("/{product_id}/reorder-threshold", response_model=schemas.Product)
+async def update_reorder_threshold(product_id: str, update: schemas.ReorderThresholdUpdate, db: AsyncSession = Depends(database.get_db)):
+    db_product = await crud.set_reorder_threshold(db, product_id, update.reorder_threshold)
+    if db_product is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return db_product
+
 @router.get("/{product_id}", response_model=schemas.Product)
-async def read_product(product_id: str, db: AsyncSession = Depends(database.get_db)):
+async def read_product(product_id: str, db: AsyncSession = Depends(database.get_read_db)):
     db_product = await crud.get_product(db, product_id=product_id)
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
+from datetime import date
+import os
 import database
 import schemas
 import crud
+import exports
+import order_reader
+import purchase_import
 
 router = APIRouter(
     prefix="/purchases",
@@ -12,8 +19,56 @@ router = APIRouter(
 
 @router.post("/", response_model=schemas.PurchaseBatch)
 async def create_purchase_batch(batch: schemas.PurchaseBatchCreate, db: AsyncSession = Depends(database.get_db)):
-    return await crud.create_purchase_batch(db=db, batch=batch)
+    try:
+        return await crud.create_purchase_batch(db=db, batch=batch)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 @router.get("/", response_model=List[schemas.PurchaseBatch])
-async def read_purchase_batches(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)):
+async def read_purchase_batches(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_read_db)):
     return await crud.get_purchase_batches(db, skip=skip, limit=limit)
+
+@router.get("/export")
+async def export_purchases(format: Literal["csv", "xlsx"] = "csv", date_from: Optional[date] = None, date_to: Optional[date] = None):
+    # One row per purchase item, with its batch date and source, streamed in partitions
+    return StreamingResponse(
+        exports.stream(format, exports.PURCHASE_HEADERS, exports.purchases_export_query(date_from, date_to)),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{exports.filename("purchases", format)}"'},
+    )
+
+@router.post("/upload", response_model=schemas.PurchaseBatch)
+async def upload_purchase_excel(
+    file: UploadFile = File(...),
+    purchase_date: date = Form(...),
+    source: str = Form(...),
+    currency: str = Form("JPY"),
+    total_jpy: Optional[int] = Form(None),
+    total_twd_card_bill: int = Form(...),
+    total_twd_foreign_fee: int = Form(0),
+    total_shipping_twd: int = Form(0),
+    db: AsyncSession = Depends(database.get_db),
+):
+    # Supplier spreadsheet columns: 商品編號/商品名稱, 數量, 單價 (JPY), 重量 (g).
+    # Unknown products are created; costing is the same as POST /purchases/.
+    file_path, _ = await order_reader.spool_upload(file)
+    try:
+        lines = await run_in_threadpool(purchase_import.read_purchase_lines, file_path)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        # Anything else the reader raises (a damaged .xlsx, an unexpected layout) is still a bad file
+        raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
+    finally:
+        os.remove(file_path)
+
+    header = {
+        "purchase_date": purchase_date,
+        "source": source,
+        "currency": currency,
+        "total_jpy": total_jpy,
+        "total_twd_card_bill": total_twd_card_bill,
+        "total_twd_foreign_fee": total_twd_foreign_fee,
+        "total_shipping_twd": total_shipping_twd,
+    }
+    return await purchase_import.import_purchase_batch(db, lines, header)
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date, timedelta
+from typing import Literal, Optional
+import database
+import schemas
+import sales_rollup
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"],
+)
+
+DEFAULT_WINDOW_DAYS = 30
+
+@router.get("/profit", response_model=schemas.ProfitReport)
+async def get_profit_report(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    group_by: Literal["day", "week", "month", "platform", "product"] = "day",
+    platform_source: Optional[str] = None,
+    limit: int = 100,
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    """
+    Revenue, COGS, gross margin and units over [date_from, date_to] (default: the last 30 days),
+    per day, week, month, platform or product (top `limit` by revenue). Read from the daily rollups.
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    return await sales_rollup.profit_report(db, date_from, date_to, group_by, platform_source, limit)
+
+@router.post("/rebuild")
+async def rebuild_rollups(date_from: Optional[date] = None, date_to: Optional[date] = None,
+                          db: AsyncSession = Depends(database.get_db)):
+    """Recomputes the rollups from the sales items (all of them, or a date range)."""
+    result = await sales_rollup.rebuild(db, date_from, date_to)
+    await db.commit()
+    return result
@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List
+from typing import List, Literal, Optional
+import os
 import database
 import schemas
 import crud
-import import_service
+import exports
+import import_jobs
+import order_reader
 
 router = APIRouter(
     prefix="/sales",
@@ -18,24 +22,95 @@ async def create_sales_order(order: schemas.OrderCreate, db: AsyncSession = Depe
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/batch", response_model=schemas.OrderBatchResponse)
+async def create_sales_orders_batch(batch: schemas.OrderBatchCreate, commit_every: Optional[int] = None, db: AsyncSession = Depends(database.get_db)):
+    # One product lookup and bulk inserts for the whole batch; each order succeeds or fails on its own
+    results = await crud.create_sales_orders(db, batch.orders, commit_every=commit_every)
+    created = sum(1 for r in results if r["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
 @router.get("/", response_model=List[schemas.Order])
-async def read_sales_orders(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)):
-    return await crud.get_sales_orders(db, skip=skip, limit=limit)
+async def read_sales_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filters: schemas.SalesOrderFilter = Depends(),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    # Newest first. When there are more orders, X-Next-Cursor holds the cursor for the next page.
+    try:
+        orders, next_cursor = await crud.get_sales_orders(db, skip=skip, limit=limit, filters=filters, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
 
-@router.post("/upload")
-async def upload_sales_excel(file: UploadFile = File(...), db: AsyncSession = Depends(database.get_db)):
-    content = await file.read()
+@router.get("/summary", response_model=List[schemas.OrderSummary])
+async def read_sales_order_summaries(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    filters: schemas.SalesOrderFilter = Depends(),
+    db: AsyncSession = Depends(database.get_read_db),
+):
+    # Same listing as GET /sales/ with totals only: no items or products are loaded or sent
     try:
-        # Use the new service that handles parsing and saving with correct column mapping
-        result = await import_service.parse_and_save_orders(db, content)
-        return {"status": "success", "result": result}
-        
-    except ValueError as ve:
-         # This catches missing columns errors
-        raise HTTPException(status_code=400, detail=str(ve))
-    except Exception as e:
-        print(f"Upload error: {e}")
-        raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
+        orders, next_cursor = await crud.get_sales_orders(
+            db, skip=skip, limit=limit, filters=filters, cursor=cursor, with_items=False
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
+
+@router.get("/count")
+async def count_sales_orders(filters: schemas.SalesOrderFilter = Depends(), db: AsyncSession = Depends(database.get_read_db)):
+    return {"total": await crud.count_sales_orders(db, filters)}
+
+@router.get("/export")
+async def export_sales_orders(format: Literal["csv", "xlsx"] = "csv", filters: schemas.SalesOrderFilter = Depends()):
+    # One row per item with the Maihuobian headers (re-uploadable through /sales/upload), streamed in partitions
+    return StreamingResponse(
+        exports.stream(format, exports.SALES_HEADERS, exports.sales_export_query(filters)),
+        media_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{exports.filename("sales", format)}"'},
+    )
+
+@router.post("/upload")
+async def upload_sales_excel(file: UploadFile = File(...), preview: bool = False, db: AsyncSession = Depends(database.get_db)):
+    # Spool to disk in blocks instead of holding the whole upload in memory
+    file_path, file_hash = await order_reader.spool_upload(file)
+
+    if preview:
+        # Dry run: new/skipped orders, auto-created products and stock impact, nothing written
+        try:
+            result = await import_jobs.preview(db, file_path, file_hash)
+            return {"status": "preview", "result": schemas.ImportPreview(**result)}
+        except ValueError as ve:
+            # This catches missing columns errors
+            raise HTTPException(status_code=400, detail=str(ve))
+        except Exception as e:
+            # Anything else the readers raise (a damaged .xlsx, an unexpected layout) is still a bad file
+            raise HTTPException(status_code=400, detail=f"Failed to process file: {str(e)}")
+        finally:
+            os.remove(file_path)
+
+    # Parsing and saving run as a background job; poll /sales/imports/{job_id} for progress.
+    # Re-uploading a file whose import failed resumes from its last committed order,
+    # and a file that was already imported completely returns right away.
+    job = import_jobs.submit(file_path, file.filename, file_hash)
+    return {"status": "accepted", "job_id": job.id}
+
+@router.get("/imports/{job_id}", response_model=schemas.ImportJob)
+async def read_import_job(job_id: str):
+    job = import_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
 
 @router.put("/{order_id}/items", response_model=schemas.Order)
 async def update_order_items(order_id: str, updates: schemas.OrderUpdateItems, db: AsyncSession = Depends(database.get_db)):
@@ -54,3 +129,11 @@ async def delete_all_orders(db: AsyncSession = Depends(database.get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+# Declared last so it does not shadow /summary, /count, /export and /imports
+@router.get("/{order_id}", response_model=schemas.Order)
+async def read_sales_order(order_id: str, db: AsyncSession = Depends(database.get_read_db)):
+    order = await crud.get_sales_order(db, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
@@ -0,0 +1,206 @@
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Date, cast, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Product, SalesDailyProduct, SalesDailyTotal, SalesItem, SalesOrder
+
+# Daily rollups behind GET /reports: revenue, COGS and units per (day, platform) and per
+# (day, platform, product). Every write to sales items applies its delta here in the same
+# transaction, as an atomic upsert increment (concurrent writers cannot overwrite each other),
+# like stock.py does for inventory_summary. rebuild() recomputes them from sales_items; it runs
+# periodically and after bulk changes, so any drift is corrected.
+# Revenue is qty * unit_price_sold and COGS qty * historical_cost_basis (missing basis = 0),
+# the same as the dashboard.
+
+totals = SalesDailyTotal.__table__
+by_product = SalesDailyProduct.__table__
+MEASURES = ("orders", "units", "revenue", "cogs")
+
+
+def line(day: Optional[datetime.date], platform_source: Optional[str], product_id: Optional[str] = None,
+         orders: int = 0, units: int = 0, revenue: float = 0.0, cogs: float = 0.0) -> Dict:
+    """One change to the rollups. Lines without a day are ignored; without a product, only the totals change."""
+    return {"day": day, "platform_source": platform_source or "", "product_id": product_id,
+            "orders": orders, "units": units, "revenue": revenue, "cogs": cogs}
+
+
+def item_line(day, platform_source, product_id, qty, unit_price, cost_basis) -> Dict:
+    qty = qty or 0
+    return line(day, platform_source, product_id, units=qty, revenue=qty * (unit_price or 0), cogs=qty * (cost_basis or 0))
+
+
+def order_lines(day, platform_source, items: Iterable) -> List[Dict]:
+    """A new order: one order plus its (product_id, qty, unit_price, cost_basis) items."""
+    return [line(day, platform_source, orders=1)] + [item_line(day, platform_source, *item) for item in items]
+
+
+def _upsert(dialect_name: str, table, key: List[str], measures: List[str]):
+    insert_ = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert_(table)
+    return stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={name: table.c[name] + stmt.excluded[name] for name in measures},
+    )
+
+
+async def apply(db: AsyncSession, lines: List[Dict]):
+    """Adds the lines to the rollups (not committed; the caller commits): one upsert executemany per table."""
+    day_totals = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    product_totals = defaultdict(lambda: dict.fromkeys(MEASURES[1:], 0))
+    for change in lines:
+        if change["day"] is None:
+            continue
+        key = (change["day"], change["platform_source"])
+        for name in MEASURES:
+            day_totals[key][name] += change[name]
+        if change["product_id"] is not None:
+            for name in MEASURES[1:]:
+                product_totals[key + (change["product_id"],)][name] += change[name]
+
+    dialect_name = db.bind.dialect.name
+    rows = [{"day": day, "platform_source": platform, **values} for (day, platform), values in day_totals.items() if any(values.values())]
+    if rows:
+        await db.execute(_upsert(dialect_name, totals, ["day", "platform_source"], list(MEASURES)), rows)
+    rows = [
+        {"day": day, "platform_source": platform, "product_id": product_id, **values}
+        for (day, platform, product_id), values in product_totals.items() if any(values.values())
+    ]
+    if rows:
+        await db.execute(_upsert(dialect_name, by_product, ["day", "platform_source", "product_id"], list(MEASURES[1:])), rows)
+
+
+def rebuild_statements(date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> list:
+    """DELETE + INSERT ... SELECT per rollup table, for the whole history or a date range."""
+    order, item = SalesOrder, SalesItem
+    day, platform = order.order_date, func.coalesce(order.platform_source, "")
+    units = func.coalesce(func.sum(item.qty), 0)
+    revenue = func.coalesce(func.sum(item.qty * item.unit_price_sold), 0.0)
+    cogs = func.coalesce(func.sum(item.qty * func.coalesce(item.historical_cost_basis, 0)), 0.0)
+
+    conditions = [day.is_not(None)]
+    if date_from:
+        conditions.append(day >= date_from)
+    if date_to:
+        conditions.append(day <= date_to)
+
+    # Orders without items still count as orders, hence the outer join
+    day_select = (
+        select(day, platform, func.count(func.distinct(order.id)), units, revenue, cogs)
+        .select_from(order).outerjoin(item, item.order_id == order.id)
+        .where(*conditions)
+        .group_by(day, platform)
+    )
+    product_select = (
+        select(day, platform, item.product_id, units, revenue, cogs)
+        .select_from(order).join(item, item.order_id == order.id)
+        .where(*conditions, item.product_id.is_not(None))
+        .group_by(day, platform, item.product_id)
+    )
+
+    statements = []
+    for table, query, columns in (
+        (totals, day_select, ["day", "platform_source", *MEASURES]),
+        (by_product, product_select, ["day", "platform_source", "product_id", *MEASURES[1:]]),
+    ):
+        cleared = delete(table)
+        if date_from:
+            cleared = cleared.where(table.c.day >= date_from)
+        if date_to:
+            cleared = cleared.where(table.c.day <= date_to)
+        statements += [cleared, insert(table).from_select(columns, query)]
+    return statements
+
+
+async def rebuild(db: AsyncSession, date_from: Optional[datetime.date] = None, date_to: Optional[datetime.date] = None) -> Dict:
+    """Recomputes the rollups from sales_items (not committed; the caller commits)."""
+    for statement in rebuild_statements(date_from, date_to):
+        await db.execute(statement)
+    return {
+        "day_rows": (await db.execute(select(func.count()).select_from(totals))).scalar(),
+        "product_rows": (await db.execute(select(func.count()).select_from(by_product))).scalar(),
+    }
+
+
+async def clear(db: AsyncSession):
+    await db.execute(delete(totals))
+    await db.execute(delete(by_product))
+
+
+def _period_start(day_column, period: str, dialect_name: str):
+    if period == "day":
+        return day_column
+    if dialect_name == "postgresql":
+        return cast(func.date_trunc(period, day_column), Date)
+    if period == "week":
+        # Monday: 'weekday 0' moves to the next Sunday (or stays on one), then back 6 days
+        return func.date(day_column, "weekday 0", "-6 days")
+    return func.strftime("%Y-%m-01", day_column)
+
+
+def _row(key, label, orders, units, revenue, cogs) -> Dict:
+    revenue, cogs = revenue or 0.0, cogs or 0.0
+    return {
+        "key": key,
+        "label": label,
+        "orders": orders,
+        "units": units or 0,
+        "revenue": revenue,
+        "cogs": cogs,
+        "margin": revenue - cogs,
+        "margin_pct": round((revenue - cogs) / revenue * 100, 2) if revenue else None,
+    }
+
+
+async def profit_report(db: AsyncSession, date_from: datetime.date, date_to: datetime.date, group_by: str = "day",
+                        platform_source: Optional[str] = None, limit: int = 100) -> Dict:
+    """
+    Revenue, COGS, margin and units between two dates (inclusive), grouped by day, week (starting Monday),
+    month, platform or product. Reads the rollups only: a year by month is at most 366 rows per platform.
+    """
+    def window(table):
+        conditions = [table.c.day >= date_from, table.c.day <= date_to]
+        if platform_source is not None:
+            conditions.append(table.c.platform_source == platform_source)
+        return conditions
+
+    sums = [func.sum(totals.c[name]) for name in MEASURES]
+    total = (await db.execute(select(*sums).where(*window(totals)))).one()
+
+    if group_by == "product":
+        product_sums = [func.sum(by_product.c[name]).label(name) for name in MEASURES[1:]]
+        grouped = (
+            select(by_product.c.product_id, *product_sums)
+            .where(*window(by_product))
+            .group_by(by_product.c.product_id)
+            .order_by(product_sums[1].desc())
+            .limit(limit)
+            .subquery()
+        )
+        result = await db.execute(
+            select(grouped, Product.name)
+            .outerjoin(Product, Product.id == grouped.c.product_id)
+            .order_by(grouped.c.revenue.desc())
+        )
+        rows = [_row(r.product_id, r.name, None, r.units, r.revenue, r.cogs) for r in result.all()]
+    else:
+        if group_by == "platform":
+            key = totals.c.platform_source
+        else:
+            key = _period_start(totals.c.day, group_by, db.bind.dialect.name)
+        result = await db.execute(
+            select(key.label("key"), *sums).where(*window(totals)).group_by(key).order_by(key)
+        )
+        rows = [_row(str(r[0]), str(r[0]), *r[1:]) for r in result.all()]
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "group_by": group_by,
+        "platform_source": platform_source,
+        "totals": _row("total", "total", *total),
+        "rows": rows,
+    }
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import date
+from datetime import date, datetime
 import uuid
 
 # --- Products ---
@@ -10,6 +10,7 @@ class ProductBase(BaseModel):
     weight_g: int = 0
     cost_price: float = 0.0 # This might be computed or initial
     stock_quantity: int = 0
+    reorder_threshold: int = Field(10, ge=0) # Low stock below this qty
 
 class ProductCreate(ProductBase):
     pass
@@ -22,6 +23,9 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ReorderThresholdUpdate(BaseModel):
+    reorder_threshold: int = Field(ge=0)
+
 # --- Purchase Items ---
 class PurchaseItemBase(BaseModel):
     product_id: str
@@ -87,13 +91,44 @@ class OrderBase(BaseModel):
 class OrderCreate(OrderBase):
     items: List[OrderItemCreate]
 
-class Order(OrderBase):
+class SalesOrderFilter(BaseModel):
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    platform_source: Optional[str] = None
+    customer: Optional[str] = None
+    product_id: Optional[str] = None
+    q: Optional[str] = None # Order number or customer name contains
+
+class OrderBatchCreate(BaseModel):
+    orders: List[OrderCreate]
+
+class OrderBatchResult(BaseModel):
+    platform_order_id: str
+    status: str # created | failed
+    order_id: Optional[str] = None
+    error: Optional[str] = None
+
+class OrderBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[OrderBatchResult]
+
+class OrderSummary(OrderBase):
     id: str
-    items: List[OrderItem] = []
+    order_date: Optional[date] = None # Imported orders can have a blank date
+    platform_source: Optional[str] = None
+    # Aggregated by SQL over the order's items
+    item_count: int = 0
+    revenue: float = 0
+    cost: float = 0 # From historical_cost_basis
+    margin: float = 0
 
     class Config:
         from_attributes = True
 
+class Order(OrderSummary):
+    items: List[OrderItem] = []
+
 
 # --- Inventory Adjustment ---
 class InventoryAdjustmentBase(BaseModel):
@@ -104,6 +139,66 @@ class InventoryAdjustmentBase(BaseModel):
 class InventoryAdjustmentCreate(InventoryAdjustmentBase):
     pass
 
+# --- Stocktake ---
+class StocktakeLine(BaseModel):
+    # One of product_id / sku identifies the product
+    product_id: Optional[str] = None
+    sku: Optional[str] = None
+    counted_qty: int = Field(ge=0)
+
+class StocktakeRequest(BaseModel):
+    lines: List[StocktakeLine]
+    reason: Optional[str] = None
+
+class StocktakeDiscrepancy(BaseModel):
+    product_id: str
+    sku: Optional[str] = None
+    name: Optional[str] = None
+    expected_qty: int # current_qty before the count
+    counted_qty: int
+    delta: int
+
+class StocktakeReport(BaseModel):
+    counted_products: int
+    adjusted_products: int
+    unchanged_products: int
+    unmatched: List[Optional[str]] = [] # Lines whose product id / SKU was not found
+    total_delta: int
+    dry_run: bool
+    discrepancies: List[StocktakeDiscrepancy] # Largest differences first
+
+# --- Sales Import Jobs ---
+class ImportJob(BaseModel):
+    id: str
+    filename: Optional[str] = None
+    status: str
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    rows_parsed: int = 0
+    created_orders: int = 0
+    skipped_orders: int = 0
+    created_products: int = 0
+    resumed_after_order: Optional[str] = None
+    duplicate_file: bool = False
+    errors: List[str] = []
+
+class ImportStockChange(BaseModel):
+    product_id: Optional[str] = None # None for products the import would create
+    product_name: str
+    is_new_product: bool
+    current_qty: int
+    qty_delta: int
+    projected_qty: int
+
+class ImportPreview(BaseModel):
+    rows_parsed: int
+    new_orders: int
+    skipped_orders: int
+    new_order_nos: List[str] = []
+    new_products: List[str] = []
+    stock_changes: List[ImportStockChange] = []
+    errors: List[str] = []
+
 class OrderItemUpdate(BaseModel):
     id: str
     quantity: int
@@ -112,3 +207,61 @@ class OrderItemUpdate(BaseModel):
 class OrderUpdateItems(BaseModel):
     items: List[OrderItemUpdate]
 
+
+# --- Dashboard ---
+class SalesTotals(BaseModel):
+    revenue: float
+    cogs: float # From historical_cost_basis
+    margin: float
+    order_count: int
+    units_sold: int
+
+class DailyRevenue(BaseModel):
+    order_date: date
+    revenue: float
+    cogs: float
+    order_count: int
+
+class TopProduct(BaseModel):
+    product_id: str
+    name: Optional[str] = None
+    units_sold: int
+    revenue: float
+    margin: float
+
+class RecentOrder(BaseModel):
+    id: str
+    platform_order_id: str
+    customer_name: Optional[str] = None
+    order_date: Optional[date] = None
+
+class DashboardSummary(BaseModel):
+    date_from: date
+    date_to: date
+    totals: SalesTotals
+    previous_totals: SalesTotals # Same-length window just before date_from, for trends
+    daily: List[DailyRevenue]
+    top_products: List[TopProduct]
+    recent_orders: List[RecentOrder]
+    product_count: int
+    inventory_value_twd: float
+    low_stock_count: int # Below their own reorder_threshold
+
+# --- Reports ---
+class ProfitRow(BaseModel):
+    key: str # Period start (YYYY-MM-DD), platform or product id
+    label: Optional[str] = None # Product name for product rows
+    orders: Optional[int] = None # Not split per product
+    units: int
+    revenue: float
+    cogs: float
+    margin: float
+    margin_pct: Optional[float] = None # None without revenue
+
+class ProfitReport(BaseModel):
+    date_from: date
+    date_to: date
+    group_by: str
+    platform_source: Optional[str] = None
+    totals: ProfitRow
+    rows: List[ProfitRow]
@@ -0,0 +1,259 @@
+import datetime
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Float, bindparam, case, event, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import stock_events
+from database import chunked
+from models import InventoryMovement, InventorySummary, Product
+
+# Every change to Product.current_qty / avg_cost_twd goes through here.
+# Values are computed by the database from the row as it is at write time
+# (never read into Python and written back), so concurrent purchases, sales,
+# order edits, adjustments and imports cannot overwrite each other's changes.
+# Each change is also appended to inventory_movements in the same transaction. Its effect on
+# the stock value is added up on the session and applied to inventory_summary as one UPDATE
+# when the transaction commits, so the single summary row is locked only at the very end.
+# Products moved across their reorder threshold are reported to stock_events once it commits.
+
+products = Product.__table__
+movements_table = InventoryMovement.__table__
+summary = InventorySummary.__table__
+SUMMARY_ID = 1
+_PENDING_SUMMARY_KEY = "inventory_summary"
+_current_qty = func.coalesce(products.c.current_qty, 0)
+_avg_cost = func.coalesce(products.c.avg_cost_twd, 0.0)
+
+
+def movement(product_id: str, qty_change: int, kind: str, movement_date: Optional[datetime.date] = None,
+             reference_id: Optional[str] = None, reason: Optional[str] = None,
+             unit_cost_twd: Optional[float] = None) -> Dict:
+    """One inventory_movements row. Orders without a date are booked on the day they are recorded."""
+    return {
+        "product_id": product_id,
+        "qty_change": qty_change,
+        "kind": kind,
+        "movement_date": movement_date or datetime.date.today(),
+        "reference_id": reference_id,
+        "reason": reason,
+        "unit_cost_twd": unit_cost_twd,
+        "created_at": datetime.datetime.now(),
+    }
+
+
+async def record_movements(db: AsyncSession, rows: List[Dict]):
+    """Appends ledger rows as one executemany INSERT."""
+    rows = [row for row in rows if row["qty_change"]]
+    if rows:
+        await db.execute(insert(movements_table), rows)
+
+
+async def add_stock(db: AsyncSession, movements: Iterable[Dict]):
+    """
+    Applies movements (see movement()): one executemany UPDATE with the summed qty per product,
+    plus one INSERT of the ledger rows.
+    """
+    movements = list(movements)
+    deltas = defaultdict(int)
+    for row in movements:
+        deltas[row["product_id"]] += row["qty_change"]
+    deltas = {product_id: qty for product_id, qty in deltas.items() if qty}
+    if deltas:
+        stmt = (
+            update(products)
+            .where(products.c.id == bindparam("b_product_id"))
+            .values(current_qty=_current_qty + bindparam("b_qty"))
+        )
+        params = [{"b_product_id": product_id, "b_qty": qty} for product_id, qty in deltas.items()]
+        await db.execute(stmt, params)
+        # The average cost does not change, so the value moves by qty * avg cost
+        await update_summary(db, value=await _check_thresholds(db, deltas))
+    await record_movements(db, movements)
+
+
+async def adjust_stock(db: AsyncSession, product_id: str, change_qty: int, reason: Optional[str] = None) -> Optional[int]:
+    """Adds `change_qty` to one product and returns its new quantity (None if the product does not exist)."""
+    result = await db.execute(
+        update(products)
+        .where(products.c.id == product_id)
+        .values(current_qty=_current_qty + change_qty)
+        .returning(products.c.current_qty, products.c.avg_cost_twd, products.c.name, products.c.reorder_threshold)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    await record_movements(db, [movement(product_id, change_qty, "adjustment", reason=reason)])
+    await update_summary(db, value=change_qty * (row.avg_cost_twd or 0.0))
+    new_qty = row.current_qty or 0
+    crossed = stock_events.crossing(product_id, row.name, new_qty - change_qty, new_qty, row.reorder_threshold)
+    if crossed:
+        stock_events.queue(db, [crossed])
+    return row.current_qty
+
+
+async def receive_stock(db: AsyncSession, receipts: Iterable[Tuple[str, int, float, int]],
+                        movement_date: Optional[datetime.date] = None, reference_id: Optional[str] = None):
+    """
+    Books received goods: (product_id, qty, unit_cost_twd, weight_g) per line.
+
+    Weighted Average Formula, evaluated by the database against the current row:
+    New Avg = ((Old Qty * Old Avg) + (New Qty * New Unit Cost)) / (Old Qty + New Qty)
+    Lines run in order, so several lines of one product chain like the old per-item loop.
+    A positive weight replaces the product's weight (latest known weight wins).
+    """
+    receipts = list(receipts)
+    if not receipts:
+        return
+    product_ids = {product_id for product_id, _, _, _ in receipts}
+    value_before = await stock_value(db, product_ids, lock=True)
+    qty = bindparam("b_qty")
+    unit_cost = bindparam("b_unit_cost", type_=Float)
+    weight_g = bindparam("b_weight_g")
+    # Every SET expression reads the row as it was before this UPDATE, whatever order they are
+    # listed in, so the new average is computed from the old current_qty
+    stmt = (
+        update(products)
+        .where(products.c.id == bindparam("b_product_id"))
+        .values(
+            avg_cost_twd=case(
+                (_current_qty + qty > 0, (_current_qty * _avg_cost + qty * unit_cost) / (_current_qty + qty)),
+                else_=products.c.avg_cost_twd,
+            ),
+            current_qty=_current_qty + qty,
+            weight_g=case((weight_g > 0, weight_g), else_=products.c.weight_g),
+        )
+    )
+    await db.execute(stmt, [
+        {"b_product_id": product_id, "b_qty": line_qty, "b_unit_cost": float(cost), "b_weight_g": weight}
+        for product_id, line_qty, cost, weight in receipts
+    ])
+    await update_summary(db, value=await stock_value(db, product_ids) - value_before)
+    received = defaultdict(int)
+    for product_id, line_qty, _, _ in receipts:
+        received[product_id] += line_qty
+    await _check_thresholds(db, received)
+    await record_movements(db, [
+        movement(product_id, line_qty, "purchase", movement_date, reference_id, unit_cost_twd=float(cost))
+        for product_id, line_qty, cost, _ in receipts
+    ])
+
+
+async def _check_thresholds(db: AsyncSession, deltas: Dict[str, int]) -> float:
+    """
+    Compares each product's new qty (read after this transaction updated, and so locked, the row)
+    and its qty before the change against its reorder threshold. The same read gives the avg costs,
+    so it also returns sum(qty delta * avg cost).
+    """
+    product_ids = list(deltas)
+    events = []
+    value = 0.0
+    for chunk in chunked(product_ids):
+        result = await db.execute(
+            select(products.c.id, products.c.name, _current_qty.label("qty"), products.c.reorder_threshold,
+                   _avg_cost.label("avg_cost"))
+            .where(products.c.id.in_(chunk))
+        )
+        for row in result.all():
+            value += deltas[row.id] * row.avg_cost
+            crossed = stock_events.crossing(row.id, row.name, row.qty - deltas[row.id], row.qty, row.reorder_threshold)
+            if crossed:
+                events.append(crossed)
+    stock_events.queue(db, events)
+    return value
+
+
+async def set_avg_costs(db: AsyncSession, costs: Dict[str, float]):
+    """Overwrites avg_cost_twd per product (used by the cost replay)."""
+    if not costs:
+        return
+    value_before = await stock_value(db, costs, lock=True)
+    await db.execute(
+        update(products).where(products.c.id == bindparam("b_id")).values(avg_cost_twd=bindparam("b_cost")),
+        [{"b_id": product_id, "b_cost": cost} for product_id, cost in costs.items()],
+    )
+    await update_summary(db, value=await stock_value(db, costs) - value_before)
+
+
+async def stock_value(db: AsyncSession, product_ids: Iterable[str], lock: bool = False) -> float:
+    """
+    Sum of qty * avg cost over `product_ids`. With lock, the rows are locked (SELECT ... FOR UPDATE,
+    where supported) so the value cannot change before this transaction updates them.
+    """
+    product_ids = list(product_ids)
+    value = 0.0
+    for chunk in chunked(product_ids):
+        stmt = select(_current_qty, _avg_cost).where(products.c.id.in_(chunk))
+        if lock:
+            stmt = stmt.with_for_update()
+        value += sum(qty * cost for qty, cost in (await db.execute(stmt)).all())
+    return value
+
+
+# --- Inventory summary (GET /inventory/stats) ---
+
+async def update_summary(db: AsyncSession, products_added: int = 0, value: float = 0.0):
+    """
+    Adds a delta to the running totals. It is held on the session and applied when the transaction
+    commits (see _apply_summary); until the row exists (first reconcile) that is a no-op.
+    """
+    if not products_added and not value:
+        return
+    pending = db.info.setdefault(_PENDING_SUMMARY_KEY, {"products_added": 0, "value": 0.0})
+    pending["products_added"] += products_added
+    pending["value"] += value
+
+
+@event.listens_for(Session, "before_commit")
+def _apply_summary(session):
+    # One UPDATE of the summary row per transaction, however many writes it made
+    pending = session.info.pop(_PENDING_SUMMARY_KEY, None)
+    if pending and (pending["products_added"] or pending["value"]):
+        session.execute(
+            update(summary)
+            .where(summary.c.id == SUMMARY_ID)
+            .values(
+                product_count=summary.c.product_count + pending["products_added"],
+                total_value_twd=summary.c.total_value_twd + pending["value"],
+            )
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_summary(session):
+    session.info.pop(_PENDING_SUMMARY_KEY, None)
+
+
+async def reset_summary(db: AsyncSession):
+    """All products were deleted."""
+    db.info.pop(_PENDING_SUMMARY_KEY, None)
+    await db.execute(update(summary).where(summary.c.id == SUMMARY_ID).values(product_count=0, total_value_twd=0.0))
+
+
+async def get_summary(db: AsyncSession) -> Optional[Dict]:
+    """The running totals as committed, one primary-key read. None until the first reconcile."""
+    row = (await db.execute(select(summary).where(summary.c.id == SUMMARY_ID))).first()
+    return dict(row._mapping) if row is not None else None
+
+
+async def reconcile_summary(db: AsyncSession) -> Dict:
+    """
+    Recomputes the totals with a full scan of products and overwrites the stored ones in a single
+    statement (not committed; the caller commits). Reports the drift that was corrected.
+    """
+    stored = await get_summary(db)
+    # The recount includes this transaction's own changes
+    db.info.pop(_PENDING_SUMMARY_KEY, None)
+    product_count = select(func.count(products.c.id)).scalar_subquery()
+    total_value = select(func.coalesce(func.sum(_current_qty * _avg_cost), 0.0)).scalar_subquery()
+    values = {"product_count": product_count, "total_value_twd": total_value, "reconciled_at": datetime.datetime.now()}
+    if stored is None:
+        await db.execute(insert(summary).values(id=SUMMARY_ID, product_count=0, total_value_twd=0.0))
+    await db.execute(update(summary).where(summary.c.id == SUMMARY_ID).values(**values))
+
+    result = await get_summary(db)
+    result["product_count_drift"] = result["product_count"] - (stored["product_count"] if stored else 0)
+    result["total_value_drift"] = result["total_value_twd"] - (stored["total_value_twd"] if stored else 0.0)
+    return result
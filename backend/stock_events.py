@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Low-stock threshold crossings, pushed to GET /products/low-stock/events subscribers.
+# stock.py queues events on the session; they are published only once its transaction
+# commits (a rollback drops them), so subscribers never see a change that did not happen.
+# Subscribers are held in this process: run the API as a single worker to use this.
+
+MAX_PENDING_EVENTS = 100  # Per subscriber; a slow client loses the oldest events first
+_PENDING_KEY = "stock_events"
+
+_subscribers: Set[asyncio.Queue] = set()
+
+
+def crossing(product_id: str, name: Optional[str], old_qty: int, new_qty: int, threshold: Optional[int],
+             old_threshold: Optional[int] = None) -> Optional[Dict]:
+    """The event for a product whose stock moved across its threshold, or None if it did not."""
+    if threshold is None:
+        return None
+    old_threshold = threshold if old_threshold is None else old_threshold
+    was_low, is_low = old_qty < old_threshold, new_qty < threshold
+    if was_low == is_low:
+        return None
+    return {
+        "product_id": product_id,
+        "name": name,
+        "status": "low" if is_low else "restocked",
+        "current_qty": new_qty,
+        "reorder_threshold": threshold,
+        "at": datetime.datetime.now().isoformat(),
+    }
+
+
+def queue(db, events: List[Dict]):
+    """Holds events on the session (sync or async) until it commits."""
+    if events:
+        db.info.setdefault(_PENDING_KEY, []).extend(events)
+
+
+def publish(events: List[Dict]):
+    for subscriber in _subscribers:
+        for item in events:
+            if subscriber.full():
+                subscriber.get_nowait()
+            subscriber.put_nowait(item)
+
+
+def subscribe() -> asyncio.Queue:
+    subscriber = asyncio.Queue(MAX_PENDING_EVENTS)
+    _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: asyncio.Queue):
+    _subscribers.discard(subscriber)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    publish(session.info.pop(_PENDING_KEY, []))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session):
+    session.info.pop(_PENDING_KEY, None)
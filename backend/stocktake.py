@@ -0,0 +1,129 @@
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import stock
+from database import chunked
+from models import Product
+from order_reader import HEADER_SCAN_ROWS, clean_number, iter_rows, normalize_columns
+from purchase_import import SKU_COLUMNS, _pick
+
+# Stocktake sheet columns; the first alias present wins
+PRODUCT_ID_COLUMNS = ["商品ID", "product_id"]
+COUNT_COLUMNS = ["盤點數量", "實際數量", "數量"]
+
+def read_stocktake_lines(file_path: str) -> List[Dict]:
+    """
+    Reads a stocktake sheet (.xlsx or .csv) into {"sku", "product_id", "counted_qty"} lines.
+    The header is the first row with a count column (盤點數量 / 實際數量 / 數量); rows without
+    a SKU/product id or with a blank count are skipped.
+    """
+    rows = iter_rows(file_path)
+    columns = None
+    for _ in range(HEADER_SCAN_ROWS):
+        row = next(rows, None)
+        if row is None:
+            break
+        candidate = normalize_columns(row)
+        if _pick(candidate, COUNT_COLUMNS) is not None:
+            columns = candidate
+            break
+    if columns is None:
+        raise ValueError(f"Could not find header row containing '{COUNT_COLUMNS[0]}' in the first {HEADER_SCAN_ROWS} rows.")
+
+    sku_index = _pick(columns, SKU_COLUMNS)
+    id_index = _pick(columns, PRODUCT_ID_COLUMNS)
+    if sku_index is None and id_index is None:
+        raise ValueError(f"Need a product column ({SKU_COLUMNS[0]} or {PRODUCT_ID_COLUMNS[0]}). Found columns: {columns}")
+    count_index = _pick(columns, COUNT_COLUMNS)
+
+    def cell(row, index):
+        if index is None or index >= len(row) or row[index] is None:
+            return None
+        return str(row[index]).strip() or None
+
+    lines = []
+    # Errors name the data row (1 = first row under the header)
+    for line, row in enumerate(rows, start=1):
+        sku, product_id, counted = cell(row, sku_index), cell(row, id_index), cell(row, count_index)
+        if (not sku and not product_id) or counted is None:
+            continue
+        try:
+            counted_qty = int(round(clean_number(counted)))
+        except ValueError:
+            raise ValueError(f"Row {line}: invalid number in '{columns[count_index]}': {counted}")
+        lines.append({"sku": sku, "product_id": product_id, "counted_qty": counted_qty})
+
+    if not lines:
+        raise ValueError("No stocktake lines found in file.")
+    return lines
+
+
+async def _resolve(db: AsyncSession, lines: List[Dict]) -> Dict[str, Dict]:
+    """Products referenced by the lines, keyed by both id and SKU: one query per chunk of keys."""
+    ids = list({line["product_id"] for line in lines if line.get("product_id")})
+    skus = list({line["sku"] for line in lines if line.get("sku") and not line.get("product_id")})
+    found = {}
+    columns = (Product.id, Product.sku, Product.name, Product.current_qty)
+    for keys, column in ((ids, Product.id), (skus, Product.sku)):
+        for chunk in chunked(keys):
+            result = await db.execute(select(*columns).where(column.in_(chunk)))
+            for row in result.all():
+                found[row.id] = row
+                if row.sku:
+                    found[f"sku:{row.sku}"] = row
+    return found
+
+
+async def apply_stocktake(db: AsyncSession, lines: List[Dict], reason: Optional[str] = None, dry_run: bool = False) -> Dict:
+    """
+    Sets stock to the counted quantities (not committed; the caller commits).
+
+    Lines name a product by id or SKU; repeated products (e.g. counted in several locations) are summed.
+    Deltas against current_qty go through stock.add_stock as one bulk update, so they are recorded as
+    "stocktake" movements and a sale committed meanwhile is kept on top of the count.
+    """
+    products = await _resolve(db, lines)
+
+    counted = defaultdict(int)
+    unmatched = []
+    for line in lines:
+        key = line.get("product_id") or f"sku:{line.get('sku')}"
+        row = products.get(key)
+        if row is None:
+            unmatched.append(line.get("product_id") or line.get("sku"))
+            continue
+        counted[row.id] += line["counted_qty"]
+
+    discrepancies = []
+    movements = []
+    for product_id, counted_qty in counted.items():
+        row = products[product_id]
+        expected = row.current_qty or 0
+        delta = counted_qty - expected
+        if delta:
+            discrepancies.append({
+                "product_id": product_id,
+                "sku": row.sku,
+                "name": row.name,
+                "expected_qty": expected,
+                "counted_qty": counted_qty,
+                "delta": delta,
+            })
+            movements.append(stock.movement(product_id, delta, "stocktake", reason=reason or "stocktake"))
+
+    if not dry_run:
+        await stock.add_stock(db, movements)
+
+    discrepancies.sort(key=lambda d: abs(d["delta"]), reverse=True)
+    return {
+        "counted_products": len(counted),
+        "adjusted_products": len(discrepancies),
+        "unchanged_products": len(counted) - len(discrepancies),
+        "unmatched": unmatched,
+        "total_delta": sum(d["delta"] for d in discrepancies),
+        "dry_run": dry_run,
+        "discrepancies": discrepancies,
+    }
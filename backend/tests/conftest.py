@@ -0,0 +1,78 @@
+"""
+Every test runs against a fresh SQLite file migrated to the latest version and an empty import
+cache, both in a temporary directory (DATABASE_URL is read when database.py is imported, so it
+is set here first). Run from backend/:
+    python -m pytest
+"""
+import csv
+import os
+import shutil
+import sys
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="ecommerce-tests-")
+DB_PATH = os.path.join(TEST_DIR, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+os.environ.pop("DATABASE_REPLICA_URL", None)
+os.environ["IMPORT_CACHE_DIR"] = os.path.join(TEST_DIR, "import_cache")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+import crud  # noqa: E402
+import database  # noqa: E402
+import import_cache  # noqa: E402
+import migrations  # noqa: E402
+import schemas  # noqa: E402
+
+ORDER_HEADERS = ["訂單編號", "訂單日期", "買家會員名稱", "商品名稱", "數量", "單價"]
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+async def fresh_database(anyio_backend):
+    await database.engine.dispose()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.remove(DB_PATH + suffix)
+    shutil.rmtree(import_cache.IMPORT_CACHE_DIR, ignore_errors=True)
+    await migrations.upgrade()
+    yield
+    # Pooled connections belong to this test's event loop
+    await database.engine.dispose()
+
+
+@pytest.fixture
+async def db():
+    async with database.SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def make_product(db):
+    async def make(name: str, qty: int = 0, cost: float = 0.0, sku=None, reorder_threshold: int = 10):
+        product = await crud.create_product(db, schemas.ProductCreate(
+            name=name, sku=sku or name, stock_quantity=qty, cost_price=cost, reorder_threshold=reorder_threshold,
+        ))
+        return product.id
+    return make
+
+
+@pytest.fixture
+def orders_csv(tmp_path):
+    """Writes Maihuobian-style rows (order_no, date, customer, product, qty, unit price) to a CSV file."""
+    def write(rows, name: str = "orders.csv", headers=ORDER_HEADERS, preamble=()):
+        path = tmp_path / name
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            for line in preamble:
+                writer.writerow(line)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        return str(path)
+    return write
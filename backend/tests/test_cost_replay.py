@@ -0,0 +1,115 @@
+import datetime
+
+import pytest
+from sqlalchemy import select, update
+
+import cost_replay
+import crud
+import schemas
+import stock
+from models import Product, PurchaseItem, SalesItem
+
+pytestmark = pytest.mark.anyio
+
+DAY = datetime.date(2026, 2, 2)
+
+
+async def purchase(db, product_id: str, qty: int, unit_cost: int, day: datetime.date = DAY) -> str:
+    # Card bill = JPY total, so the unit cost in TWD is the JPY price
+    batch = await crud.create_purchase_batch(db, schemas.PurchaseBatchCreate(
+        purchase_date=day, source="supplier", total_jpy=qty * unit_cost, total_twd_card_bill=qty * unit_cost,
+        total_twd_foreign_fee=0, total_shipping_twd=0,
+        items=[schemas.PurchaseItemCreate(product_id=product_id, qty=qty, unit_price_jpy=unit_cost, item_weight_g=0)],
+    ))
+    return batch.id
+
+
+async def avg_cost(db, product_id: str) -> float:
+    return (await db.execute(
+        select(Product.avg_cost_twd).where(Product.id == product_id).execution_options(populate_existing=True)
+    )).scalar()
+
+
+async def test_replay_rebuilds_average_and_sales_costs(db, make_product):
+    product_id = await make_product("Alpha")
+    # 10 at 100, sell 4 the next day, then 6 at 200: (6*100 + 6*200) / 12 = 150
+    await purchase(db, product_id, 10, 100)
+    await crud.create_sales_order(db, schemas.OrderCreate(platform_order_id="S1", order_date=DAY + datetime.timedelta(days=1), items=[
+        schemas.OrderItemCreate(product_name="Alpha", quantity=4, unit_price=300, total_price=1200),
+    ]))
+    await purchase(db, product_id, 6, 200, DAY + datetime.timedelta(days=2))
+    await db.execute(update(Product).values(avg_cost_twd=1.0))
+    await db.execute(update(SalesItem).values(historical_cost_basis=None))
+    await db.commit()
+
+    dry_run = await cost_replay.replay_costs(db, dry_run=True)
+    assert (dry_run["updated_products"], dry_run["updated_sales_items"]) == (1, 1)
+    assert await avg_cost(db, product_id) == 1.0
+
+    await cost_replay.replay_costs(db)
+    await db.commit()
+
+    assert await avg_cost(db, product_id) == pytest.approx(150.0)
+    assert (await db.execute(select(SalesItem.historical_cost_basis))).scalar() == pytest.approx(100.0)
+
+
+async def test_same_day_purchases_replay_in_booking_order(db, make_product):
+    product_id = await make_product("Alpha")
+    await crud.create_sales_order(db, schemas.OrderCreate(platform_order_id="S1", order_date=DAY - datetime.timedelta(days=1), items=[
+        schemas.OrderItemCreate(product_name="Alpha", quantity=10, unit_price=100, total_price=1000),
+    ]))
+    # From -10: 5 at 100 leaves -5 (average unchanged), then 20 at 50 gives (0 + 1000) / 15.
+    # The other way round would give 100, so the order matters.
+    first = await purchase(db, product_id, 5, 100)
+    second = await purchase(db, product_id, 20, 50)
+    assert await avg_cost(db, product_id) == pytest.approx(1000 / 15)
+    # Item ids that sort against the booking order
+    await db.execute(update(PurchaseItem).where(PurchaseItem.batch_id == first).values(id="ffffffff-ffff-4fff-bfff-ffffffffffff"))
+    await db.execute(update(PurchaseItem).where(PurchaseItem.batch_id == second).values(id="00000000-0000-4000-8000-000000000000"))
+    await db.commit()
+
+    result = await cost_replay.replay_costs(db)
+    await db.commit()
+
+    assert result["qty_mismatches"] == 0 and result["updated_products"] == 0
+    assert await avg_cost(db, product_id) == pytest.approx(1000 / 15)
+
+
+async def test_opening_stock_and_adjustments_are_replayed(db, make_product):
+    # Created with 10 at 100, then 10 at 50: 75
+    opened = await make_product("Opened", qty=10, cost=100.0)
+    await purchase(db, opened, 10, 50)
+    # 10 at 100, all 10 written off, then 10 at 50: nothing left to average with, so 50.
+    # Adjustments are booked today, so the purchases are dated around it.
+    today = datetime.date.today()
+    adjusted = await make_product("Adjusted")
+    await purchase(db, adjusted, 10, 100, today)
+    await stock.adjust_stock(db, adjusted, -10, reason="lost")
+    await db.commit()
+    await purchase(db, adjusted, 10, 50, today)
+
+    result = await cost_replay.replay_costs(db)
+    await db.commit()
+
+    assert result["qty_mismatches"] == 0 and result["updated_products"] == 0
+    assert await avg_cost(db, opened) == pytest.approx(75.0)
+    assert await avg_cost(db, adjusted) == pytest.approx(50.0)
+
+
+async def test_qty_the_ledger_does_not_explain_blocks_the_rewrite(db, make_product):
+    product_id = await make_product("Alpha")
+    await purchase(db, product_id, 10, 100)
+    await crud.create_sales_order(db, schemas.OrderCreate(platform_order_id="S1", order_date=DAY, items=[
+        schemas.OrderItemCreate(product_name="Alpha", quantity=2, unit_price=300, total_price=600),
+    ]))
+    # Changed outside stock.py, with no ledger row
+    await db.execute(update(Product).where(Product.id == product_id).values(current_qty=50, avg_cost_twd=80.0))
+    await db.execute(update(SalesItem).values(historical_cost_basis=None))
+    await db.commit()
+
+    result = await cost_replay.replay_costs(db)
+    await db.commit()
+
+    assert result["qty_mismatches"] == 1 and result["qty_mismatch_product_ids"] == [product_id]
+    assert result["updated_products"] == 0 and result["updated_sales_items"] == 0
+    assert await avg_cost(db, product_id) == pytest.approx(80.0)
@@ -0,0 +1,43 @@
+import datetime
+
+import pytest
+
+import crud
+import schemas
+from routers import dashboard
+
+pytestmark = pytest.mark.anyio
+
+DAY = datetime.date(2026, 1, 5)
+
+
+async def sell(db, order_no: str, day: datetime.date, *items):
+    await crud.create_sales_order(db, schemas.OrderCreate(platform_order_id=order_no, order_date=day, items=[
+        schemas.OrderItemCreate(product_name=name, quantity=qty, unit_price=price, total_price=qty * price)
+        for name, qty, price in items
+    ]))
+
+
+async def test_summary_aggregates_the_window(db, make_product):
+    await make_product("Alpha", qty=20, cost=40.0)
+    await make_product("Beta", qty=5, cost=5.0)
+    await sell(db, "S1", DAY, ("Alpha", 2, 100), ("Beta", 1, 30))
+    await sell(db, "S2", DAY + datetime.timedelta(days=1), ("Alpha", 1, 120))
+    await sell(db, "S3", DAY - datetime.timedelta(days=3), ("Beta", 2, 30))
+    await sell(db, "S4", DAY + datetime.timedelta(days=30), ("Alpha", 1, 100))
+
+    summary = await dashboard.get_dashboard_summary(
+        date_from=DAY, date_to=DAY + datetime.timedelta(days=6), top=5, db=db,
+    )
+
+    assert summary["totals"] == {"revenue": 350, "cogs": 125, "margin": 225, "order_count": 2, "units_sold": 4}
+    # The 7 days before date_from
+    assert (summary["previous_totals"]["revenue"], summary["previous_totals"]["order_count"]) == (60, 1)
+    assert [(row["order_date"], row["revenue"], row["order_count"]) for row in summary["daily"]] == [
+        (DAY, 230, 1), (DAY + datetime.timedelta(days=1), 120, 1),
+    ]
+    assert [(row["name"], row["units_sold"], row["margin"]) for row in summary["top_products"]] == [("Alpha", 3, 200), ("Beta", 1, 25)]
+    assert [order["platform_order_id"] for order in summary["recent_orders"]] == ["S4", "S2", "S1", "S3"]
+    # Alpha 16 left, Beta 2; both reorder below 10
+    assert (summary["product_count"], summary["low_stock_count"]) == (2, 1)
+    assert summary["inventory_value_twd"] == pytest.approx(16 * 40.0 + 2 * 5.0)
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+from sqlalchemy import event, select
+
+import database
+import db_metrics
+from models import Product
+
+pytestmark = pytest.mark.anyio
+
+
+class Route:
+    path = "/products/{product_id}"
+
+
+@pytest.fixture
+def metrics():
+    db_metrics.reset()
+    db_metrics.install(database.engine)
+    yield db_metrics
+    sync_engine = database.engine.sync_engine
+    event.remove(sync_engine, "before_cursor_execute", db_metrics._before_cursor_execute)
+    event.remove(sync_engine, "after_cursor_execute", db_metrics._after_cursor_execute)
+    db_metrics.reset()
+
+
+async def run_request(lookups: int):
+    """Drives the middleware with an app that runs one product lookup per iteration."""
+    sent = []
+
+    async def app(scope, receive, send):
+        scope["route"] = Route()
+        async with database.SessionLocal() as session:
+            for _ in range(lookups):
+                await session.execute(select(Product.id).where(Product.name == "Alpha"))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        sent.append(message)
+
+    await db_metrics.DBMetricsMiddleware(app)({"type": "http", "method": "GET"}, None, send)
+    return dict(sent[0]["headers"])
+
+
+async def test_queries_are_counted_per_request_and_route(metrics):
+    headers = await run_request(3)
+    assert headers[b"x-db-queries"] == b"3"
+    assert float(headers[b"x-db-time-ms"]) >= 0
+
+    await run_request(1)
+    route = metrics.snapshot()["routes"]["GET /products/{product_id}"]
+    assert (route["requests"], route["queries"], route["max_queries"], route["n_plus_one_requests"]) == (2, 4, 3, 0)
+    assert metrics.snapshot()["top_statements"][0]["count"] == 4
+
+
+async def test_repeated_statement_is_reported_as_n_plus_one(metrics, caplog):
+    with caplog.at_level(logging.WARNING, logger="sql"):
+        await run_request(db_metrics.SQL_N_PLUS_ONE_THRESHOLD)
+
+    assert metrics.snapshot()["routes"]["GET /products/{product_id}"]["n_plus_one_requests"] == 1
+    assert "Suspected N+1 in GET /products/{product_id}" in caplog.text
+
+
+async def test_queries_outside_a_request_only_feed_the_statement_totals(metrics, db):
+    await db.execute(select(Product.id))
+    snapshot = metrics.snapshot()
+    assert snapshot["routes"] == {}
+    assert snapshot["top_statements"][0]["count"] == 1
@@ -0,0 +1,90 @@
+import datetime
+import io
+
+import pytest
+from openpyxl import load_workbook
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+import crud
+import exports
+import import_service
+import schemas
+from models import SalesOrder
+
+pytestmark = pytest.mark.anyio
+
+ROWS = [
+    ["M1", "2026-01-05", "Amy", "Alpha", "2", "110"],
+    ["M1", "2026-01-05", "Amy", "Beta", "1", "30"],
+    ["M2", "2026-01-06", "Ben", "Alpha", "1", "1,200"],
+    ["M3", "2026-01-07", "", "Beta", "3", "25"],
+]
+
+
+async def collect(chunks) -> bytes:
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def order_lines(db) -> list:
+    orders = (await db.execute(
+        select(SalesOrder).options(selectinload(SalesOrder.items)).order_by(SalesOrder.order_no)
+        .execution_options(populate_existing=True)
+    )).scalars().all()
+    return [
+        (o.order_no, o.order_date, o.customer_name, sorted((i.qty, i.unit_price_sold) for i in o.items))
+        for o in orders
+    ]
+
+
+@pytest.fixture
+def small_partitions(monkeypatch):
+    monkeypatch.setattr(exports, "EXPORT_PARTITION_SIZE", 1)
+
+
+async def test_sales_csv_export_imports_back_to_the_same_orders(db, orders_csv, tmp_path, small_partitions):
+    await import_service.parse_and_save_orders(db, orders_csv(ROWS))
+    before = await order_lines(db)
+
+    data = await collect(exports.stream("csv", exports.SALES_HEADERS, exports.sales_export_query()))
+    text = data.decode("utf-8-sig")
+    assert text.splitlines()[0] == ",".join(exports.SALES_HEADERS)
+    assert len(text.splitlines()) == 1 + len(ROWS)
+
+    await crud.delete_all_sales_orders(db)
+    path = tmp_path / "export.csv"
+    path.write_bytes(data)
+    await import_service.parse_and_save_orders(db, str(path))
+
+    assert await order_lines(db) == before
+
+
+async def test_sales_export_follows_the_listing_filters(db, orders_csv, small_partitions):
+    await import_service.parse_and_save_orders(db, orders_csv(ROWS))
+    filters = schemas.SalesOrderFilter(date_from=datetime.date(2026, 1, 6))
+
+    data = await collect(exports.stream("xlsx", exports.SALES_HEADERS, exports.sales_export_query(filters)))
+
+    rows = list(load_workbook(io.BytesIO(data), read_only=True).active.iter_rows(values_only=True))
+    assert list(rows[0]) == exports.SALES_HEADERS
+    assert [(row[0], row[3], row[4], row[5], row[6]) for row in rows[1:]] == [
+        ("M2", "Alpha", 1, 1200, 1200), ("M3", "Beta", 3, 25, 75),
+    ]
+
+
+async def test_purchase_export_lists_items_with_their_batch(db, make_product, small_partitions):
+    alpha = await make_product("Alpha", sku="A-1")
+    beta = await make_product("Beta", sku="B-1")
+    for day, items in ((datetime.date(2026, 1, 2), [(alpha, 2, 300)]), (datetime.date(2026, 2, 3), [(alpha, 1, 200), (beta, 4, 100)])):
+        await crud.create_purchase_batch(db, schemas.PurchaseBatchCreate(
+            purchase_date=day, source="supplier", total_jpy=0, total_twd_card_bill=0,
+            total_twd_foreign_fee=0, total_shipping_twd=0,
+            items=[schemas.PurchaseItemCreate(product_id=pid, qty=qty, unit_price_jpy=price, item_weight_g=0) for pid, qty, price in items],
+        ))
+
+    query = exports.purchases_export_query(date_from=datetime.date(2026, 2, 1))
+    data = await collect(exports.stream("csv", exports.PURCHASE_HEADERS, query))
+
+    lines = data.decode("utf-8-sig").splitlines()
+    assert lines[0] == ",".join(exports.PURCHASE_HEADERS)
+    assert sorted(line.split(",")[2:6] for line in lines[1:]) == [["A-1", "Alpha", "1", "200"], ["B-1", "Beta", "4", "100"]]
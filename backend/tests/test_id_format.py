@@ -0,0 +1,85 @@
+import uuid
+
+import pytest
+from sqlalchemy import MetaData, String, insert, select
+
+import database
+import migrate_ids
+import migrations
+import models
+from models import Product, SalesItem, SalesOrder
+
+pytestmark = pytest.mark.anyio
+
+
+def test_uuid7_is_time_ordered():
+    ids = [models._uuid7() for _ in range(3)]
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids)
+    # The leading 48 bits are the millisecond timestamp
+    assert [value.int >> 80 for value in ids] == sorted(value.int >> 80 for value in ids)
+
+
+def test_compact_id_round_trips_and_ignores_foreign_values():
+    compact = models.CompactId()
+    dialect = database.engine.dialect
+    value = str(uuid.uuid4())
+
+    raw = compact.process_bind_param(value, dialect)
+    assert raw == uuid.UUID(value).bytes
+    assert compact.process_result_value(raw, dialect) == value
+    assert compact.process_bind_param("not-an-id", dialect) is None
+    assert compact.process_bind_param("abcd", dialect) is None
+
+
+async def test_api_sees_string_ids_in_every_format(db, make_product):
+    product_id = await make_product("Alpha", qty=5)
+    uuid.UUID(product_id)
+    assert (await db.get(Product, product_id)).name == "Alpha"
+    assert await db.get(Product, "missing") is None
+
+
+def _string_keyed(metadata: MetaData) -> MetaData:
+    # The original layout: the same tables with text keys
+    old = MetaData()
+    for table in metadata.sorted_tables:
+        copy = table.to_metadata(old)
+        for column in copy.columns:
+            if isinstance(column.type, models.CompactId):
+                column.type = String()
+    return old
+
+
+@pytest.mark.skipif(models.DB_ID_FORMAT != "binary", reason="migrate_ids converts to DB_ID_FORMAT=binary")
+async def test_migration_keeps_id_values(monkeypatch, db):
+    monkeypatch.setattr(migrate_ids, "COPY_CHUNK_SIZE", 2)
+    old = _string_keyed(database.Base.metadata)
+    product_ids = [str(uuid.uuid4()) for _ in range(3)]
+    order_id, item_id = str(uuid.uuid4()), str(uuid.uuid4())
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.Base.metadata.drop_all)
+        await conn.run_sync(old.create_all)
+        await conn.execute(insert(old.tables["products"]), [
+            {"id": pid, "sku": f"S{i}", "name": f"P{i}", "current_qty": i} for i, pid in enumerate(product_ids)
+        ])
+        await conn.execute(insert(old.tables["sales_orders"]).values(id=order_id, order_no="A1"))
+        await conn.execute(insert(old.tables["sales_items"]).values(id=item_id, order_id=order_id, product_id=product_ids[1], qty=2))
+        assert not await conn.run_sync(migrate_ids.already_migrated)
+
+    # Keys are only converted on a database at the latest version
+    with pytest.raises(SystemExit, match="pending migrations"):
+        await migrate_ids.migrate()
+    async with database.engine.begin() as conn:
+        await conn.execute(insert(old.tables["schema_migrations"]), [
+            {"version": version, "name": name} for version, name, _ in migrations.MIGRATIONS
+        ])
+
+    await migrate_ids.migrate()
+
+    async with database.engine.connect() as conn:
+        assert await conn.run_sync(migrate_ids.already_migrated)
+    assert sorted((await db.execute(select(Product.id))).scalars().all()) == sorted(product_ids)
+    item = (await db.execute(select(SalesItem).where(SalesItem.id == item_id))).scalar_one()
+    assert (item.order_id, item.product_id, item.qty) == (order_id, product_ids[1], 2)
+    assert (await db.execute(select(SalesOrder.order_no).where(SalesOrder.id == order_id))).scalar_one() == "A1"
+
+    await migrate_ids.migrate() # Second run is a no-op
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+
+import pytest
+from openpyxl import Workbook
+from sqlalchemy import event, func, insert, select
+
+import database
+import import_service
+from models import ImportCheckpoint, Product, SalesItem, SalesOrder, generate_uuid
+
+pytestmark = pytest.mark.anyio
+
+
+def file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+async def orders_by_no(db):
+    result = await db.execute(select(SalesOrder.order_no, SalesOrder.order_date, SalesOrder.customer_name))
+    return {row.order_no: row for row in result.all()}
+
+
+async def product_qty(db):
+    result = await db.execute(select(Product.name, Product.current_qty).execution_options(populate_existing=True))
+    return dict(result.all())
+
+
+async def test_import_creates_orders_products_and_deducts_stock(db, make_product, orders_csv):
+    await make_product("Alpha", qty=20)
+    path = orders_csv(
+        [
+            ["A1", "2026-01-05", "Amy", "Alpha", "2", "100"],
+            ["A1", "2026-01-05", "Amy", "Beta", "1", "50"],
+            ["A2", "2026-01-06", "Bob", "Alpha+Beta", "1", "300"],
+            ["A3", "2026-01-07", "Cat", "Gamma 2盒", "3", "60"],
+            ["", "", "", "合計", "", ""],
+        ],
+        preamble=[["賣貨便訂單匯出"], []],
+    )
+
+    # Chunks of two rows: order groups must still arrive whole
+    results = await import_service.parse_and_save_orders(db, path, chunk_size=2)
+
+    assert results["created_orders"] == 3
+    assert results["created_products"] == 2  # Beta, Gamma
+    assert results["errors"] == []
+    orders = await orders_by_no(db)
+    assert sorted(orders) == ["A1", "A2", "A3"]
+    assert str(orders["A2"].order_date) == "2026-01-06"
+    assert (await product_qty(db)) == {"Alpha": 20 - 2 - 1, "Beta": -1 - 1, "Gamma": -6}
+
+    # "Alpha+Beta" at 300 is split evenly; "Gamma 2盒" x3 is 6 units sharing the 180 line total
+    items = (await db.execute(
+        select(Product.name, SalesItem.qty, SalesItem.unit_price_sold)
+        .join(SalesItem.product).join(SalesItem.order).where(SalesOrder.order_no.in_(["A2", "A3"]))
+    )).all()
+    assert sorted(items) == [("Alpha", 1, 150), ("Beta", 1, 150), ("Gamma", 6, 30)]
+
+
+async def test_xlsx_and_simplified_headers(db, tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["订单编号", "訂單日期", "商品名稱", "數量", "單價"])
+    sheet.append(["X1", "2026-02-01", "Alpha", 1, 99])
+    sheet.append(["X2", "2026-02-02", "Alpha", 2, 99])
+    path = str(tmp_path / "orders.xlsx")
+    workbook.save(path)
+
+    results = await import_service.parse_and_save_orders(db, path)
+
+    assert results["created_orders"] == 2
+    assert sorted(await orders_by_no(db)) == ["X1", "X2"]
+
+
+async def test_numbers_with_thousands_separators(db, orders_csv):
+    path = orders_csv([["B1", "2026-01-05", "", "Alpha", "1", "1,180"]])
+
+    await import_service.parse_and_save_orders(db, path)
+
+    assert (await db.execute(select(SalesItem.unit_price_sold))).scalar() == 1180
+
+
+async def test_zero_qty_line_is_priced_at_zero(db, orders_csv):
+    path = orders_csv([["Z1", "2026-01-05", "", "Alpha 2盒", "0", "100"]])
+
+    results = await import_service.parse_and_save_orders(db, path)
+
+    assert results["created_orders"] == 1 and results["errors"] == []
+    assert (await db.execute(select(SalesItem.qty, SalesItem.unit_price_sold))).one() == (0, 0)
+
+
+async def test_unreadable_number_fails_only_its_order(db, orders_csv):
+    path = orders_csv([
+        ["B1", "2026-01-05", "", "Alpha", "two", "100"],
+        ["B2", "2026-01-05", "", "Alpha", "1", "100"],
+    ])
+
+    results = await import_service.parse_and_save_orders(db, path)
+
+    assert results["created_orders"] == 1
+    assert len(results["errors"]) == 1 and results["errors"][0].startswith("Order B1")
+    assert sorted(await orders_by_no(db)) == ["B2"]
+
+
+async def test_same_file_twice_is_a_duplicate(db, orders_csv):
+    path = orders_csv([["C1", "2026-01-05", "", "Alpha", "1", "100"], ["C2", "2026-01-05", "", "Alpha", "1", "100"]])
+
+    first = await import_service.parse_and_save_orders(db, path, file_hash=file_hash(path))
+    second = await import_service.parse_and_save_orders(db, path, file_hash=file_hash(path))
+
+    assert first["created_orders"] == 2
+    assert second["duplicate_file"] is True
+    assert second["created_orders"] == 0 and second["skipped_orders"] == 2
+    assert (await product_qty(db)) == {"Alpha": -2}
+
+
+async def test_same_file_uploaded_twice_at_once_is_imported_once(orders_csv):
+    path = orders_csv([[f"E{i}", "2026-01-05", "", "Alpha", "1", "100"] for i in range(6)])
+
+    async def run():
+        async with database.SessionLocal() as session:
+            return await import_service.parse_and_save_orders(session, path, file_hash=file_hash(path), commit_every=2)
+
+    results = await asyncio.gather(run(), run())
+
+    assert sorted(r["created_orders"] for r in results) == [0, 6]
+    assert sorted(r["duplicate_file"] for r in results) == [False, True]
+    assert all(r["errors"] == [] for r in results)
+
+
+async def test_superset_upload_only_adds_new_orders(db, orders_csv):
+    old_rows = [["D1", "2026-01-05", "", "Alpha", "1", "100"], ["D2", "2026-01-06", "", "Alpha", "1", "100"]]
+    first = orders_csv(old_rows, name="first.csv")
+    superset = orders_csv(old_rows + [["D3", "2026-01-07", "", "Alpha", "4", "100"]], name="superset.csv")
+
+    await import_service.parse_and_save_orders(db, first, file_hash=file_hash(first))
+    results = await import_service.parse_and_save_orders(db, superset, file_hash=file_hash(superset))
+
+    assert results["created_orders"] == 1
+    assert results["skipped_orders"] == 2
+    assert (await db.execute(select(func.count(SalesOrder.id)))).scalar() == 3
+    assert (await product_qty(db)) == {"Alpha": -6}
+
+
+async def test_lookups_are_chunked_and_known_orders_skipped(db, orders_csv):
+    count = 2 * database.LOOKUP_CHUNK_SIZE + 11
+    rows = [[f"N{i:04d}", "2026-01-05", "", f"Item{i}", "1", "10"] for i in range(count)]
+    # Entered by hand, so only the database knows them
+    await db.execute(insert(SalesOrder), [{"id": generate_uuid(), "order_no": row[0]} for row in rows[:10]])
+    await db.commit()
+
+    lookups = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        for lookup in ("sales_orders.order_no IN", "products.name IN"):
+            if lookup in statement:
+                lookups.append(lookup)
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        results = await import_service.parse_and_save_orders(db, orders_csv(rows))
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+
+    assert results["created_orders"] == count - 10 and results["skipped_orders"] == 10
+    assert results["created_products"] == count - 10
+    # Three IN (...) chunks for the order numbers and three for the new orders' product names
+    assert sorted(lookups) == ["products.name IN"] * 3 + ["sales_orders.order_no IN"] * 3
+
+
+async def test_failed_import_resumes_after_the_last_committed_batch(db, orders_csv, monkeypatch):
+    path = orders_csv([[f"R{i}", "2026-01-05", "", "Alpha", "1", "100"] for i in range(1, 5)])
+    commit_order_batch = import_service.commit_order_batch
+    batches = []
+
+    async def fail_third_batch(db, batch, *args):
+        batches.append(batch)
+        if len(batches) == 3:
+            raise RuntimeError("connection lost")
+        await commit_order_batch(db, batch, *args)
+
+    monkeypatch.setattr(import_service, "commit_order_batch", fail_third_batch)
+    with pytest.raises(RuntimeError):
+        await import_service.parse_and_save_orders(db, path, file_hash="h", commit_every=1)
+    monkeypatch.undo()
+
+    checkpoint = await db.get(ImportCheckpoint, "h", populate_existing=True)
+    assert (checkpoint.status, checkpoint.last_order_no) == ("failed", "R2")
+    assert sorted(await orders_by_no(db)) == ["R1", "R2"]
+
+    results = await import_service.parse_and_save_orders(db, path, file_hash="h", commit_every=1)
+
+    assert results["resumed_after_order"] == "R2" and results["created_orders"] == 2
+    checkpoint = await db.get(ImportCheckpoint, "h", populate_existing=True)
+    assert (checkpoint.status, checkpoint.committed_orders) == ("completed", 4)
+    assert sorted(await orders_by_no(db)) == ["R1", "R2", "R3", "R4"]
+
+
+async def test_preview_writes_nothing(db, make_product, orders_csv):
+    await make_product("Alpha", qty=5)
+    path = orders_csv([["E1", "2026-01-05", "", "Alpha", "2", "100"], ["E2", "2026-01-05", "", "New thing", "1", "10"]])
+
+    preview = await import_service.preview_orders(db, path)
+
+    assert preview["new_orders"] == 2
+    changes = {change["product_name"]: change for change in preview["stock_changes"]}
+    assert changes["Alpha"]["qty_delta"] == -2 and changes["New thing"]["is_new_product"]
+    assert await orders_by_no(db) == {}
+    assert (await product_qty(db)) == {"Alpha": 5}
+
+
+async def test_order_split_across_chunks_is_reported(db, orders_csv):
+    path = orders_csv([
+        ["F1", "2026-01-05", "", "Alpha", "1", "100"],
+        ["F2", "2026-01-05", "", "Alpha", "1", "100"],
+        ["F3", "2026-01-05", "", "Alpha", "1", "100"],
+        ["F1", "2026-01-05", "", "Beta", "2", "50"],
+        ["F1", "2026-01-05", "", "Gamma", "1", "50"],
+    ])
+
+    # The chunk is cut after F2, so the last two F1 rows arrive after F1 was parsed
+    results = await import_service.parse_and_save_orders(db, path, chunk_size=2)
+
+    assert results["created_orders"] == 3
+    assert results["skipped_orders"] == 0
+    assert results["errors"] == ["Order F1: rows are not next to each other in the file; 2 row(s) after the gap were not imported"]
+    assert (await product_qty(db)) == {"Alpha": -3}
+
+
+async def test_rows_apart_within_one_chunk_are_merged(db, orders_csv):
+    path = orders_csv([
+        ["G1", "2026-01-05", "", "Alpha", "1", "100"],
+        ["G2", "2026-01-05", "", "Alpha", "1", "100"],
+        ["G1", "2026-01-05", "", "Beta", "2", "50"],
+    ])
+
+    results = await import_service.parse_and_save_orders(db, path)
+
+    assert results["created_orders"] == 2 and results["errors"] == []
+    assert (await product_qty(db)) == {"Alpha": -2, "Beta": -2}
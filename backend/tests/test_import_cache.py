@@ -0,0 +1,79 @@
+import pytest
+from sqlalchemy import delete, event, func, select
+
+import database
+import import_cache
+import import_service
+from models import SalesItem, SalesOrder
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_seen_list_outlived_by_deleted_orders(db, orders_csv):
+    rows = [["H1", "2026-01-05", "", "Alpha", "1", "100"], ["H2", "2026-01-05", "", "Alpha", "1", "100"]]
+    await import_service.parse_and_save_orders(db, orders_csv(rows, name="first.csv"))
+    assert import_cache.load_seen_order_nos(import_service.IMPORT_SOURCE) == {"H1", "H2"}
+
+    # Deleted behind the importer's back (or a recreated database): the seen list still has them
+    await db.execute(delete(SalesItem))
+    await db.execute(delete(SalesOrder).where(SalesOrder.order_no == "H1"))
+    await db.commit()
+
+    seen = import_cache.load_seen_order_nos(import_service.IMPORT_SOURCE)
+    assert await import_service.find_imported_order_nos(db, ["H1", "H2", "H3"], seen) == {"H2"}
+    results = await import_service.parse_and_save_orders(db, orders_csv(rows, name="second.csv"), file_hash="second")
+
+    assert results["created_orders"] == 1 and results["skipped_orders"] == 1
+    assert (await db.execute(select(func.count(SalesOrder.id)))).scalar() == 2
+    # H2 was passed over unparsed, so this parse is not cached: the entry would lack H2 for good
+    assert not import_cache.has_parsed("second")
+
+
+async def test_known_order_lookups_follow_the_file_not_the_history(db, orders_csv):
+    history = [[f"H{i:04d}", "2026-01-05", "", "Alpha", "1", "100"] for i in range(2 * database.LOOKUP_CHUNK_SIZE)]
+    await import_service.parse_and_save_orders(db, orders_csv(history, name="history.csv"))
+
+    looked_up = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if "sales_orders.order_no IN" in statement:
+            looked_up.extend(parameters)
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        rows = [history[0], ["H9999", "2026-01-06", "", "Alpha", "1", "100"]]
+        results = await import_service.parse_and_save_orders(db, orders_csv(rows, name="today.csv"))
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+
+    assert results["created_orders"] == 1 and results["skipped_orders"] == 1
+    # The known order is confirmed and the new one checked; the rest of the history is not read
+    assert sorted(looked_up) == ["H0000", "H9999"]
+
+
+def test_clear_spares_files_in_use():
+    import_cache.save_summary("done", {"created_orders": 1})
+    writer = import_cache.ParsedWriter("running")
+    writer.write([{"order_no": "J1"}], {"rows_parsed": 1})
+
+    import_cache.clear()
+    writer.commit()
+
+    assert import_cache.load_summary("done") is None
+    assert list(import_cache.iter_parsed("running")) == [([{"order_no": "J1"}], {"rows_parsed": 1})]
+
+
+def test_clear_spares_a_cached_parse_being_replayed():
+    writer = import_cache.ParsedWriter("cached")
+    for chunk in range(2):
+        writer.write([{"order_no": f"K{chunk}"}], {"rows_parsed": 1})
+    writer.commit()
+
+    replay = import_cache.iter_parsed("cached")
+    first = next(replay)
+    import_cache.clear()
+
+    assert [first[0], next(replay)[0]] == [[{"order_no": "K0"}], [{"order_no": "K1"}]]
+    replay.close()
+    import_cache.clear()
+    assert not import_cache.has_parsed("cached")
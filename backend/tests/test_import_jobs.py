@@ -0,0 +1,54 @@
+import asyncio
+import io
+import logging
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import import_jobs
+from routers import sales
+
+pytestmark = pytest.mark.anyio
+
+
+async def finished(job):
+    while job.finished_at is None:
+        await asyncio.sleep(0.01)
+    return job.to_dict()
+
+
+async def test_job_imports_in_the_background_and_removes_its_file(orders_csv):
+    path = orders_csv([["J1", "2026-01-05", "", "Alpha", "1", "100"], ["J2", "2026-01-05", "", "Alpha", "2", "100"]])
+
+    job = import_jobs.submit(path, "orders.csv")
+
+    assert job.status == "queued" and import_jobs.get_job(job.id) is job
+    result = await finished(job)
+    assert result["status"] == "success"
+    assert (result["rows_parsed"], result["created_orders"], result["errors"]) == (2, 2, [])
+    assert not os.path.exists(path)
+
+
+async def test_failed_job_reports_and_logs_the_error(orders_csv, caplog):
+    path = orders_csv([["J1", "Alpha"]], headers=["編號", "商品名稱"])
+
+    with caplog.at_level(logging.ERROR, logger="import"):
+        job = import_jobs.submit(path, "orders.csv")
+        result = await finished(job)
+
+    assert result["status"] == "failed"
+    assert result["errors"] and result["errors"][0].startswith("Could not find header row")
+    assert not os.path.exists(path)
+    assert f"Import job {job.id} (orders.csv) failed" in caplog.text and caplog.records[-1].exc_info
+
+
+async def test_damaged_xlsx_preview_is_a_bad_request(db):
+    # Starts like a zip (so it is read as .xlsx) but is not one
+    upload = UploadFile(io.BytesIO(b"PK\x03\x04 not really a zip"), filename="orders.xlsx")
+
+    with pytest.raises(HTTPException) as error:
+        await sales.upload_sales_excel(file=upload, preview=True, db=db)
+
+    assert error.value.status_code == 400
+    assert error.value.detail.startswith("Failed to process file:")
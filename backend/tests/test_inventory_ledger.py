@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert
+
+import inventory_ledger
+import stock
+from models import Product, generate_uuid
+
+pytestmark = pytest.mark.anyio
+
+SNAPSHOT_DAY = datetime.date(2026, 3, 1)
+
+
+def movements(product_id: str, days, qty_change: int = 1):
+    return [stock.movement(product_id, qty_change, "adjustment", SNAPSHOT_DAY - datetime.timedelta(days=day)) for day in days]
+
+
+@pytest.fixture
+async def snapshotted(db, make_product):
+    """Two products with 200 movements each before a snapshot, then a dated-after and a back-dated movement each."""
+    alpha = await make_product("Alpha")
+    beta = await make_product("Beta")
+    for product_id in (alpha, beta):
+        await stock.add_stock(db, movements(product_id, range(200)))
+    await inventory_ledger.take_snapshots(db, SNAPSHOT_DAY)
+    await db.commit()
+    for product_id in (alpha, beta):
+        await stock.add_stock(db, movements(product_id, [-3], qty_change=5) + movements(product_id, [50], qty_change=-7))
+    await db.commit()
+    return alpha, beta
+
+
+async def test_tail_after_a_snapshot_is_only_the_newer_movements(db, snapshotted):
+    alpha, beta = snapshotted
+
+    for product_ids in ([alpha], None):
+        ledger = await inventory_ledger._ledger_qty(db, SNAPSHOT_DAY + datetime.timedelta(days=10), product_ids)
+        # The 200 older movements are covered by the snapshot
+        assert ledger[alpha] == {"qty": 200 + 5 - 7, "tail": 2}
+    assert (await inventory_ledger._ledger_qty(db, SNAPSHOT_DAY))[beta] == {"qty": 200 - 7, "tail": 1}
+
+
+async def test_stock_as_of_around_the_snapshot(db, snapshotted):
+    alpha, _ = snapshotted
+
+    # Before the snapshot there is none to start from, so the whole history is read
+    assert await inventory_ledger.stock_as_of(db, SNAPSHOT_DAY - datetime.timedelta(days=100), [alpha]) == {alpha: 100}
+    assert await inventory_ledger.stock_as_of(db, SNAPSHOT_DAY, [alpha]) == {alpha: 200 - 7}
+    assert await inventory_ledger.stock_as_of(db, SNAPSHOT_DAY + datetime.timedelta(days=3), [alpha]) == {alpha: 200 - 7 + 5}
+
+
+async def test_history_walks_the_balance_back(db, make_product):
+    product_id = await make_product("Alpha", qty=10)
+    await stock.add_stock(db, [stock.movement(product_id, 5, "purchase"), stock.movement(product_id, -3, "sale")])
+    await db.commit()
+
+    history = await inventory_ledger.movement_history(db, product_id)
+
+    assert [(row["kind"], row["qty_change"], row["balance_after"]) for row in history] == [
+        ("sale", -3, 12), ("purchase", 5, 15), ("opening", 10, 10),
+    ]
+
+
+async def test_stock_from_before_the_ledger_gets_an_opening_movement(db):
+    # Stocked by a version without the ledger
+    product_id = generate_uuid()
+    await db.execute(insert(Product), [{"id": product_id, "name": "Alpha", "current_qty": 25}])
+    await db.commit()
+
+    result = await inventory_ledger.take_snapshots(db)
+    await db.commit()
+
+    assert result["opening_movements"] == 1
+    assert await inventory_ledger.stock_as_of(db, datetime.date.today(), [product_id]) == {product_id: 25}
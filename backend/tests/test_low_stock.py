@@ -0,0 +1,61 @@
+import pytest
+
+import crud
+import stock
+import stock_events
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def subscriber():
+    queue = stock_events.subscribe()
+    yield queue
+    stock_events.unsubscribe(queue)
+
+
+def received(queue):
+    events = []
+    while not queue.empty():
+        item = queue.get_nowait()
+        events.append((item["name"], item["status"], item["current_qty"]))
+    return events
+
+
+async def test_low_stock_uses_each_products_threshold(db, make_product):
+    await make_product("Alpha", qty=3, reorder_threshold=5)
+    await make_product("Beta", qty=3, reorder_threshold=2)
+    await make_product("Gamma", qty=0, reorder_threshold=10)
+
+    low = await crud.get_low_stock_products(db)
+
+    # Furthest below its threshold first
+    assert [product.name for product in low] == ["Gamma", "Alpha"]
+    assert await crud.count_low_stock_products(db) == 2
+
+
+async def test_crossings_are_published_on_commit_only(db, make_product, subscriber):
+    product_id = await make_product("Alpha", qty=12, reorder_threshold=10)
+
+    await stock.add_stock(db, [stock.movement(product_id, -5, "sale")])
+    assert received(subscriber) == []
+    await db.rollback()
+    assert received(subscriber) == []
+
+    await stock.add_stock(db, [stock.movement(product_id, -1, "sale")])  # 11: still above
+    await stock.add_stock(db, [stock.movement(product_id, -4, "sale")])  # 7: low
+    await db.commit()
+    await stock.receive_stock(db, [(product_id, 10, 100.0, 0)])  # 17: restocked
+    await db.commit()
+
+    assert received(subscriber) == [("Alpha", "low", 7), ("Alpha", "restocked", 17)]
+
+
+async def test_moving_the_threshold_past_the_stock_is_a_crossing(db, make_product, subscriber):
+    product_id = await make_product("Alpha", qty=12, reorder_threshold=10)
+
+    product = await crud.set_reorder_threshold(db, product_id, 20)
+
+    assert product.reorder_threshold == 20
+    assert received(subscriber) == [("Alpha", "low", 12)]
+    assert await crud.set_reorder_threshold(db, "no-such-product", 5) is None
@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from sqlalchemy import delete, select
+
+import crud
+import database
+import migrations
+import sales_rollup
+import schemas
+from database import Base
+from models import SchemaMigration
+
+pytestmark = pytest.mark.anyio
+
+
+def sqlite_schema(conn) -> dict:
+    """Columns (name, type, not null, primary key) of every table, and every index with its columns."""
+    tables = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY name").scalars().all()
+    schema = {}
+    for table in tables:
+        columns = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+        schema[table] = {(name, type_, notnull, pk) for _, name, type_, notnull, _, pk in columns}
+    indexes = conn.exec_driver_sql("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'").all()
+    for name, table in indexes:
+        columns = conn.exec_driver_sql(f"PRAGMA index_xinfo({name})").all()
+        schema[f"index {name}"] = (table, [column[2] for column in columns if column[5]])
+    return schema
+
+
+async def read_schema() -> dict:
+    async with database.engine.connect() as conn:
+        return await conn.run_sync(sqlite_schema)
+
+
+async def test_new_database_is_stamped_with_every_version(db):
+    versions = (await db.execute(select(SchemaMigration.version).order_by(SchemaMigration.version))).scalars().all()
+    assert versions == [version for version, _, _ in sorted(migrations.MIGRATIONS)]
+    assert await migrations.upgrade() == []
+
+
+async def test_upgrading_a_pre_versioning_database_gives_the_current_schema():
+    expected = await read_schema()  # Created from the models
+    async with database.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(migrations.baseline)
+
+    applied = await migrations.upgrade()
+
+    assert applied == sorted(version for version, _, _ in migrations.MIGRATIONS)
+    assert await read_schema() == expected
+    assert await migrations.upgrade() == []
+
+
+async def test_later_migrations_are_no_ops_on_a_database_that_has_them():
+    # A database stamped at version 3 by the release where the baseline still followed the models
+    expected = await read_schema()
+    async with database.engine.begin() as conn:
+        await conn.execute(delete(SchemaMigration).where(SchemaMigration.version > 3))
+
+    applied = await migrations.upgrade()
+
+    assert applied == list(range(4, migrations.LATEST_VERSION + 1))
+    assert await read_schema() == expected
+
+
+async def rollup_rows(db) -> tuple:
+    totals = (await db.execute(select(sales_rollup.totals).order_by(*sales_rollup.totals.primary_key.columns))).all()
+    by_product = (await db.execute(select(sales_rollup.by_product).order_by(*sales_rollup.by_product.primary_key.columns))).all()
+    return totals, by_product
+
+
+async def test_rollup_migration_backfills_existing_sales(db, make_product):
+    await make_product("Alpha", qty=10, cost=40.0)
+    await make_product("Beta", qty=10, cost=5.0)
+    await crud.create_sales_orders(db, [
+        schemas.OrderCreate(platform_order_id=f"R{i}", order_date=datetime.date(2026, 1, 5 + i % 2), items=[
+            schemas.OrderItemCreate(product_name=name, quantity=i + 1, unit_price=100, total_price=(i + 1) * 100)
+            for name in ("Alpha", "Beta")[:1 + i % 2]
+        ])
+        for i in range(4)
+    ])
+    async with database.engine.begin() as conn:
+        await conn.exec_driver_sql("DROP TABLE sales_daily_totals")
+        await conn.exec_driver_sql("DROP TABLE sales_daily_products")
+        await conn.execute(delete(SchemaMigration).where(SchemaMigration.version >= 3))
+
+    await migrations.upgrade()
+
+    backfilled = await rollup_rows(db)
+    await sales_rollup.rebuild(db)
+    assert backfilled == await rollup_rows(db)
+    assert len(backfilled[0]) == 2 and len(backfilled[1]) == 3
+
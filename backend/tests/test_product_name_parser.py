@@ -0,0 +1,21 @@
+import product_name_parser
+from benchmarks.bench_product_name_parser import load_corpus
+from product_name_parser import ParsedItem, parse_product_name
+
+
+def test_corpus_parses_as_expected():
+    mismatches = [
+        (entry["raw"], entry["expected"], [list(item) for item in parse_product_name(entry["raw"])])
+        for entry in load_corpus()
+    ]
+    assert [mismatch for mismatch in mismatches if mismatch[1] != mismatch[2]] == []
+
+
+def test_repeated_names_are_served_from_the_cache():
+    product_name_parser._parse_cached.cache_clear()
+
+    first = parse_product_name("Alpha+Beta 各2")
+    second = parse_product_name(" Alpha+Beta 各2 ")
+
+    assert first == second == (ParsedItem("Alpha", 2), ParsedItem("Beta", 2))
+    assert product_name_parser._parse_cached.cache_info().hits == 1
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+from openpyxl import Workbook
+from fastapi import HTTPException
+from sqlalchemy import event, func, select
+
+import database
+import purchase_import
+import schemas
+from models import InventoryMovement, Product, PurchaseBatch
+from routers import purchases
+
+pytestmark = pytest.mark.anyio
+
+INVOICE_HEADERS = ["商品編號", "品名", "數量", "日幣單價", "重量(g)"]
+BATCH_HEADER = {
+    "purchase_date": datetime.date(2026, 1, 10), "source": "supplier", "currency": "JPY", "total_jpy": None,
+    "total_twd_card_bill": 3250, "total_twd_foreign_fee": 0, "total_shipping_twd": 0,
+}
+
+
+@pytest.fixture
+def invoice_xlsx(tmp_path):
+    def write(rows):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append(["供應商請款單"])
+        sheet.append(INVOICE_HEADERS)
+        for row in rows:
+            sheet.append(row)
+        path = str(tmp_path / "invoice.xlsx")
+        workbook.save(path)
+        return path
+    return write
+
+
+async def test_invoice_lines_match_products_by_sku_then_name(db, make_product, invoice_xlsx):
+    await make_product("Alpha", qty=10, cost=100.0, sku="A-1")
+    await make_product("Beta", sku="B-1")
+    path = invoice_xlsx([
+        ["A-1", "Alpha (renamed by the supplier)", 10, "1,000", 0],
+        [None, "Beta", 5, 400, 0],
+        ["C-1", "Gamma", 5, 200, 0],
+        [None, "小計", None, None, None],
+    ])
+
+    lines = purchase_import.read_purchase_lines(path)
+    batch = await purchase_import.import_purchase_batch(db, lines, dict(BATCH_HEADER))
+
+    # total_jpy defaults to the invoice sum: 10*1000 + 5*400 + 5*200 = 13000, so 0.25 TWD per JPY
+    assert (batch.total_jpy, batch.exchange_rate, len(batch.items)) == (13000, 0.25, 3)
+    products = (await db.execute(
+        select(Product.name, Product.sku, Product.current_qty, Product.avg_cost_twd).execution_options(populate_existing=True)
+    )).all()
+    # Alpha: (10*100 + 10*250) / 20
+    assert sorted(products) == [("Alpha", "A-1", 20, 175.0), ("Beta", "B-1", 5, 100.0), ("Gamma", "C-1", 5, 50.0)]
+
+
+async def test_large_invoice_resolves_products_in_chunks(db, make_product):
+    await make_product("Alpha", sku="A-1")
+    count = 2 * database.LOOKUP_CHUNK_SIZE + 1
+    lines = [{"sku": f"S{i:04d}", "name": f"Item{i}"} for i in range(count)] + [{"sku": "A-1", "name": "Alpha"}]
+
+    lookups = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        for lookup in ("products.sku IN", "products.name IN"):
+            if lookup in statement:
+                lookups.append(lookup)
+
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        results = await purchase_import.resolve_products(db, lines)
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+
+    assert results == {"created_products": count}
+    assert sorted(lookups) == ["products.name IN"] * 3 + ["products.sku IN"] * 3
+    assert len({line["product_id"] for line in lines}) == count + 1
+
+
+def test_unreadable_number_names_its_row(invoice_xlsx):
+    path = invoice_xlsx([["A-1", "Alpha", 1, 100, 0], ["B-1", "Beta", "x", 100, 0]])
+
+    with pytest.raises(ValueError, match="Row 2: invalid number in '數量': x"):
+        purchase_import.read_purchase_lines(path)
+
+
+async def test_batch_with_an_unknown_product_is_refused(db, make_product):
+    alpha = await make_product("Alpha", qty=5)
+    batch = schemas.PurchaseBatchCreate(
+        purchase_date=datetime.date(2026, 1, 10), source="supplier", total_jpy=1000, total_twd_card_bill=250,
+        total_twd_foreign_fee=0, total_shipping_twd=0,
+        items=[schemas.PurchaseItemCreate(product_id=pid, qty=1, unit_price_jpy=500, item_weight_g=0) for pid in (alpha, "no-such-product")],
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await purchases.create_purchase_batch(batch, db=db)
+
+    assert error.value.status_code == 404 and "no-such-product" in error.value.detail
+    assert (await db.execute(select(func.count()).select_from(PurchaseBatch))).scalar() == 0
+    kinds = (await db.execute(select(InventoryMovement.kind))).scalars().all()
+    assert kinds == ["opening"]
+
@@ -0,0 +1,49 @@
+import datetime
+
+import pytest
+from sqlalchemy import select
+
+import crud
+import schemas
+from models import Product, SalesItem, SalesOrder
+
+pytestmark = pytest.mark.anyio
+
+DAY = datetime.date(2026, 1, 5)
+
+
+def order(order_no: str, *items):
+    return schemas.OrderCreate(platform_order_id=order_no, order_date=DAY, items=[
+        schemas.OrderItemCreate(product_name=name, quantity=qty, unit_price=price, total_price=qty * price)
+        for name, qty, price in items
+    ])
+
+
+@pytest.mark.parametrize("commit_every", [None, 1])
+async def test_each_order_succeeds_or_fails_on_its_own(db, make_product, commit_every):
+    await make_product("Alpha", qty=10, cost=40.0)
+    await make_product("Beta", qty=10, cost=5.0)
+    await crud.create_sales_order(db, order("OLD", ("Alpha", 1, 100)))
+
+    results = await crud.create_sales_orders(db, [
+        order("N1", ("Alpha", 2, 100), ("Beta", 1, 30)),
+        order("OLD", ("Alpha", 1, 100)),
+        order("N2", ("Gamma", 1, 10)),
+        order("N3", ("Beta", 3, 30)),
+        order("N3", ("Beta", 1, 30)),
+    ], commit_every=commit_every)
+
+    assert [(r["platform_order_id"], r["status"]) for r in results] == [
+        ("N1", "created"), ("OLD", "failed"), ("N2", "failed"), ("N3", "created"), ("N3", "failed"),
+    ]
+    assert results[1]["error"] == "Order already exists: OLD"
+    assert results[2]["error"] == "Product not found: Gamma"
+    assert (await db.execute(select(SalesOrder.id).where(SalesOrder.order_no == "N1"))).scalar() == results[0]["order_id"]
+
+    quantities = dict((await db.execute(select(Product.name, Product.current_qty).execution_options(populate_existing=True))).all())
+    assert quantities == {"Alpha": 10 - 1 - 2, "Beta": 10 - 1 - 3}
+    costs = (await db.execute(
+        select(Product.name, SalesItem.historical_cost_basis).join(SalesItem.product).join(SalesItem.order)
+        .where(SalesOrder.order_no == "N1")
+    )).all()
+    assert sorted(costs) == [("Alpha", 40.0), ("Beta", 5.0)]
@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+from sqlalchemy import insert, update
+
+import crud
+import schemas
+from models import SalesOrder, generate_uuid
+
+pytestmark = pytest.mark.anyio
+
+FIRST_DAY = datetime.date(2026, 1, 1)
+
+
+@pytest.fixture
+async def orders(db):
+    # 30 orders over 10 days (three per day, so ties on the date are broken by id), plus 4 undated ones
+    rows = [
+        {"id": generate_uuid(), "order_no": f"O{i:03d}", "order_date": FIRST_DAY + datetime.timedelta(days=i % 10),
+         "platform_source": "Myship" if i % 2 else "Maihuobian", "customer_name": f"customer {i % 3}"}
+        for i in range(30)
+    ]
+    rows += [{"id": generate_uuid(), "order_no": f"U{i}", "order_date": None, "platform_source": "Maihuobian"} for i in range(4)]
+    await db.execute(insert(SalesOrder), rows)
+    # An explicit None in a bulk insert gets the column default (today), so blank the dates afterwards
+    await db.execute(update(SalesOrder).where(SalesOrder.order_no.like("U%")).values(order_date=None))
+    await db.commit()
+    return rows
+
+
+def newest_first(rows):
+    dated = sorted((row for row in rows if row["order_date"]), key=lambda row: (row["order_date"], row["id"]), reverse=True)
+    undated = sorted((row for row in rows if not row["order_date"]), key=lambda row: row["id"], reverse=True)
+    return [row["order_no"] for row in dated + undated]
+
+
+async def all_pages(db, limit: int, filters=None):
+    pages, cursor = [], None
+    while True:
+        page, cursor = await crud.get_sales_orders(db, limit=limit, filters=filters, cursor=cursor, with_items=False)
+        pages.append([order.order_no for order in page])
+        if cursor is None:
+            return pages
+
+
+async def test_cursor_walks_every_order_once_in_order(db, orders):
+    pages = await all_pages(db, limit=7)
+
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 6]
+    assert [order_no for page in pages for order_no in page] == newest_first(orders)
+
+
+async def test_cursor_with_filters(db, orders):
+    filters = schemas.SalesOrderFilter(date_from=FIRST_DAY + datetime.timedelta(days=2), date_to=FIRST_DAY + datetime.timedelta(days=5),
+                                       platform_source="Myship")
+    expected = newest_first([
+        row for row in orders
+        if row["order_date"] and filters.date_from <= row["order_date"] <= filters.date_to and row["platform_source"] == "Myship"
+    ])
+
+    pages = await all_pages(db, limit=2, filters=filters)
+
+    assert [order_no for page in pages for order_no in page] == expected
+    assert await crud.count_sales_orders(db, filters) == len(expected)
+
+
+async def test_offset_paging_matches_cursor_order(db, orders):
+    page, _ = await crud.get_sales_orders(db, skip=10, limit=5, with_items=False)
+
+    assert [order.order_no for order in page] == newest_first(orders)[10:15]
+
+
+async def test_invalid_cursor(db, orders):
+    with pytest.raises(ValueError):
+        await crud.get_sales_orders(db, cursor="not a cursor")
+
+
+async def test_order_totals_come_with_the_page(db, make_product):
+    await make_product("Alpha", qty=10, cost=40.0)
+    await make_product("Beta", qty=10, cost=5.0)
+    created = await crud.create_sales_order(db, schemas.OrderCreate(platform_order_id="T1", order_date=FIRST_DAY, items=[
+        schemas.OrderItemCreate(product_name="Alpha", quantity=2, unit_price=100, total_price=200),
+        schemas.OrderItemCreate(product_name="Beta", quantity=1, unit_price=30, total_price=30),
+    ]))
+    order_id = created.id
+
+    page, _ = await crud.get_sales_orders(db, with_items=False)
+    detail = await crud.get_sales_order(db, order_id)
+
+    # Revenue 2*100 + 30, cost 2*40 + 5
+    for order in (page[0], detail):
+        assert (order.item_count, order.revenue, order.cost, order.margin) == (2, 230, 85, 145)
+    assert len(detail.items) == 2
@@ -0,0 +1,131 @@
+import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+import cost_replay
+import crud
+import import_service
+import sales_rollup
+import schemas
+from models import InventoryMovement, SalesItem, SalesOrder
+
+pytestmark = pytest.mark.anyio
+
+DAY = datetime.date(2026, 1, 5)  # A Monday
+
+
+def order(order_no: str, day: datetime.date, *items):
+    return schemas.OrderCreate(platform_order_id=order_no, order_date=day, items=[
+        schemas.OrderItemCreate(product_name=name, quantity=qty, unit_price=price, total_price=qty * price)
+        for name, qty, price in items
+    ])
+
+
+def rounded(row) -> tuple:
+    # Increments and a rebuild sum the same values in a different order
+    return tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+
+
+async def rollup_rows(db):
+    totals = (await db.execute(
+        select(sales_rollup.totals).where(sales_rollup.totals.c.orders != 0).order_by(*sales_rollup.totals.primary_key.columns)
+    )).all()
+    by_product = (await db.execute(
+        select(sales_rollup.by_product).where(sales_rollup.by_product.c.units != 0).order_by(*sales_rollup.by_product.primary_key.columns)
+    )).all()
+    return [rounded(row) for row in totals], [rounded(row) for row in by_product]
+
+
+@pytest.fixture
+async def history(db, make_product, orders_csv):
+    """Sales through every write path: single order, batch, item edit, import and cost replay."""
+    alpha = await make_product("Alpha", qty=100, cost=40.0)
+    await make_product("Beta", qty=100, cost=5.0)
+    await crud.create_purchase_batch(db, schemas.PurchaseBatchCreate(
+        purchase_date=DAY - datetime.timedelta(days=4), source="supplier", total_jpy=1000, total_twd_card_bill=250,
+        total_twd_foreign_fee=0, total_shipping_twd=0,
+        items=[schemas.PurchaseItemCreate(product_id=alpha, qty=10, unit_price_jpy=100, item_weight_g=0)],
+    ))
+    created = await crud.create_sales_order(db, order("S1", DAY, ("Alpha", 2, 100), ("Beta", 1, 30)))
+    # Read before the next commit expires them
+    order_id = created.id
+    alpha_item_id = next(item.id for item in created.items if item.product_id == alpha)
+    await crud.create_sales_orders(db, [
+        order(f"B{i}", DAY + datetime.timedelta(days=i % 9), ("Alpha", 1, 120)) for i in range(12)
+    ])
+    await crud.update_sales_order_items(db, order_id, schemas.OrderUpdateItems(
+        items=[schemas.OrderItemUpdate(id=alpha_item_id, quantity=3, unit_price=90)],
+    ))
+    path = orders_csv([
+        ["M1", "2026-01-07", "", "Alpha", "2", "110"],
+        ["M2", "2026-01-20", "", "Alpha+Beta", "1", "200"],
+    ])
+    await import_service.parse_and_save_orders(db, path)
+    await cost_replay.replay_costs(db)
+    await db.commit()
+
+
+async def test_incremental_rollups_match_a_rebuild(db, history):
+    incremental = await rollup_rows(db)
+
+    await sales_rollup.rebuild(db)
+    await db.commit()
+
+    assert incremental == await rollup_rows(db)
+    assert len(incremental[0]) > 1 and len(incremental[1]) > 1
+
+
+async def test_report_totals_match_sales_items(db, history):
+    report = await sales_rollup.profit_report(db, DAY - datetime.timedelta(days=30), DAY + datetime.timedelta(days=30), "month")
+
+    item = SalesItem
+    orders, units, revenue, cogs = (await db.execute(select(
+        func.count(func.distinct(SalesOrder.id)), func.sum(item.qty), func.sum(item.qty * item.unit_price_sold),
+        func.sum(item.qty * func.coalesce(item.historical_cost_basis, 0)),
+    ).join(item, item.order_id == SalesOrder.id))).one()
+    totals = report["totals"]
+    assert (totals["orders"], totals["units"]) == (orders, units)
+    assert totals["revenue"] == pytest.approx(revenue)
+    assert totals["cogs"] == pytest.approx(cogs)
+    assert totals["margin"] == pytest.approx(revenue - cogs)
+    assert [row["key"] for row in report["rows"]] == ["2026-01-01"]
+
+
+async def test_report_groupings(db, history):
+    date_from, date_to = DAY, DAY + datetime.timedelta(days=30)
+
+    weeks = await sales_rollup.profit_report(db, date_from, date_to, "week")
+    assert [row["key"] for row in weeks["rows"]] == ["2026-01-05", "2026-01-12", "2026-01-19"]
+
+    platforms = await sales_rollup.profit_report(db, date_from, date_to, "platform")
+    assert sorted(row["key"] for row in platforms["rows"]) == ["Maihuobian", "Myship"]
+
+    products = await sales_rollup.profit_report(db, date_from, date_to, "product", limit=1)
+    assert [row["label"] for row in products["rows"]] == ["Alpha"]
+
+    one_platform = await sales_rollup.profit_report(db, date_from, date_to, "day", platform_source="Maihuobian")
+    assert one_platform["totals"]["orders"] == 2
+
+
+async def test_clearing_orders_clears_rollups(db, history):
+    await crud.delete_all_sales_orders(db)
+
+    assert await rollup_rows(db) == ([], [])
+
+
+async def test_undated_imported_orders_are_booked_on_the_stored_date(db, make_product, orders_csv):
+    await make_product("Alpha", qty=10)
+    await import_service.parse_and_save_orders(db, orders_csv([["U1", "", "", "Alpha", "2", "100"]]))
+
+    today = datetime.date.today()
+    assert (await db.execute(select(SalesOrder.order_date))).scalars().all() == [today]
+    assert (await db.execute(
+        select(InventoryMovement.movement_date).where(InventoryMovement.kind == "import")
+    )).scalars().all() == [today]
+
+    incremental = await rollup_rows(db)
+    await sales_rollup.rebuild(db)
+    await db.commit()
+    assert incremental == await rollup_rows(db)
+    assert [row[:3] for row in incremental[0]] == [(today, "Maihuobian", 1)]
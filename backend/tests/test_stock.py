@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, func, select
+
+import database
+import stock
+from models import InventoryMovement, Product
+
+pytestmark = pytest.mark.anyio
+
+
+async def read_product(product_id: str):
+    async with database.SessionLocal() as db:
+        return (await db.execute(select(Product.current_qty, Product.avg_cost_twd).where(Product.id == product_id))).one()
+
+
+async def test_concurrent_sales_do_not_lose_updates(make_product):
+    product_id = await make_product("Alpha", qty=100)
+
+    async def sell(qty: int):
+        async with database.SessionLocal() as db:
+            await stock.add_stock(db, [stock.movement(product_id, -qty, "sale")])
+            await db.commit()
+
+    # Each session updates the row it finds at write time; a read-modify-write would lose some of these
+    await asyncio.gather(*(sell(qty) for qty in [1, 2, 3] * 10))
+
+    assert (await read_product(product_id)).current_qty == 100 - 60
+    async with database.SessionLocal() as db:
+        movements = (await db.execute(select(InventoryMovement.qty_change).where(InventoryMovement.product_id == product_id))).scalars().all()
+    assert sorted(movements) == sorted([100] + [-1, -2, -3] * 10)
+
+
+async def test_add_stock_sums_movements_per_product(db, make_product):
+    alpha = await make_product("Alpha", qty=10)
+    beta = await make_product("Beta", qty=10)
+
+    await stock.add_stock(db, [
+        stock.movement(alpha, -2, "sale"), stock.movement(alpha, -3, "sale"), stock.movement(beta, 4, "order_edit"),
+    ])
+    await db.commit()
+
+    assert (await read_product(alpha)).current_qty == 5
+    assert (await read_product(beta)).current_qty == 14
+
+
+async def test_receive_stock_weighted_average(db, make_product):
+    product_id = await make_product("Alpha", qty=10, cost=100.0)
+
+    # Two lines of one product chain: (10*100 + 10*130) / 20 = 115, then (20*115 + 20*55) / 40 = 85
+    await stock.receive_stock(db, [(product_id, 10, 130.0, 0), (product_id, 20, 55.0, 25)])
+    await db.commit()
+
+    row = await read_product(product_id)
+    assert row.current_qty == 40
+    assert row.avg_cost_twd == pytest.approx(85.0)
+
+
+async def test_concurrent_receipts_keep_the_average_consistent(make_product):
+    product_id = await make_product("Alpha", qty=0)
+
+    async def receive(cost: float):
+        async with database.SessionLocal() as db:
+            await stock.receive_stock(db, [(product_id, 10, cost, 0)])
+            await db.commit()
+
+    await asyncio.gather(*(receive(cost) for cost in [10.0, 20.0, 30.0, 40.0]))
+
+    # Whatever the order, equal quantities average to the mean cost
+    row = await read_product(product_id)
+    assert row.current_qty == 40
+    assert row.avg_cost_twd == pytest.approx(25.0)
+
+
+async def test_concurrent_adjustments_and_receipts_add_up(make_product):
+    product_id = await make_product("Alpha", qty=10, cost=10.0)
+
+    async def adjust():
+        async with database.SessionLocal() as db:
+            await stock.adjust_stock(db, product_id, -1, reason="damaged")
+            await db.commit()
+
+    async def receive():
+        async with database.SessionLocal() as db:
+            await stock.receive_stock(db, [(product_id, 10, 20.0, 0)])
+            await db.commit()
+
+    await asyncio.gather(*[adjust() for _ in range(10)], *[receive() for _ in range(5)])
+
+    # 10 - 10 * 1 + 5 * 10, and the ledger explains it
+    assert (await read_product(product_id)).current_qty == 50
+    async with database.SessionLocal() as db:
+        total = (await db.execute(select(func.sum(InventoryMovement.qty_change)).where(InventoryMovement.product_id == product_id))).scalar()
+    assert total == 50
+
+
+async def test_adjust_stock(db, make_product):
+    product_id = await make_product("Alpha", qty=3)
+
+    assert await stock.adjust_stock(db, product_id, -1, reason="broken") == 2
+    assert await stock.adjust_stock(db, "no-such-product", 5) is None
+    await db.commit()
+
+    assert (await read_product(product_id)).current_qty == 2
+
+
+async def test_summary_is_updated_once_per_commit(db, make_product):
+    alpha = await make_product("Alpha", qty=10, cost=2.0)
+    beta = await make_product("Beta", qty=10, cost=3.0)
+    await stock.reconcile_summary(db)
+    await db.commit()
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE inventory_summary"):
+            statements.append((statement, executemany))
+    event.listen(database.engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        await stock.add_stock(db, [stock.movement(alpha, -2, "sale"), stock.movement(beta, -1, "sale")])
+        await stock.adjust_stock(db, alpha, 5)
+        await stock.receive_stock(db, [(beta, 10, 5.0, 0)])
+        assert statements == []
+        await db.commit()
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", capture)
+
+    assert len(statements) == 1 and not statements[0][1]
+    summary = await stock.get_summary(db)
+    # Alpha: 13 at 2.0; Beta: 9 at 3.0 plus the 10 received at 5.0
+    assert summary["total_value_twd"] == pytest.approx(13 * 2.0 + 9 * 3.0 + 10 * 5.0)
+    assert (await stock.reconcile_summary(db))["total_value_drift"] == pytest.approx(0.0)
+
+
+async def test_rolled_back_changes_leave_the_summary_alone(db, make_product):
+    product_id = await make_product("Alpha", qty=10, cost=2.0)
+    await stock.reconcile_summary(db)
+    await db.commit()
+
+    await stock.adjust_stock(db, product_id, 5)
+    await db.rollback()
+    await db.commit()
+
+    assert (await stock.get_summary(db))["total_value_twd"] == pytest.approx(20.0)
@@ -0,0 +1,54 @@
+import csv
+
+import pytest
+from sqlalchemy import select
+
+import stocktake
+from models import InventoryMovement, Product
+
+pytestmark = pytest.mark.anyio
+
+
+async def quantities(db):
+    result = await db.execute(select(Product.name, Product.current_qty).execution_options(populate_existing=True))
+    return dict(result.all())
+
+
+async def test_counts_replace_stock_and_report_discrepancies(db, make_product, tmp_path):
+    alpha = await make_product("Alpha", qty=10, sku="A-1")
+    await make_product("Beta", qty=4, sku="B-1")
+    await make_product("Gamma", qty=7, sku="C-1")
+    path = tmp_path / "stocktake.csv"
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f)
+        writer.writerow(["盤點日", "2026-03-31"])
+        writer.writerow(["商品編號", "商品ID", "盤點數量"])
+        # Beta counted in two locations; Gamma matches; one unknown SKU; one row not counted
+        writer.writerows([["", alpha, "8"], ["B-1", "", "3"], ["B-1", "", "1,000"], ["C-1", "", "7"], ["X-9", "", "1"], ["C-1", "", ""]])
+
+    lines = stocktake.read_stocktake_lines(str(path))
+    preview = await stocktake.apply_stocktake(db, lines, dry_run=True)
+    assert await quantities(db) == {"Alpha": 10, "Beta": 4, "Gamma": 7}
+
+    report = await stocktake.apply_stocktake(db, lines, reason="year end")
+    await db.commit()
+
+    assert {**report, "dry_run": True} == preview
+    assert (report["counted_products"], report["adjusted_products"], report["unchanged_products"]) == (3, 2, 1)
+    assert report["unmatched"] == ["X-9"]
+    assert [(d["name"], d["expected_qty"], d["counted_qty"], d["delta"]) for d in report["discrepancies"]] == [
+        ("Beta", 4, 1003, 999), ("Alpha", 10, 8, -2),
+    ]
+    assert await quantities(db) == {"Alpha": 8, "Beta": 1003, "Gamma": 7}
+    movements = (await db.execute(
+        select(InventoryMovement.qty_change, InventoryMovement.reason).where(InventoryMovement.kind == "stocktake")
+    )).all()
+    assert sorted(movements) == [(-2, "year end"), (999, "year end")]
+
+
+def test_unreadable_count_names_its_row(tmp_path):
+    path = tmp_path / "stocktake.csv"
+    path.write_text("商品編號,盤點數量\nA-1,3\nB-1,three\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="Row 2: invalid number in '盤點數量': three"):
+        stocktake.read_stocktake_lines(str(path))
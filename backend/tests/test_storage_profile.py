@@ -0,0 +1,46 @@
+import os
+
+import pytest
+from sqlalchemy import text
+
+import database
+import db_metrics
+from conftest import TEST_DIR
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_sqlite_connections_get_the_profile_pragmas():
+    async with database.engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+        assert (await conn.execute(text("PRAGMA cache_size"))).scalar() == -database.SQLITE_CACHE_SIZE_MB * 1024
+
+
+async def test_pool_stats_count_checkouts():
+    async with database.engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+        busy = db_metrics.pool_stats(database.engine)
+    idle = db_metrics.pool_stats(database.engine)
+
+    assert busy["pool"] == "TimedQueuePool"
+    assert busy["checked_out"] == 1 and idle["checked_out"] == 0
+    assert idle["checkouts"] >= 1 and idle["peak_checked_out"] >= 1
+    assert idle["timeouts"] == 0
+
+
+async def test_reads_use_the_primary_unless_a_replica_is_configured():
+    replica = database.make_engine(f"sqlite+aiosqlite:///{os.path.join(TEST_DIR, 'replica.db')}")
+    try:
+        async with replica.connect() as conn:
+            tables = (await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))).scalars().all()
+        assert tables == []
+        assert database.read_engine is database.engine and list(database.engines) == ["primary"]
+    finally:
+        await replica.dispose()
+
+
+def test_unknown_profile_is_rejected(monkeypatch):
+    monkeypatch.setattr(database, "DB_PROFILE", "oracle")
+    with pytest.raises(ValueError, match="Unknown DB_PROFILE: oracle"):
+        database.make_engine("sqlite+aiosqlite:///:memory:")
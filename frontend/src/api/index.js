@@ -12,6 +12,19 @@ export default {
     getProducts() {
         return apiClient.get('/products/');
     },
+    getLowStockProducts(params = {}) {
+        return apiClient.get('/products/low-stock', { params });
+    },
+    setReorderThreshold(id, reorderThreshold) {
+        return apiClient.put(`/products/${id}/reorder-threshold`, { reorder_threshold: reorderThreshold });
+    },
+    // Server-sent events when a product's stock crosses its reorder threshold.
+    // Returns the EventSource; call .close() when done.
+    subscribeLowStock(onEvent) {
+        const source = new EventSource(`${apiClient.defaults.baseURL}/products/low-stock/events`);
+        source.addEventListener('low_stock', (e) => onEvent(JSON.parse(e.data)));
+        return source;
+    },
     getProduct(id) {
         return apiClient.get(`/products/${id}`);
     },
@@ -26,14 +39,33 @@ export default {
     createPurchase(data) {
         return apiClient.post('/purchases/', data);
     },
+    uploadPurchase(formData) {
+        return apiClient.post('/purchases/upload', formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+        });
+    },
 
     // Sales
-    getSalesOrders() {
-        return apiClient.get('/sales/');
+    getSalesOrders(params = {}) {
+        return apiClient.get('/sales/', { params });
+    },
+    getSalesOrderSummaries(params = {}) {
+        return apiClient.get('/sales/summary', { params });
+    },
+    getSalesOrder(id) {
+        return apiClient.get(`/sales/${id}`);
+    },
+    countSalesOrders(params = {}) {
+        return apiClient.get('/sales/count', { params });
     },
     createSalesOrder(data) {
         return apiClient.post('/sales/', data);
     },
+    createSalesOrders(orders) {
+        return apiClient.post('/sales/batch', { orders });
+    },
     uploadSalesOrder(formData) {
         return apiClient.post('/sales/upload', formData, {
             headers: {
@@ -41,6 +73,17 @@ export default {
             },
         });
     },
+    previewSalesOrder(formData) {
+        return apiClient.post('/sales/upload', formData, {
+            params: { preview: true },
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+        });
+    },
+    getImportJob(jobId) {
+        return apiClient.get(`/sales/imports/${jobId}`);
+    },
     deleteAllSalesOrders() {
         return apiClient.delete('/sales/all');
     },
@@ -53,15 +96,22 @@ export default {
     getInventoryStats() {
         return apiClient.get('/inventory/stats');
     },
+    // Stocktake: { lines: [{ sku | product_id, counted_qty }], reason }, returns the discrepancy report
+    applyStocktake(data, dryRun = false) {
+        return apiClient.post('/inventory/stocktake', data, { params: { dry_run: dryRun } });
+    },
+    uploadStocktake(formData) {
+        return apiClient.post('/inventory/stocktake/upload', formData, {
+            headers: {
+                'Content-Type': 'multipart/form-data',
+            },
+        });
+    },
 
-    // Dashboard Stats (Mock/Computed for now)
-    getDashboardStats() {
-        // In a real app, this might be a dedicated endpoint
-        return Promise.all([
-            this.getSalesOrders(),
-            this.getProducts(),
-            this.getPurchases()
-        ]);
+    // Dashboard: totals, daily series, top products and low stock, aggregated on the server
+    // params: { date_from, date_to, top }
+    getDashboardStats(params = {}) {
+        return apiClient.get('/dashboard/summary', { params });
     },
 
     // System